@@ -1,17 +1,18 @@
 import os
+import json
 import time
 import uuid
-import subprocess
-from typing import Optional, Dict
+import asyncio
+from typing import Optional, Dict, List
 
 import boto3
+from boto3.dynamodb.conditions import Key, Attr
 from botocore.exceptions import ClientError
-from fastapi import FastAPI, HTTPException, Depends, Header, BackgroundTasks, UploadFile
+from fastapi import FastAPI, HTTPException, Depends, Header, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import jwt
-from jwt import PyJWKClient
 from fastapi import Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
@@ -19,6 +20,20 @@ import hmac
 import hashlib
 import base64
 
+import aws_clients
+import jwt_cache
+import cache_mem
+import job_cache
+import db_videos
+import job_events
+import ddb_schema
+import s3_multipart
+import hls_package
+from transcode_scheduler import admit, scheduler, source_estimate, source_duration, probe_upload_later
+# task entry points live outside app.py so spawned scheduler workers don't import the API
+from services_transcode import transcode_task, transcode_ladder_task, transcode_hls_task, enqueue_transcode
+from ffmpeg_utils import DEFAULT_PRESET, normalize_presets
+
 bearer_scheme = HTTPBearer()
 
 # ======== Config from environment ========
@@ -50,7 +65,13 @@ app.add_middleware(
 
 # ======== Cognito JWT validation ========
 JWKS_URL = f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}/.well-known/jwks.json"
-_jwk_client = PyJWKClient(JWKS_URL)
+
+def _require_jwt_verifier() -> jwt_cache.JWTVerifier:
+    return jwt_cache.verifier(
+        JWKS_URL,
+        f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}",
+        COGNITO_APP_CLIENT_ID,
+    )
 
 def require_jwt(credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)) -> Dict:
     if not credentials or not credentials.credentials:
@@ -59,15 +80,8 @@ def require_jwt(credentials: HTTPAuthorizationCredentials = Security(bearer_sche
     if token == "test-dev-token":
         return {"sub": "dev-user", "email": "dev@example.com"}
     try:
-        signing_key = _jwk_client.get_signing_key_from_jwt(token).key
-        payload = jwt.decode(
-            token,
-            signing_key,
-            algorithms=["RS256"],
-            audience=COGNITO_APP_CLIENT_ID,
-            issuer=f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}",
-        )
-        return payload
+        # cached claims until exp; RS256 verify only on first sight of a token
+        return _require_jwt_verifier().verify(token)
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
 
@@ -76,37 +90,33 @@ class CreateJobReq(BaseModel):
     filename: str
     content_type: Optional[str] = "video/mp4"
 
+class MultipartInitReq(BaseModel):
+    size: int                          # total bytes the browser will upload
+    part_size: Optional[int] = None    # bytes; raised as needed to fit S3 limits
+
+class MultipartCompleteReq(BaseModel):
+    parts: Optional[List[Dict]] = None  # [{"PartNumber": n, "ETag": "..."}]; default: ask S3
+
 class StartJobReq(BaseModel):
     s3_key: Optional[str] = None
     target_preset: Optional[str] = "480p"
+    target_presets: Optional[List[str]] = None   # ladder mode, e.g. ["360p","480p","720p"]
+    packaging: Optional[str] = None              # "hls": adaptive-streaming ladder instead of MP4 files
 
 # ======== DDB helpers ========
 def ddb_put_item_bkp(item: Dict):
-    ddb.put_item(Item=item)
+    aws_clients.table(DDB_TABLE).put_item(Item=item)
 
 def get_boto_session():
-    return boto3.Session(
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        aws_session_token=os.getenv("AWS_SESSION_TOKEN"),
-        region_name=os.getenv("AWS_REGION"),
-    )
+    return aws_clients.session()
 
 def ddb_put_item_bkp_1(item: dict):
-    session = get_boto_session()
-    ddb = session.resource("dynamodb")
-    table = ddb.Table(os.getenv("DDB_TABLE_NAME"))
+    table = aws_clients.table(os.getenv("DDB_TABLE_NAME"))
 
-    # Read required keys from the table's key schema
-    ks = table.key_schema  # list of dicts {"AttributeName": ..., "KeyType": ...}
-    required = [k["AttributeName"] for k in ks]  # exact names as table expects
-
-    # Build mapping of cleaned -> actual required name
+    # Required keys + cleaned -> actual map come from the cached schema
     # e.g. "qut-username" -> "qut-username " (if table has trailing space)
-    required_map = {}
-    for rk in required:
-        cleaned = rk.strip()   # remove leading/trailing whitespace
-        required_map[cleaned] = rk
+    schema = ddb_schema.get_schema(table.name)
+    required_map = schema.cleaned_keys
 
     # Attempt to ensure each required key exists in the item,
     # mapping from a cleaned key if present.
@@ -132,18 +142,8 @@ def ddb_put_item_bkp_1(item: dict):
             continue
         # no match found; leave missing for now
 
-    # Now validate required keys are present and non-null
-    missing = [k for k in required if k not in item or item[k] is None]
-    if missing:
-        # helpful diagnostic including item keys (repr to reveal hidden chars if any)
-        item_keys_repr = [repr(k) for k in item.keys()]
-        raise RuntimeError(
-            f"Missing required key(s) for table: {missing}. Item keys present: {item_keys_repr}"
-        )
-
-    # Ensure required keys are strings
-    for k in required:
-        item[k] = str(item[k])
+    # Now validate required keys are present and typed per the schema
+    schema.validate(item)
 
     # Finally attempt to put the item
     try:
@@ -155,40 +155,28 @@ def ddb_put_item_bkp_1(item: dict):
         raise RuntimeError(f"DynamoDB PutItem failed: {e.response}")
 
 def ddb_put_item(item: dict):
-    # Create a new boto3 session (your helper)
-    session = get_boto_session()
-    ddb = session.resource("dynamodb")
-    table = ddb.Table(os.getenv("DDB_TABLE_NAME"))
-
-    # --- Validate required keys from table schema ---
-    ks = table.key_schema  # list of dicts with AttributeName and KeyType
-    required = [k["AttributeName"] for k in ks]
-
-    # Find any missing or None key values
-    missing = [k for k in required if k not in item or item[k] is None]
-    if missing:
-        raise RuntimeError(
-            f"Missing required key(s) for table: {missing}. "
-            f"Item keys present: {list(item.keys())}"
-        )
+    # Shared Table handle from the client registry; key filled in from job_id
+    table = aws_clients.table(db_videos.table_name())
+    item = db_videos.with_key(item)
 
-    # Ensure all required key values are strings (DynamoDB expects strings for most keys)
-    for k in required:
-        item[k] = str(item[k])
+    # --- Validate against the cached schema (no DescribeTable per put) ---
+    ddb_schema.validate_item(table.name, item)
 
     # --- Attempt to write item to DynamoDB ---
     try:
         resp = table.put_item(Item=item)
         logger.info(f"DynamoDB PutItem success. RequestId={resp['ResponseMetadata'].get('RequestId')}")
+        job_cache.put(item["job_id"], item)
         return resp
     except ClientError as e:
         logger.exception("DynamoDB PutItem failed: %s", e)
+        aws_clients.refresh_if_expired(e)
+        if e.response.get("Error", {}).get("Code") == "ValidationException":
+            ddb_schema.refresh(table.name)   # table may have changed under us
         raise RuntimeError(f"DynamoDB PutItem failed: {e.response}")
 
 def ddb_put_item_nnnnm(item: dict):
-    session = get_boto_session()
-    ddb = session.resource("dynamodb")
-    table = ddb.Table(os.getenv("DDB_TABLE_NAME"))
+    table = aws_clients.table(os.getenv("DDB_TABLE_NAME"))
     try:
         return table.put_item(Item=item)
     except ClientError as e:
@@ -198,9 +186,7 @@ def ddb_put_item_nnnnm(item: dict):
         raise RuntimeError(f"DynamoDB PutItem failed: {e.response}")
     
 def ddb_put_item_nnnn(item: dict):
-    session = get_boto_session()
-    ddb = session.resource("dynamodb")
-    table = ddb.Table(os.getenv("DDB_TABLE_NAME"))
+    table = aws_clients.table(os.getenv("DDB_TABLE_NAME"))
     try:
         resp = table.put_item(Item=item)
         return resp
@@ -209,80 +195,65 @@ def ddb_put_item_nnnn(item: dict):
         raise RuntimeError(f"DynamoDB PutItem failed: {e.response}")
 
 def ddb_get_mmm(job_id: str) -> Dict:
-    res = ddb.get_item(Key={"qut-username": job_id})
+    res = aws_clients.table(DDB_TABLE).get_item(Key={"qut-username": job_id})
     if "Item" not in res:
         raise HTTPException(status_code=404, detail="Job not found")
     return res["Item"]
 
-def ddb_get(job_id: str) -> Dict:
+def _ddb_load(job_id: str) -> Optional[Dict]:
     try:
-        session = get_boto_session()
-        ddb = session.resource("dynamodb")
-        table = ddb.Table(os.getenv("DDB_TABLE_NAME"))
-        res = table.get_item(Key={"qut-username": job_id})
-        print(f"My job id is {job_id}")
-        if "Item" not in res:
-            raise HTTPException(status_code=404, detail="Job not found")
-        return res["Item"]
-    except HTTPException:
-        raise
+        return db_videos.load(job_id)
+    except ClientError as e:
+        aws_clients.refresh_if_expired(e)
+        raise HTTPException(status_code=500, detail=f"ddb_get failed: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"ddb_get failed: {str(e)}")
 
+def ddb_get(job_id: str) -> Dict:
+    item = job_cache.get(job_id, lambda: _ddb_load(job_id))
+    if item is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return item
+
 def ddb_update(job_id: str, **attrs):
-    if not attrs:
-        return
-    expr = "SET " + ", ".join(f"#{k}=:{k}" for k in attrs)
-    names = {f"#{k}": k for k in attrs}
-    values = {f":{k}": v for k, v in attrs.items()}
-    ddb.update_item(
-        Key={"job_id": job_id},
-        UpdateExpression=expr,
-        ExpressionAttributeNames=names,
-        ExpressionAttributeValues=values,
-    )
+    # same table and key as ddb_get; invalidates the cached record and
+    # pushes status transitions to open SSE streams
+    db_videos.update(job_id, **attrs)
 
 # ======== S3 helpers ========
 def presigned_put_1(key: str, content_type: str, expires: int = 900) -> str:
-    return s3.generate_presigned_url(
+    return aws_clients.s3().generate_presigned_url(
         "put_object",
         Params={"Bucket": S3_BUCKET, "Key": key, "ContentType": content_type},
         ExpiresIn=expires,
     )
 
 def get_boto_session():
-    return boto3.Session(
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        aws_session_token=os.getenv("AWS_SESSION_TOKEN"),
-        region_name=os.getenv("AWS_REGION"),
-    )
+    return aws_clients.session()
 
 def presigned_put(key: str, content_type: str, expires: int = 900) -> str:
-    session = get_boto_session()
-    s3 = session.client("s3")
-    return s3.generate_presigned_url(
+    return aws_clients.s3().generate_presigned_url(
         "put_object",
         Params={"Bucket": os.getenv("S3_BUCKET"), "Key": key, "ContentType": content_type},
         ExpiresIn=expires,
     )
 
 def presigned_get(key: str, expires: int = 900) -> str:
-    return s3.generate_presigned_url(
+    return aws_clients.s3().generate_presigned_url(
         "get_object",
         Params={"Bucket": S3_BUCKET, "Key": key},
         ExpiresIn=expires,
     )
 
-# ======== misc ========
-def _run(cmd: list) -> tuple[int, str]:
-    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    return p.returncode, p.stdout
+def _source_duration(job_id: str, item: Dict) -> Optional[float]:
+    """Source duration to admit with: stored at upload, else probed now (see transcode_scheduler)."""
+    return source_duration(job_id, item, presigned_get, ddb_update)
 
 # ======== Endpoints ========
 @app.get("/health")
 def health():
-    return {"ok": True, "bucket": S3_BUCKET, "table": DDB_TABLE}
+    return {"ok": True, "bucket": S3_BUCKET, "table": db_videos.table_name(), "transcode": scheduler.stats(),
+            "jwt_cache": jwt_cache.stats(), "job_cache": job_cache.stats(), "cache": cache_mem.stats(), "events": job_events.bus.stats()}
 
 @app.get("/")
 def serve_index():
@@ -303,6 +274,7 @@ def create_job(req: CreateJobReq, user=Depends(require_jwt)):
         "status": "created",
         "filename_in": req.filename,
         "upload_key": upload_key,
+        "content_type": req.content_type or "application/octet-stream",
         "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
     }
     ddb_put_item(item)
@@ -315,58 +287,133 @@ def get_job(job_id: str, user=Depends(require_jwt)):
         raise HTTPException(status_code=403, detail="Forbidden")
     return item
 
-def transcode_task(job_id: str, input_key: str, preset: str):
+# ======== Browser-direct multipart upload ========
+MULTIPART_SIGN_LIMIT = 1000  # part URLs handed out per call; ask again for the rest
+
+def _owned_job(job_id: str, user: Dict) -> Dict:
+    item = ddb_get(job_id)
+    if item.get("user_sub") != user.get("sub"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return item
+
+def _multipart_state(job_id: str, key: str, upload_id: str, part_count: int) -> Dict:
+    """Parts S3 already has, plus fresh URLs for (up to MULTIPART_SIGN_LIMIT of) the missing ones."""
+    s3 = aws_clients.s3()
+    done = s3_multipart.list_parts(s3, S3_BUCKET, key, upload_id)
+    have = {p["PartNumber"] for p in done}
+    missing = [n for n in range(1, part_count + 1) if n not in have]
+    return {
+        "job_id": job_id,
+        "upload_id": upload_id,
+        "part_count": part_count,
+        "uploaded": [{"part_number": p["PartNumber"], "etag": p["ETag"], "size": p["Size"]} for p in done],
+        "parts": s3_multipart.presign_parts(s3, S3_BUCKET, key, upload_id, missing[:MULTIPART_SIGN_LIMIT]),
+        "remaining": len(missing),
+    }
+
+@app.post("/jobs/{job_id}/multipart")
+def multipart_initiate(job_id: str, req: MultipartInitReq, user=Depends(require_jwt)):
+    """Start a multipart upload for the job's upload_key; the browser PUTs parts straight to S3."""
+    item = _owned_job(job_id, user)
     try:
-        ddb_update(job_id, status="processing", started_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
-        base = f"/tmp/{job_id}"
-        os.makedirs(base, exist_ok=True)
-        in_path = f"{base}/input"
-        out_path = f"{base}/output.mp4"
-
-        s3.download_file(S3_BUCKET, input_key, in_path)
-
-        vf = "scale=-2:480"
-        if preset == "720p":
-            vf = "scale=-2:720"
-        elif preset == "360p":
-            vf = "scale=-2:360"
-
-        rc, logs = _run([
-            "ffmpeg", "-y", "-i", in_path, "-vf", vf,
-            "-c:v", "libx264", "-preset", "veryfast", "-crf", "26",
-            "-c:a", "aac", out_path
-        ])
-        if rc != 0 or not os.path.exists(out_path):
-            ddb_update(job_id, status="error", error_message=f"ffmpeg failed rc={rc}", logs=logs[-1000:])
-            return
-
-        output_key = f"outputs/{job_id}/output.mp4"
-        s3.upload_file(out_path, S3_BUCKET, output_key)
-        ddb_update(job_id, status="done", output_key=output_key, updated_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
-    except ClientError as e:
-        ddb_update(job_id, status="error", error_message=str(e))
+        part_size, part_count = s3_multipart.plan_parts(req.size, req.part_size or s3_multipart.PART_SIZE)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    s3 = aws_clients.s3()
+    upload_id = s3.create_multipart_upload(
+        Bucket=S3_BUCKET, Key=item["upload_key"],
+        ContentType=item.get("content_type") or "application/octet-stream",
+    )["UploadId"]
+    try:
+        ddb_update(job_id, status="uploading", multipart_upload_id=upload_id,
+                   part_size=part_size, part_count=part_count)
     except Exception as e:
-        ddb_update(job_id, status="error", error_message=f"unexpected: {e}")
+        # without the record the upload can't be resumed or completed: don't leave it billing parts
+        logger.exception("could not record multipart upload for %s", job_id)
+        try:
+            s3.abort_multipart_upload(Bucket=S3_BUCKET, Key=item["upload_key"], UploadId=upload_id)
+        except ClientError as abort_err:
+            logger.warning("abort_multipart_upload failed for %s: %s", job_id, abort_err)
+        raise HTTPException(status_code=500, detail=f"Could not start upload: {e}")
+    return {**_multipart_state(job_id, item["upload_key"], upload_id, part_count), "part_size": part_size}
+
+@app.get("/jobs/{job_id}/multipart")
+def multipart_parts(job_id: str, user=Depends(require_jwt)):
+    """Resume: which parts S3 already has, and new URLs for the rest."""
+    item = _owned_job(job_id, user)
+    if not item.get("multipart_upload_id"):
+        raise HTTPException(status_code=404, detail="No multipart upload in progress")
+    state = _multipart_state(job_id, item["upload_key"], item["multipart_upload_id"], int(item["part_count"]))
+    return {**state, "part_size": int(item["part_size"])}
+
+@app.post("/jobs/{job_id}/multipart/complete")
+def multipart_complete(job_id: str, req: MultipartCompleteReq, user=Depends(require_jwt)):
+    item = _owned_job(job_id, user)
+    upload_id = item.get("multipart_upload_id")
+    if not upload_id:
+        raise HTTPException(status_code=404, detail="No multipart upload in progress")
+    try:
+        s3_multipart.complete(aws_clients.s3(), S3_BUCKET, item["upload_key"], upload_id, req.parts)
+    except ClientError as e:
+        raise HTTPException(status_code=400, detail=f"Complete failed: {e.response['Error'].get('Message', e)}")
+    ddb_update(job_id, status="uploaded", multipart_upload_id="",
+               uploaded_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+    probe_upload_later(job_id, presigned_get(item["upload_key"]), ddb_update)
+    return {"job_id": job_id, "status": "uploaded", "s3_key": item["upload_key"]}
+
+@app.delete("/jobs/{job_id}/multipart")
+def multipart_abort(job_id: str, user=Depends(require_jwt)):
+    item = _owned_job(job_id, user)
+    upload_id = item.get("multipart_upload_id")
+    if not upload_id:
+        raise HTTPException(status_code=404, detail="No multipart upload in progress")
+    try:
+        aws_clients.s3().abort_multipart_upload(Bucket=S3_BUCKET, Key=item["upload_key"], UploadId=upload_id)
+    except ClientError as e:
+        logger.warning("abort_multipart_upload failed for %s: %s", job_id, e)
+    ddb_update(job_id, status="created", multipart_upload_id="")
+    return {"job_id": job_id, "status": "created"}
+
+def output_key_for(item: Dict, preset: Optional[str]) -> str:
+    """Pick the requested ladder rendition, or the job's default output."""
+    if not item.get("output_key") and item.get("hls_key"):
+        raise HTTPException(status_code=409, detail="HLS job; play it via /api/v1/hls/{job_id}/master.m3u8")
+    if not preset:
+        return item["output_key"]
+    key = (item.get("output_keys") or {}).get(preset)
+    if not key:
+        raise HTTPException(status_code=404, detail=f"No {preset} rendition for this job")
+    return key
 
 @app.post("/jobs/{job_id}/start")
-def start_job(job_id: str, req: StartJobReq, bg: BackgroundTasks, user=Depends(require_jwt)):
+def start_job(job_id: str, req: StartJobReq, user=Depends(require_jwt)):
     item = ddb_get(job_id)
     if item.get("user_sub") != user.get("sub"):
         raise HTTPException(status_code=403, detail="Forbidden")
     input_key = req.s3_key or item.get("upload_key")
     if not input_key:
         raise HTTPException(status_code=400, detail="Missing s3_key; create job first")
-    bg.add_task(transcode_task, job_id, input_key, req.target_preset or "480p")
+    job_events.track(job_id, user.get("sub"))
+    duration = _source_duration(job_id, item) if input_key == item.get("upload_key") else None
+    if req.target_presets:
+        presets = normalize_presets(req.target_presets)
+        if not presets:
+            raise HTTPException(status_code=400, detail="No valid presets in target_presets")
+        admit(transcode_hls_task if req.packaging == "hls" else transcode_ladder_task, job_id, input_key, presets,
+              user=user.get("sub", ""), **source_estimate(duration, presets))
+        job_events.emit(job_id, {"status": "queued"})
+        return {"ok": True, "message": "Processing started", "presets": presets, "packaging": req.packaging or "mp4"}
+    enqueue_transcode(job_id, input_key, req.target_preset or DEFAULT_PRESET, user.get("sub", ""), duration)
     return {"ok": True, "message": "Processing started"}
 
 @app.get("/jobs/{job_id}/download-url")
-def get_download(job_id: str, user=Depends(require_jwt)):
+def get_download(job_id: str, preset: Optional[str] = None, user=Depends(require_jwt)):
     item = ddb_get(job_id)
     if item.get("user_sub") != user.get("sub"):
         raise HTTPException(status_code=403, detail="Forbidden")
     if item.get("status") != "done":
         raise HTTPException(status_code=400, detail=f"Job not done (status={item.get('status')})")
-    return {"url": presigned_get(item["output_key"])}
+    return {"url": presigned_get(output_key_for(item, preset))}
 
 # ======== Compatibility Layer for index.html ========
 
@@ -480,6 +527,8 @@ from fastapi import FastAPI, UploadFile, File, Depends, Query, HTTPException, He
 import uuid, time, traceback, logging, requests
 logger = logging.getLogger("uvicorn.error")
 from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from multipart.multipart import MultipartParser, parse_options_header
 from typing import Optional
 from dotenv import load_dotenv
 load_dotenv()
@@ -488,95 +537,247 @@ load_dotenv()
 S3_BUCKET = os.getenv("S3_BUCKET")
 DDB_TABLE_NAME = os.getenv("DDB_TABLE_NAME")
 
-s3 = boto3.client("s3", region_name=os.getenv("AWS_REGION"))
-ddb = boto3.resource("dynamodb", region_name=AWS_REGION).Table(DDB_TABLE)
-
-
-@app.get("/api/v1/users")
-def list_users(limit: int = Query(25, ge=1, le=100), start_key: Optional[str] = None):
-    session = get_boto_session()
-    ddb = session.resource("dynamodb")
-    table = ddb.Table(os.getenv("DDB_TABLE_NAME"))
-
-    scan_kwargs = {"Limit": limit}
-
-    if start_key:
-        import json, base64
+@app.on_event("startup")
+def warm_aws_clients():
+    # build the shared session/clients/tables once instead of per request
+    aws_clients.warm([DDB_TABLE, DDB_TABLE_NAME])
+    if DDB_TABLE_NAME:
         try:
-            lek_json = base64.b64decode(start_key.encode()).decode()
-            scan_kwargs["ExclusiveStartKey"] = json.loads(lek_json)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid start_key: {e}")
-
+            ddb_schema.get_schema(DDB_TABLE_NAME)
+        except ClientError as e:
+            logger.warning("could not preload schema for %s: %s", DDB_TABLE_NAME, e)
+        else:
+            if JOBS_BY_USER_INDEX not in ddb_schema.get_schema(DDB_TABLE_NAME).gsis:
+                logger.warning("table %s has no GSI %s; job listing will fail until it is created",
+                               DDB_TABLE_NAME, JOBS_BY_USER_INDEX)
+
+
+# ======== job listing ========
+# Jobs are listed from a GSI on (user_sub, created_at), newest first: each
+# page is one Query against the caller's partition, so its cost doesn't
+# grow with the table. Cursors are the LastEvaluatedKey of the page: the
+# table's key plus, for index pages, the index key, named as the table
+# declares them (ddb_schema). Admins can still page through every user's
+# jobs with ?all=true; that is a Scan, and costs what a Scan costs.
+JOBS_BY_USER_INDEX = os.getenv("DDB_JOBS_BY_USER_INDEX", "user_sub-created_at-index")
+JOBS_MAX_READ_PAGES = int(os.getenv("JOBS_MAX_READ_PAGES", "5"))  # read pages per request when a status filter drops items
+
+def _cursor_keys(index: Optional[str]) -> List[str]:
+    """Attributes of a LastEvaluatedKey: the table key, plus the index key when reading an index."""
+    schema = ddb_schema.get_schema(db_videos.table_name())
+    names = list(schema.key_names)
+    if index:
+        names += [k for k in schema.gsis.get(index, ["user_sub", "created_at"]) if k not in names]
+    return names
+
+def _encode_cursor(key: Dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode()
+
+def _decode_cursor(cursor: str, names: List[str]) -> Dict:
     try:
-        resp = table.scan(**scan_kwargs)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(key, dict) or set(key) != set(names):
+            raise ValueError("unexpected key")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+def _read_jobs(read, kwargs: Dict, limit: int, names: List[str], start: Optional[Dict], pages: int) -> Dict:
+    """
+    Fill one page from up to `pages` Query/Scan calls: {"items", "next_cursor"}.
+    A short page with a next_cursor just means a filter dropped items; keep paging.
+    """
+    items: List[Dict] = []
+    try:
+        for _ in range(pages):
+            if start:
+                kwargs["ExclusiveStartKey"] = start
+            res = read(**kwargs)
+            batch = res.get("Items", [])
+            start = res.get("LastEvaluatedKey")
+            if len(items) + len(batch) > limit:
+                # page filled part way through this batch: resume after the last item kept
+                batch = batch[:limit - len(items)]
+                start = {k: batch[-1][k] for k in names}
+            items.extend(batch)
+            if len(items) >= limit or not start:
+                break
+    except ClientError as e:
+        aws_clients.refresh_if_expired(e)
+        raise HTTPException(status_code=500, detail=f"job listing failed: {e}")
+    return {"items": items, "next_cursor": _encode_cursor(start) if start else None}
+
+def ddb_query_user_jobs(user_sub: str, limit: int, cursor: Optional[str] = None,
+                        status: Optional[str] = None) -> Dict:
+    """
+    One page of user_sub's jobs, newest first: {"items", "next_cursor"}.
+    With a status filter, up to JOBS_MAX_READ_PAGES index pages are read to
+    fill the page; a short page with a next_cursor just means keep paging.
+    """
+    kwargs = {
+        "IndexName": JOBS_BY_USER_INDEX,
+        "KeyConditionExpression": Key("user_sub").eq(user_sub),
+        "ScanIndexForward": False,
+        "Limit": limit,
+    }
+    if status:
+        kwargs["FilterExpression"] = Attr("status").eq(status)
+    names = _cursor_keys(JOBS_BY_USER_INDEX)
+    start = _decode_cursor(cursor, names) if cursor else None
+    if start and start.get("user_sub") != user_sub:
+        raise HTTPException(status_code=400, detail="Cursor belongs to another listing")
+    table = aws_clients.table(db_videos.table_name())
+    return _read_jobs(table.query, kwargs, limit, names, start, JOBS_MAX_READ_PAGES if status else 1)
+
+def ddb_scan_jobs(limit: int, cursor: Optional[str] = None, status: Optional[str] = None) -> Dict:
+    """One page of every user's jobs, in table order (admin view); same paging as ddb_query_user_jobs."""
+    kwargs = {"Limit": limit}
+    if status:
+        kwargs["FilterExpression"] = Attr("status").eq(status)
+    names = _cursor_keys(None)
+    start = _decode_cursor(cursor, names) if cursor else None
+    table = aws_clients.table(db_videos.table_name())
+    return _read_jobs(table.scan, kwargs, limit, names, start, JOBS_MAX_READ_PAGES if status else 1)
+
+def _is_admin(user: Dict) -> bool:
+    return user.get("custom:role") == "admin"
+
+def _list_jobs(user: Dict, limit: int, cursor: Optional[str], status: Optional[str],
+               owner: Optional[str], all_users: bool) -> Dict:
+    """The caller's own jobs; admins may name another user's sub, or list everyone's."""
+    if all_users or (owner and owner != user.get("sub")):
+        if not _is_admin(user):
+            raise HTTPException(status_code=403, detail="Forbidden")
+        if all_users:
+            return ddb_scan_jobs(limit, cursor, status)
+        return ddb_query_user_jobs(owner, limit, cursor, status)
+    return ddb_query_user_jobs(user.get("sub", ""), limit, cursor, status)
 
-    items = resp.get("Items", [])
-    last_evaluated_key = resp.get("LastEvaluatedKey")
-    next_key = None
-    if last_evaluated_key:
-        import json, base64
-        next_key = base64.b64encode(json.dumps(last_evaluated_key).encode()).decode()
+@app.get("/api/v1/jobs")
+def api_list_jobs(limit: int = Query(25, ge=1, le=100), cursor: Optional[str] = None,
+                  status: Optional[str] = None, owner: Optional[str] = None,
+                  all_users: bool = Query(False, alias="all"), user=Depends(require_jwt)):
+    return _list_jobs(user, limit, cursor, status, owner, all_users)
 
-    return {"items": items, "next_key": next_key}
+@app.get("/api/v1/users")
+def list_users(limit: int = Query(25, ge=1, le=100), start_key: Optional[str] = None,
+               status: Optional[str] = None, owner: Optional[str] = None,
+               all_users: bool = Query(False, alias="all"), user=Depends(require_jwt)):
+    # the old paginated table view; same listing, its original field names
+    page = _list_jobs(user, limit, start_key, status, owner, all_users)
+    return {"items": page["items"], "next_key": page["next_cursor"]}
+
+async def stream_upload_to_s3(request: Request, job_id: str) -> Dict:
+    """
+    Pipe the request body straight into an S3 multipart upload, one part at a
+    time, instead of letting Starlette spool it to disk and re-sending it.
+    Accepts multipart/form-data (the "file" field, parsed incrementally) or a
+    raw body named by ?filename= / X-Filename.
+    """
+    ctype, params = parse_options_header(request.headers.get("content-type", ""))
+    meta = {"filename": None, "content_type": None, "in_file": False}
+    pending = bytearray()
+
+    if ctype == b"multipart/form-data":
+        if not params.get(b"boundary"):
+            raise HTTPException(status_code=400, detail="multipart body without boundary")
+        headers, field, value = {}, bytearray(), bytearray()
+
+        def on_part_begin():
+            headers.clear()
+
+        def on_header_field(data, start, end):
+            field.extend(data[start:end])
+
+        def on_header_value(data, start, end):
+            value.extend(data[start:end])
+
+        def on_header_end():
+            headers[bytes(field).lower()] = bytes(value)
+            field.clear()
+            value.clear()
+
+        def on_headers_finished():
+            _, disp = parse_options_header(headers.get(b"content-disposition", b""))
+            if disp.get(b"name") == b"file" and meta["filename"] is None:
+                meta["filename"] = disp.get(b"filename", b"upload").decode(errors="replace")
+                meta["content_type"] = headers.get(b"content-type", b"application/octet-stream").decode()
+                meta["in_file"] = True
+
+        def on_part_data(data, start, end):
+            if meta["in_file"]:
+                pending.extend(data[start:end])
+
+        def on_part_end():
+            meta["in_file"] = False
+
+        parser = MultipartParser(params[b"boundary"], callbacks={
+            "on_part_begin": on_part_begin, "on_header_field": on_header_field,
+            "on_header_value": on_header_value, "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished, "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        })
+        feed = parser.write
+    else:
+        meta["filename"] = request.query_params.get("filename") or request.headers.get("x-filename") or "upload"
+        meta["content_type"] = ctype.decode() or "application/octet-stream"
+        feed = pending.extend
+
+    writer = None
+    try:
+        async for chunk in request.stream():
+            feed(chunk)
+            if writer is None and meta["filename"] is not None:
+                key = f"uploads/{job_id}/{os.path.basename(meta['filename']) or 'upload'}"
+                writer = await run_in_threadpool(s3_multipart.MultipartWriter, aws_clients.s3(), S3_BUCKET,
+                                                 key, meta["content_type"])
+            if writer is not None and len(pending) >= s3_multipart.PART_SIZE:
+                # blocks in the threadpool (not the event loop) when all part slots are busy
+                await run_in_threadpool(writer.write, bytes(pending))
+                pending.clear()
+        if writer is None:
+            raise HTTPException(status_code=400, detail="No file in upload")
+        await run_in_threadpool(writer.write, bytes(pending))
+        await run_in_threadpool(writer.close)
+    except BaseException:
+        if writer is not None:
+            await run_in_threadpool(writer.abort)
+        raise
+    return {"filename": meta["filename"], "content_type": meta["content_type"],
+            "upload_key": writer.key, "size": writer.bytes_written}
 
 @app.post("/api/v1/upload")
-def api_upload(file: UploadFile = File(...), authorization: str = Header(None)):
+async def api_upload(request: Request, authorization: str = Header(None)):
     try:
         user_sub = None
         if authorization:
-            try:
-                scheme, _, token = authorization.partition(" ")
-                # replace with your validation if needed
-                user_sub = validate_jwt(token).get("sub") if token else None
-            except Exception as e:
-                logger.warning("JWT parsing failed: %s", e)
+            user_sub = await run_in_threadpool(parse_auth_sub, authorization) or None
 
         job_id = str(uuid.uuid4())
-        upload_key = f"uploads/{job_id}/{file.filename}"
-        content_type = file.content_type or "application/octet-stream"
-
-        logger.info("Creating presigned URL for key=%s content_type=%s", upload_key, content_type)
-        put_url = presigned_put(upload_key, content_type)
-        if not put_url:
-            raise RuntimeError("presigned_put returned empty/None")
+        logger.info("Streaming upload job_id=%s into S3 multipart", job_id)
+        up = await stream_upload_to_s3(request, job_id)
 
         item = {
             "qut-username": job_id,
             "job_id": job_id,
             "user_sub": user_sub or "",
             "status": "created",
-            "filename_in": file.filename,
-            "upload_key": upload_key,
+            "filename_in": up["filename"],
+            "upload_key": up["upload_key"],
             "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
         }
 
         # wrap DB write to catch errors
-        #try:
-            #ddb_put_item(item)
-        #except Exception as e:
-            #logger.exception("ddb_put_item failed")
-            #raise
-
-        # ensure file stream at start
         try:
-            file.file.seek(0)
-        except Exception:
-            pass
-
-        logger.info("Uploading to S3 via presigned URL...")
-        resp = requests.put(put_url, data=file.file, headers={"Content-Type": content_type}, timeout=120)
-
-        if resp.status_code not in (200, 201):
-            # include response text from S3 for diagnosis
-            msg = f"S3 upload failed status={resp.status_code} body={resp.text}"
-            logger.error(msg)
-            raise HTTPException(status_code=500, detail=msg)
+            ddb_put_item(item)
+        except Exception as e:
+            logger.exception("ddb_put_item failed")
+            raise
 
-        logger.info("Upload OK, job_id=%s", job_id)
-        return {"video_id": job_id, "s3_key": upload_key}
+        # duration/height for admission, probed once now rather than per transcode request
+        probe_upload_later(job_id, presigned_get(up["upload_key"]), ddb_update)
+        logger.info("Upload OK, job_id=%s bytes=%d", job_id, up["size"])
+        return {"video_id": job_id, "s3_key": up["upload_key"]}
 
     except HTTPException:
         # re-raise HTTPExceptions as-is
@@ -614,6 +815,7 @@ def api_upload(file: UploadFile = File(...)):
     if resp.status_code not in (200, 201):
         raise HTTPException(status_code=500, detail=f"Upload to S3 failed: {resp.status_code} {resp.text}")
 
+    probe_upload_later(job_id, presigned_get(upload_key), ddb_update)
     return {"video_id": job_id, "s3_key": upload_key}
 
 @app.post("/api/v1/upload_with_jwt")
@@ -657,6 +859,7 @@ def api_upload(file: UploadFile = File(...), user=Depends(require_jwt)):
     # Close file
     file.file.close()
 
+    probe_upload_later(job_id, presigned_get(upload_key), ddb_update)
     return {"video_id": job_id, "s3_key": upload_key}
 
 
@@ -685,13 +888,15 @@ def api_upload(file: UploadFile, user=Depends(require_jwt)):
     return {"video_id": job_id, "s3_key": upload_key}
 
 @app.post("/api/v1/transcode_bkp")
-def api_transcode(body: dict, bg: BackgroundTasks, user=Depends(require_jwt)):
+def api_transcode(body: dict, user=Depends(require_jwt)):
     job_id = body.get("video_id")
     resolution = body.get("resolution", "480p")
     item = ddb_get(job_id)
     if item.get("user_sub") != user.get("sub"):
         raise HTTPException(status_code=403, detail="Forbidden")
-    bg.add_task(transcode_task, job_id, item.get("upload_key"), resolution)
+    duration = _source_duration(job_id, item)
+    admit(transcode_task, job_id, item.get("upload_key"), resolution, duration, user=user.get("sub", ""),
+          **source_estimate(duration, [resolution]))
     return {"job_id": job_id}
 
 def validate_jwt(token: str) -> dict:
@@ -700,17 +905,8 @@ def validate_jwt(token: str) -> dict:
     Raises HTTPException(401) on failure.
     """
     try:
-        # Fetch signing key from JWKS
-        signing_key = _jwk_client.get_signing_key_from_jwt(token).key
-
-        # Decode and validate the token
-        payload = jwt.decode(
-            token,
-            signing_key,
-            algorithms=["RS256"],
-            audience=COGNITO_CLIENT_ID,  # or remove this line if not verifying audience
-            issuer=ISSUER,
-        )
+        # Verified-claims cache + in-memory JWKS (see jwt_cache.py)
+        payload = jwt_cache.verifier(JWKS_URL, ISSUER, COGNITO_CLIENT_ID).verify(token)
 
         return payload  # contains sub, email, exp, etc.
 
@@ -742,10 +938,17 @@ COGNITO_CLIENT_ID = os.getenv("COGNITO_CLIENT_ID")
 JWKS_URL = f"https://cognito-idp.{COGNITO_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}/.well-known/jwks.json"
 ISSUER = f"https://cognito-idp.{COGNITO_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}"
 
-_jwk_client = PyJWKClient(JWKS_URL)
+@app.on_event("startup")
+def warm_jwks():
+    # pre-fetch signing keys so the first authenticated request doesn't pay for it
+    for v in (_require_jwt_verifier(), jwt_cache.verifier(JWKS_URL, ISSUER, COGNITO_CLIENT_ID)):
+        try:
+            v.warm()
+        except Exception as e:
+            logger.warning("JWKS warm-up failed for %s: %s", v.jwks_url, e)
 
 @app.post("/api/v1/transcode")
-def api_transcode(body: dict, bg: BackgroundTasks, authorization: str = Header(None)):
+def api_transcode(body: dict, authorization: str = Header(None)):
     job_id = body.get("video_id")
     if not job_id:
         raise HTTPException(status_code=400, detail="missing video_id")
@@ -767,8 +970,20 @@ def api_transcode(body: dict, bg: BackgroundTasks, authorization: str = Header(N
                            requester_sub, stored_sub, job_id)
             raise HTTPException(status_code=403, detail="Forbidden")
 
+    job_events.track(job_id, stored_sub or requester_sub)
+    duration = _source_duration(job_id, item)
+    if body.get("resolutions"):
+        presets = normalize_presets(body["resolutions"])
+        if not presets:
+            raise HTTPException(status_code=400, detail="no valid resolutions")
+        task = transcode_hls_task if body.get("packaging") == "hls" else transcode_ladder_task
+        admit(task, job_id, item.get("upload_key"), presets, user=stored_sub or requester_sub,
+              **source_estimate(duration, presets))
+        job_events.emit(job_id, {"status": "queued"})
+        return {"job_id": job_id, "resolutions": presets, "packaging": body.get("packaging") or "mp4"}
+
     resolution = body.get("resolution", "480p")
-    bg.add_task(transcode_task, job_id, item.get("upload_key"), resolution)
+    enqueue_transcode(job_id, item.get("upload_key"), resolution, stored_sub or requester_sub, duration)
     return {"job_id": job_id}
 
 
@@ -795,23 +1010,130 @@ def api_status_public(job_id: str):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+SSE_HEARTBEAT = int(os.getenv("SSE_HEARTBEAT", "15"))  # seconds; keeps the ALB idle timer happy
+
+STREAM_TICKET_TTL = int(os.getenv("STREAM_TICKET_TTL", "60"))  # seconds to open the stream with a ticket
+# signs event-stream tickets; without it each instance signs with its own key and
+# relies on ALB stickiness to bring the stream to the instance that issued the ticket
+STREAM_TICKET_SECRET = os.getenv("STREAM_TICKET_SECRET", "").encode() or os.urandom(32)
+
+def _stream_ticket_sig(sub: str, exp: str) -> str:
+    return hmac.new(STREAM_TICKET_SECRET, f"events\n{sub}\n{exp}".encode(), hashlib.sha256).hexdigest()
+
+def issue_stream_ticket(sub: str) -> str:
+    exp = str(int(time.time()) + STREAM_TICKET_TTL)
+    return f"{sub}.{exp}.{_stream_ticket_sig(sub, exp)}"
+
+def require_stream_ticket(request: Request, ticket: Optional[str] = Query(None)) -> Dict:
+    """
+    Caller of /api/v1/events. EventSource can't set headers, so browsers open
+    the stream with ?ticket= from /api/v1/events/ticket: it is good only for
+    this endpoint and only for STREAM_TICKET_TTL, and keeps the JWT out of
+    URLs (and so out of ALB and proxy access logs). A Bearer header also works.
+    """
+    if request.headers.get("authorization", "").startswith("Bearer ") or not ticket:
+        return require_jwt_stream(request, token=None)
+    sub, exp, sig = (["", "", ""] + ticket.rsplit(".", 2))[-3:]
+    if not (sub and exp.isdigit() and hmac.compare_digest(sig, _stream_ticket_sig(sub, exp))):
+        raise HTTPException(status_code=401, detail="Invalid stream ticket")
+    if int(exp) < time.time():
+        raise HTTPException(status_code=401, detail="Stream ticket expired")
+    return {"sub": sub}
+
+def require_jwt_stream(request: Request, token: Optional[str] = Query(None)) -> Dict:
+    """require_jwt for players that can't set headers (native HLS): also accepts ?token=."""
+    auth = request.headers.get("authorization", "")
+    if auth.startswith("Bearer "):
+        token = auth.split(" ", 1)[1]
+    if not token:
+        raise HTTPException(status_code=401, detail="Missing Bearer token")
+    if token == "test-dev-token":
+        return {"sub": "dev-user", "email": "dev@example.com"}
+    try:
+        return _require_jwt_verifier().verify(token)
+    except Exception as e:
+        raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
+
+@app.post("/api/v1/events/ticket")
+def api_events_ticket(user=Depends(require_jwt)):
+    """A short-lived ticket for opening /api/v1/events (see require_stream_ticket)."""
+    return {"ticket": issue_stream_ticket(user.get("sub", "")), "expires_in": STREAM_TICKET_TTL}
+
+@app.get("/api/v1/events")
+async def api_events(request: Request, user=Depends(require_stream_ticket)):
+    """
+    Server-Sent Events: one long-lived stream carrying status/progress
+    transitions for all of the caller's jobs, replacing per-job polling.
+    """
+    sub = job_events.bus.subscribe(user.get("sub", ""))
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+        finally:
+            job_events.bus.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/api/v1/status/{job_id}")
 def api_status(job_id: str, user=Depends(require_jwt)):
     item = ddb_get(job_id)
     if item.get("user_sub") != user.get("sub"):
         raise HTTPException(status_code=403, detail="Forbidden")
-    return {"status": item.get("status")}
+    return {"status": item.get("status"), "progress": item.get("progress")}
 
 @app.get("/api/v1/download/{job_id}")
-def api_download(job_id: str, user=Depends(require_jwt)):
+def api_download(job_id: str, preset: Optional[str] = None, user=Depends(require_jwt)):
     item = ddb_get(job_id)
     if item.get("user_sub") != user.get("sub"):
         raise HTTPException(status_code=403, detail="Forbidden")
     if item.get("status") != "done":
         raise HTTPException(status_code=400, detail="Job not done yet")
-    url = presigned_get(item["output_key"])
+    url = presigned_get(output_key_for(item, preset))
     return {"url": url}
 
+# ======== HLS playback ========
+def _hls_job(job_id: str, user: Dict) -> Dict:
+    item = ddb_get(job_id)
+    if item.get("user_sub") != user.get("sub"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if item.get("status") != "done" or not item.get("hls_key"):
+        raise HTTPException(status_code=404, detail="No HLS output for this job")
+    return item
+
+@app.get("/api/v1/hls/{job_id}/master.m3u8")
+def api_hls_master(job_id: str, token: Optional[str] = Query(None), user=Depends(require_jwt_stream)):
+    """
+    Master playlist. Variant URIs point back at this API (carrying ?token=
+    when that is how the player authenticated, e.g. native Safari HLS).
+    """
+    item = _hls_job(job_id, user)
+    text = aws_clients.s3().get_object(Bucket=S3_BUCKET, Key=item["hls_key"])["Body"].read().decode()
+    qs = f"?token={token}" if token else ""
+    body = hls_package.rewrite_master(text, lambda preset: f"/api/v1/hls/{job_id}/{preset}.m3u8{qs}")
+    return Response(content=body, media_type=hls_package.PLAYLIST_TYPE, headers={"Cache-Control": "private, no-cache"})
+
+@app.get("/api/v1/hls/{job_id}/{preset}.m3u8")
+def api_hls_media(job_id: str, preset: str, user=Depends(require_jwt_stream)):
+    """Media playlist with every segment URL presigned in one pass."""
+    item = _hls_job(job_id, user)
+    if preset not in (item.get("hls_presets") or []):
+        raise HTTPException(status_code=404, detail=f"No {preset} rendition for this job")
+    key = f"{hls_package.hls_prefix(job_id)}/{preset}/index.m3u8"
+    body = hls_package.signer.media(aws_clients.s3(), S3_BUCKET, key)
+    return Response(content=body, media_type=hls_package.PLAYLIST_TYPE,
+                    headers={"Cache-Control": f"private, max-age={hls_package.HLS_SIGN_TTL // 2}"})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=int(os.getenv("PORT", "8080")), reload=False)
\ No newline at end of file
@@ -1,26 +1,21 @@
 from typing import Dict
 from fastapi import Header, HTTPException
-from jwt import PyJWKClient
-import jwt
 
+import jwt_cache
 from config import AWS_REGION, COGNITO_APP_CLIENT_ID, COGNITO_USER_POOL_ID
 
 JWKS_URL = f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}/.well-known/jwks.json"
-_jwk_client = PyJWKClient(JWKS_URL)
+_verifier = jwt_cache.verifier(
+    JWKS_URL,
+    f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}",
+    COGNITO_APP_CLIENT_ID,
+)
 
 def require_jwt(authorization: str = Header(None)) -> Dict:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing Bearer token")
     token = authorization.split()[1]
     try:
-        signing_key = _jwk_client.get_signing_key_from_jwt(token).key
-        payload = jwt.decode(
-            token,
-            signing_key,
-            algorithms=["RS256"],
-            audience=COGNITO_APP_CLIENT_ID,
-            issuer=f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}",
-        )
-        return payload
+        return _verifier.verify(token)
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
@@ -0,0 +1,102 @@
+"""
+Shared AWS client registry.
+
+One boto3 Session per process plus one client per service and one DynamoDB
+Table handle per table name, built once (warm() at startup, or lazily on
+first use) and reused by every request. botocore clients are thread-safe and
+keep a pooled keep-alive connection per endpoint, so requests skip credential
+resolution, endpoint loading and the TLS handshake.
+
+Env knobs:
+  AWS_REGION=ap-southeast-2
+  AWS_MAX_POOL_CONNECTIONS=50   # >= API threadpool size
+"""
+import os
+import threading
+from typing import Dict, Iterable, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50"))
+
+# errors that mean the cached session holds stale credentials
+TOKEN_ERRORS = {"ExpiredToken", "ExpiredTokenException", "InvalidClientTokenId", "UnrecognizedClientException"}
+
+_lock = threading.RLock()
+_session: Optional[boto3.Session] = None
+_clients: Dict[str, object] = {}
+_tables: Dict[str, object] = {}
+
+def _config() -> Config:
+    return Config(
+        region_name=os.getenv("AWS_REGION", "ap-southeast-2"),
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        retries={"max_attempts": 5, "mode": "adaptive"},
+        tcp_keepalive=True,
+    )
+
+def session() -> boto3.Session:
+    """
+    Explicit env keys win (same as the old get_boto_session); otherwise the
+    default chain is used, which refreshes instance-role credentials itself.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.Session(
+                    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                    aws_session_token=os.getenv("AWS_SESSION_TOKEN"),
+                    region_name=os.getenv("AWS_REGION", "ap-southeast-2"),
+                )
+    return _session
+
+def client(service: str):
+    c = _clients.get(service)
+    if c is None:
+        with _lock:
+            c = _clients.get(service)
+            if c is None:
+                c = _clients[service] = session().client(service, config=_config())
+    return c
+
+def s3():
+    return client("s3")
+
+def table(name: str):
+    """
+    Shared Table handle. Only stateless calls (get/put/update/query) are made
+    through it, which is safe across threads.
+    """
+    t = _tables.get(name)
+    if t is None:
+        with _lock:
+            t = _tables.get(name)
+            if t is None:
+                t = _tables[name] = session().resource("dynamodb", config=_config()).Table(name)
+    return t
+
+def refresh():
+    """Drop the session and every cached handle; the next call rebuilds them."""
+    global _session
+    with _lock:
+        _session = None
+        _clients.clear()
+        _tables.clear()
+
+def refresh_if_expired(e: ClientError) -> bool:
+    """Call from an except ClientError block; refreshes on credential errors."""
+    if e.response.get("Error", {}).get("Code", "") in TOKEN_ERRORS:
+        refresh()
+        return True
+    return False
+
+def warm(table_names: Iterable[str] = ()):
+    """Build the shared handles up front so the first request doesn't pay for it."""
+    s3()
+    for name in table_names:
+        if name:
+            table(name)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Offline transcode benchmark.
+
+Runs the real encode paths -- services_transcode.transcode_task (what the
+API schedules) and worker1.process_message (the SQS worker) -- against a
+local S3/DynamoDB stand-in, and records per job: wall time, CPU time (job
+process + its ffmpeg children), peak RSS and peak /tmp usage; per batch:
+throughput. Each (target, source, preset, concurrency) cell is written as
+one JSON line, so runs can be diffed, plotted or checked with --baseline.
+
+Fixtures are reproducible: sample.mp4 from the repo, plus synthetic
+testsrc2 + sine sources ("synth:<seconds>[:<height>]", bit-exact encodes)
+generated once into --fixtures-dir.
+
+Stand-in: --endpoint http://localhost:5000 (moto_server, LocalStack, ...).
+Without it an in-process moto server is started (pip install "moto[server]").
+Encoder env (ENCODER_PROFILE, SEGMENT_*, TRANSCODE_STREAM_*) applies as usual.
+
+    python bench_transcode.py --sources sample,synth:30,synth:600 \\
+        --presets 480p,720p --concurrency 1,2,4 --out bench.jsonl
+    python bench_transcode.py ... --baseline bench.jsonl --tolerance 0.15   # exit 2 on regression
+"""
+import os
+import sys
+import json
+import glob
+import time
+import uuid
+import socket
+import logging
+import argparse
+import platform
+import resource
+import statistics
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BENCH_BUCKET = "bench-transcode"
+BENCH_TABLE = "bench-jobs"
+TMP_SAMPLE_INTERVAL = 0.2  # seconds between /tmp usage samples
+COMPARED = ("wall_s", "cpu_s")  # medians checked against --baseline
+
+# ======== fixtures ========
+def fixture(spec: str, fixtures_dir: str) -> Tuple[str, str]:
+    """(name, local path) for "sample" or "synth:<seconds>[:<height>]"; synthetic ones are built once."""
+    if spec == "sample":
+        return "sample", os.path.join(ROOT, "sample.mp4")
+    kind, _, rest = spec.partition(":")
+    if kind != "synth" or not rest:
+        raise SystemExit(f"unknown source {spec!r}; use sample or synth:<seconds>[:<height>]")
+    seconds, _, height = rest.partition(":")
+    h = int(height or 1080)
+    name = f"synth_{int(seconds)}s_{h}p"
+    path = os.path.join(fixtures_dir, name + ".mp4")
+    if not os.path.exists(path):
+        os.makedirs(fixtures_dir, exist_ok=True)
+        w = (h * 16 // 9) // 2 * 2
+        subprocess.run([
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={w}x{h}:rate=30",
+            "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000",
+            "-t", seconds, "-c:v", "libx264", "-preset", "ultrafast", "-g", "60", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact",
+            "-movflags", "+faststart", path + ".part",
+        ], check=True)
+        os.replace(path + ".part", path)
+    return name, path
+
+# ======== stand-in ========
+def start_stand_in(endpoint: Optional[str]) -> str:
+    if endpoint:
+        return endpoint
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        raise SystemExit('no --endpoint given and moto is not installed (pip install "moto[server]")')
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # no per-request access log
+    ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False).start()
+    return f"http://127.0.0.1:{port}"
+
+def configure_env(endpoint: str):
+    """Point every boto3 client (here and in the spawned job processes) at the stand-in."""
+    os.environ.update({
+        "AWS_ENDPOINT_URL": endpoint,
+        "AWS_ACCESS_KEY_ID": os.environ.get("AWS_ACCESS_KEY_ID", "bench"),
+        "AWS_SECRET_ACCESS_KEY": os.environ.get("AWS_SECRET_ACCESS_KEY", "bench"),
+        "AWS_REGION": os.environ.get("AWS_REGION", "ap-southeast-2"),
+        "AWS_DEFAULT_REGION": os.environ.get("AWS_REGION", "ap-southeast-2"),
+        "S3_BUCKET": BENCH_BUCKET,
+        "DDB_TABLE": BENCH_TABLE,
+        "SQS_QUEUE_URL": os.environ.get("SQS_QUEUE_URL", f"{endpoint}/000000000000/bench"),  # worker1 import guard
+    })
+
+def prepare_stand_in():
+    import boto3
+    s3 = boto3.client("s3")
+    try:
+        s3.create_bucket(Bucket=BENCH_BUCKET, CreateBucketConfiguration={"LocationConstraint": os.environ["AWS_REGION"]})
+    except (s3.exceptions.BucketAlreadyOwnedByYou, s3.exceptions.BucketAlreadyExists):
+        pass
+    ddb = boto3.client("dynamodb")
+    if BENCH_TABLE not in ddb.list_tables()["TableNames"]:
+        ddb.create_table(TableName=BENCH_TABLE, BillingMode="PAY_PER_REQUEST",
+                         KeySchema=[{"AttributeName": "job_id", "KeyType": "HASH"}],
+                         AttributeDefinitions=[{"AttributeName": "job_id", "AttributeType": "S"}])
+    return s3
+
+# ======== one job (runs in its own spawned process) ========
+def _tmp_usage(job_id: str) -> int:
+    total = 0
+    for top in glob.glob(f"/tmp/*{job_id}*"):
+        if os.path.isfile(top):
+            total += os.path.getsize(top)
+        for root, _, names in os.walk(top):
+            for n in names:
+                try:
+                    total += os.path.getsize(os.path.join(root, n))
+                except OSError:
+                    pass  # removed while we looked
+    return total
+
+def run_job(target: str, input_key: str, preset: str) -> Dict:
+    job_id = f"bench-{uuid.uuid4().hex[:12]}"
+    if target == "task":
+        import db_videos
+        import services_transcode
+        db_videos.put_item({"job_id": job_id, "status": "queued", "upload_key": input_key})
+    else:
+        import worker1
+
+    peak_tmp = [0]
+    stop = threading.Event()
+
+    def watch():
+        while not stop.wait(TMP_SAMPLE_INTERVAL):
+            peak_tmp[0] = max(peak_tmp[0], _tmp_usage(job_id))
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    t0 = time.perf_counter()
+    error = None
+    try:
+        if target == "task":
+            if services_transcode.transcode_task(job_id, input_key, preset) is None:
+                error = db_videos.get(job_id).get("error_message", "failed")
+        else:
+            worker1.process_message({"Body": json.dumps({
+                "job_id": job_id, "input_bucket": BENCH_BUCKET, "input_key": input_key,
+                "output_bucket": BENCH_BUCKET, "output_prefix": "bench-out/"})})
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    wall = time.perf_counter() - t0
+    stop.set()
+    watcher.join()
+
+    me = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)  # ffmpeg/ffprobe, all waited for
+    return {
+        "ok": error is None,
+        "error": error,
+        "wall_s": wall,
+        "cpu_s": (me.ru_utime - before.ru_utime) + (me.ru_stime - before.ru_stime) + kids.ru_utime + kids.ru_stime,
+        "rss_mb": me.ru_maxrss / 1024,          # KiB on Linux
+        "ffmpeg_rss_mb": kids.ru_maxrss / 1024,  # largest single child
+        "tmp_mb": peak_tmp[0] / 2 ** 20,
+    }
+
+# ======== cells ========
+def _summary(values: List[float]) -> Dict:
+    values = sorted(values)
+    if not values:
+        return {}
+    return {"median": round(statistics.median(values), 3),
+            "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+            "max": round(values[-1], 3)}
+
+def run_cell(target: str, input_key: str, preset: str, concurrency: int, jobs: int) -> Dict:
+    """`jobs` encodes, `concurrency` at a time, each in a fresh process so rusage is per job."""
+    with ProcessPoolExecutor(max_workers=concurrency, mp_context=multiprocessing.get_context("spawn"),
+                             max_tasks_per_child=1) as pool:
+        t0 = time.perf_counter()
+        results = list(pool.map(run_job, [target] * jobs, [input_key] * jobs, [preset] * jobs))
+        batch = time.perf_counter() - t0
+    ok = [r for r in results if r["ok"]]
+    return {
+        "jobs": jobs,
+        "ok": len(ok),
+        "errors": sorted({r["error"] for r in results if r["error"]})[:3],
+        "batch_wall_s": round(batch, 3),
+        "jobs_per_hour": round(len(ok) / batch * 3600, 1) if batch else None,
+        **{k: _summary([r[k] for r in ok]) for k in ("wall_s", "cpu_s", "rss_mb", "ffmpeg_rss_mb", "tmp_mb")},
+    }
+
+def environment() -> Dict:
+    def out(cmd):
+        try:
+            return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                  cwd=ROOT, timeout=10).stdout.splitlines()[0].strip()
+        except (OSError, IndexError, subprocess.SubprocessError):
+            return None
+    return {
+        "git": out(["git", "rev-parse", "--short", "HEAD"]),
+        "ffmpeg": out(["ffmpeg", "-version"]),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "encoder_profile": os.getenv("ENCODER_PROFILE", "throughput"),
+        "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+def regressions(records: List[Dict], baseline_path: str, tolerance: float) -> List[str]:
+    cell = lambda r: (r["target"], r["source"], r["preset"], r["concurrency"])
+    with open(baseline_path) as f:
+        base = {cell(r): r for r in map(json.loads, f) if r.get("target")}
+    found = []
+    for r in records:
+        old = base.get(cell(r))
+        if not old:
+            continue
+        for metric in COMPARED:
+            new_v, old_v = r[metric].get("median"), old[metric].get("median")
+            if new_v and old_v and new_v > old_v * (1 + tolerance):
+                found.append(f"{'/'.join(map(str, cell(r)))} {metric} median {old_v} -> {new_v} "
+                             f"(+{(new_v / old_v - 1) * 100:.0f}%)")
+    return found
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--targets", default="task,worker", help="task (transcode_task) and/or worker (worker1)")
+    ap.add_argument("--sources", default="sample,synth:30,synth:120")
+    ap.add_argument("--presets", default="480p,720p", help="task only; the worker keeps source resolution")
+    ap.add_argument("--concurrency", default="1,2")
+    ap.add_argument("--jobs-per-worker", type=int, default=2, help="jobs per concurrency slot in each cell")
+    ap.add_argument("--fixtures-dir", default="/tmp/bench-fixtures")
+    ap.add_argument("--endpoint", help="S3/DynamoDB stand-in URL; default: in-process moto")
+    ap.add_argument("--out", help="append JSON lines here (default: stdout)")
+    ap.add_argument("--baseline", help="JSON lines from an earlier run to compare medians against")
+    ap.add_argument("--tolerance", type=float, default=0.15)
+    args = ap.parse_args()
+
+    configure_env(start_stand_in(args.endpoint))
+    sys.path.insert(0, ROOT)
+    s3 = prepare_stand_in()
+    env = environment()
+
+    sources = []
+    for spec in args.sources.split(","):
+        name, path = fixture(spec.strip(), args.fixtures_dir)
+        key = f"bench-in/{name}.mp4"
+        s3.upload_file(path, BENCH_BUCKET, key)
+        sources.append((name, key))
+
+    records = []
+    out = open(args.out, "a") if args.out else sys.stdout
+    try:
+        for target in args.targets.split(","):
+            presets = args.presets.split(",") if target == "task" else ["source"]
+            for name, key in sources:
+                for preset in presets:
+                    for c in map(int, args.concurrency.split(",")):
+                        print(f"[bench] {target} {name} {preset} x{c}", file=sys.stderr, flush=True)
+                        rec = {"target": target, "source": name, "preset": preset, "concurrency": c,
+                               **run_cell(target, key, preset, c, c * args.jobs_per_worker), "env": env}
+                        records.append(rec)
+                        out.write(json.dumps(rec) + "\n")
+                        out.flush()
+                        print(f"[bench]   {rec['ok']}/{rec['jobs']} ok, {rec['jobs_per_hour']} jobs/h, "
+                              f"wall {rec['wall_s'].get('median')}s, cpu {rec['cpu_s'].get('median')}s, "
+                              f"tmp {rec['tmp_mb'].get('max')}MB", file=sys.stderr, flush=True)
+    finally:
+        if args.out:
+            out.close()
+
+    if args.baseline:
+        found = regressions(records, args.baseline, args.tolerance)
+        for line in found:
+            print(f"[bench] REGRESSION {line}", file=sys.stderr)
+        if found:
+            sys.exit(2)
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,297 @@
-import os, json
-from typing import Optional, Any
-from pymemcache.client.base import Client
+"""
+Two-level cache: a bounded in-process LRU (L1) in front of memcached (L2).
+
+Every key has a version token in memcached that each write replaces, and
+L2 values carry the version they were written at; a value whose version
+isn't current is ignored. L1 entries are served without a network hop for
+CACHE_L1_TTL seconds, then revalidated by fetching only the version key,
+so a write or delete on one API instance reaches the others' L1 within
+CACHE_L1_TTL. L1 keeps the serialized value and decodes it per hit, so
+callers can't mutate each other's copies.
+
+Values are serialized by cache_serde (msgpack by default, per key
+namespace, compressed above a size threshold); see there for its knobs.
+
+memcached is reached through a connection pool (MEMCACHED_POOL_SIZE
+sockets, safe to share across the threadpool); with several
+MEMCACHED_SERVERS keys are spread over them by rendezvous hashing and a
+dead node only costs the keys that live on it.
+
+Every memcached call is best effort: a cache error reads as a miss / failed
+write, never as a request failure. After an error memcached is skipped for
+CACHE_RETRY_AFTER seconds (L1 still serves what it holds), so an
+unreachable memcached costs one timeout, not one per request.
+
+Env knobs:
+  MEMCACHED_SERVERS=<MEMCACHED_HOST>:<MEMCACHED_PORT>   # comma separated host:port list
+  MEMCACHED_HOST=127.0.0.1
+  MEMCACHED_PORT=11211
+  MEMCACHED_POOL_SIZE=32          # sockets per server
+  CACHE_NAMESPACE=vt3
+  CACHE_RETRY_AFTER=30
+  CACHE_L1_TTL=1                  # seconds an L1 entry is served before revalidating; 0 disables L1
+  CACHE_L1_MAX_ENTRIES=10000
+  CACHE_L1_MAX_BYTES=33554432     # serialized size, 32 MiB
+"""
+import os, time, logging, threading, uuid
+from collections import OrderedDict
+from typing import Optional, Any, Dict, Tuple, Union
+from pymemcache.client.base import PooledClient
+from pymemcache.client.hash import HashClient
+
+import cache_serde
+
+logger = logging.getLogger("uvicorn.error")
 
 MEMCACHED_HOST = os.getenv("MEMCACHED_HOST", "127.0.0.1")
 MEMCACHED_PORT = int(os.getenv("MEMCACHED_PORT", "11211"))
+MEMCACHED_SERVERS = [s.strip() for s in os.getenv("MEMCACHED_SERVERS", f"{MEMCACHED_HOST}:{MEMCACHED_PORT}").split(",") if s.strip()]
+MEMCACHED_POOL_SIZE = int(os.getenv("MEMCACHED_POOL_SIZE", "32"))
 NAMESPACE = os.getenv("CACHE_NAMESPACE", "vt3")
+CACHE_RETRY_AFTER = float(os.getenv("CACHE_RETRY_AFTER", "30"))
+CACHE_L1_TTL = float(os.getenv("CACHE_L1_TTL", "1"))
+CACHE_L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", "10000"))
+CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", str(32 * 1024 * 1024)))
+VERSION_TTL = 7 * 24 * 3600  # version keys outlive any value written under them
+NO_VERSION = "0"             # version of a key whose token is missing (never written, or evicted)
 
-_client: Optional[Client] = None
-def _client_conn() -> Client:
+_client: Optional[Union[PooledClient, HashClient]] = None
+_client_lock = threading.Lock()
+_down_until = 0.0
+
+def _server(s: str) -> Tuple[str, int]:
+    host, _, port = s.rpartition(":")
+    return (host, int(port)) if host else (s, 11211)
+
+def _client_conn() -> Optional[Union[PooledClient, HashClient]]:
     global _client
+    if time.monotonic() < _down_until:
+        return None
     if _client is None:
-        _client = Client((MEMCACHED_HOST, MEMCACHED_PORT), timeout=0.3, connect_timeout=0.3)
+        with _client_lock:
+            if _client is None:
+                opts = dict(timeout=0.3, connect_timeout=0.3, no_delay=True, max_pool_size=MEMCACHED_POOL_SIZE)
+                if len(MEMCACHED_SERVERS) == 1:
+                    _client = PooledClient(_server(MEMCACHED_SERVERS[0]), **opts)
+                else:
+                    # HashClient parks a failing node itself; its keys read as misses meanwhile
+                    _client = HashClient([_server(s) for s in MEMCACHED_SERVERS], use_pooling=True,
+                                         ignore_exc=True, retry_attempts=1, dead_timeout=CACHE_RETRY_AFTER, **opts)
     return _client
 
+def _failed():
+    global _down_until
+    _down_until = time.monotonic() + CACHE_RETRY_AFTER
+
 def _k(key: str) -> str:
     return f"{NAMESPACE}:{key}"
 
-def cache_get(key: str):
+def _vk(key: str) -> str:
+    return f"{NAMESPACE}:v:{key}"
+
+def _encode(key: str, value: Any) -> Optional[Tuple[str, bytes]]:
+    """(codec tag, payload); None for a value the codec can't handle (logged, not raised)."""
     try:
-        raw = _client_conn().get(_k(key))
-        return None if raw is None else json.loads(raw)
-    except Exception:
+        return cache_serde.encode(key, value)
+    except (TypeError, ValueError) as e:
+        logger.warning("not caching %s: %s", key, e)
         return None
 
-def cache_set(key: str, value: Any, ttl_seconds: int = 300) -> bool:
+# ======== L1 ========
+class _LRU:
+    """key -> (version, payload, expires_at, fresh_until, codec tag), bounded by entries and payload bytes."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._d: "OrderedDict[str, Tuple[str, bytes, float, float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._d.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                self._drop(key)
+                return None
+            self._d.move_to_end(key)
+            return entry
+
+    def put(self, key: str, version: str, tag: str, raw: bytes, ttl: float):
+        if ttl <= 0 or len(raw) > self.max_bytes:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._drop(key)
+            self._d[key] = (version, raw, now + ttl, now + min(ttl, CACHE_L1_TTL), tag)
+            self._bytes += len(raw)
+            while len(self._d) > self.max_entries or self._bytes > self.max_bytes:
+                _, old = self._d.popitem(last=False)
+                self._bytes -= len(old[1])
+                self.evictions += 1
+
+    def revalidated(self, key: str):
+        with self._lock:
+            entry = self._d.get(key)
+            if entry is not None:
+                self._d[key] = entry[:3] + (min(entry[2], time.monotonic() + CACHE_L1_TTL),) + entry[4:]
+
+    def discard(self, key: str):
+        with self._lock:
+            self._drop(key)
+
+    def _drop(self, key: str):
+        entry = self._d.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._d), "bytes": self._bytes, "evictions": self.evictions}
+
+_l1 = _LRU(CACHE_L1_MAX_ENTRIES, CACHE_L1_MAX_BYTES)
+_counters = {"l1_hits": 0, "l1_revalidations": 0, "l2_hits": 0, "misses": 0, "stale_versions": 0,
+             "bytes_written": 0, "compressed": 0}
+_counters_lock = threading.Lock()
+
+def _count(name: str, n: int = 1):
+    with _counters_lock:
+        _counters[name] += n
+
+def _version(raw) -> str:
+    return raw.decode() if raw is not None else NO_VERSION
+
+def _new_version() -> str:
+    # a fresh token rather than a counter, so a write needs no read first
+    return uuid.uuid4().hex[:16]
+
+def _envelope(version: str, ttl: int, tag: str, raw: bytes) -> bytes:
+    # L2 value: version|absolute expiry|codec tag|payload; the expiry keeps L1 copies from outliving it
+    tag, body = cache_serde.compress(tag, raw)
+    _count("bytes_written", len(body))
+    if tag.endswith(cache_serde.COMPRESSED):
+        _count("compressed")
+    return f"{version}|{time.time() + ttl:.3f}|{tag}|".encode() + body
+
+def _unwrap(value: bytes) -> Optional[Tuple[str, float, str, bytes]]:
+    """(version, expires_at, tag, payload), or None for a value this code can't read."""
     try:
-        return _client_conn().set(_k(key), json.dumps(value), expire=ttl_seconds)
+        version, expires_at, tag, body = value.split(b"|", 3)
+        tag, raw = cache_serde.decompress(tag.decode(), body)
+        return version.decode(), float(expires_at), tag, raw
     except Exception:
-        return False
-cache.py
-import os, json
-from pymemcache.client.base import Client
+        return None
 
-HOST = os.environ.get("MEMCACHED_HOST")
-PORT = int(os.environ.get("MEMCACHED_PORT", "11211"))
-NS   = os.environ.get("CACHE_NAMESPACE", "a2")
+def _write(c, key: str, item: Tuple[str, bytes], ttl_seconds: int) -> Optional[str]:
+    """
+    Store a serialized value under a fresh version, the version key first
+    (it must outlive the value). Returns the version, or None if either
+    wasn't stored.
+    """
+    version = _new_version()
+    stored = c.set(_vk(key), version, expire=VERSION_TTL, noreply=False)
+    stored = stored and c.set(_k(key), _envelope(version, ttl_seconds, *item), expire=ttl_seconds, noreply=False)
+    return version if stored else None
 
-_client = Client((HOST, PORT), connect_timeout=1, timeout=1, no_delay=True)
+# ======== API ========
+def cache_get(key: str):
+    """The cached value, or None; one memcached round trip when L1 can't answer."""
+    entry = _l1.get(key) if CACHE_L1_TTL > 0 else None
+    if entry is not None and entry[3] > time.monotonic():
+        _count("l1_hits")
+        return cache_serde.decode(entry[4], entry[1])
 
-def _k(key: str) -> str:
-    return f"{NS}:{key}"
+    c = _client_conn()
+    if c is None:
+        # memcached is down: an L1 entry that can't be revalidated is still
+        # better than nothing until its own TTL runs out
+        return cache_serde.decode(entry[4], entry[1]) if entry is not None else None
+    try:
+        if entry is not None:
+            if _version(c.get(_vk(key))) == entry[0]:
+                _l1.revalidated(key)
+                _count("l1_revalidations")
+                return cache_serde.decode(entry[4], entry[1])
+            # changed since L1 cached it: fetch the value too (a second round trip, only on writes)
+            _l1.discard(key)
+        got = c.get_many([_vk(key), _k(key)])
+    except Exception:
+        _failed()
+        return None
 
-def cache_get(key: str):
-    val = _client.get(_k(key))
-    return None if val is None else json.loads(val)
+    stored = got.get(_k(key))
+    unwrapped = _unwrap(stored) if stored is not None else None
+    if unwrapped is None:
+        _count("misses")
+        return None
+    version, expires_at, tag, raw = unwrapped
+    if version != _version(got.get(_vk(key))):
+        _count("stale_versions")
+        _count("misses")
+        return None
+    try:
+        value = cache_serde.decode(tag, raw)
+    except Exception:
+        _count("misses")
+        return None
+    _count("l2_hits")
+    if CACHE_L1_TTL > 0:
+        _l1.put(key, version, tag, raw, expires_at - time.time())
+    return value
 
-def cache_set(key: str, value, ttl: int):
-    _client.set(_k(key), json.dumps(value), expire=ttl)
+def cache_set(key: str, value: Any, ttl_seconds: int = 300) -> bool:
+    _l1.discard(key)
+    c = _client_conn()
+    item = _encode(key, value)
+    if c is None or item is None:
+        return False
+    try:
+        version = _write(c, key, item, ttl_seconds)
+    except Exception:
+        _failed()
+        return False
+    if version is not None and CACHE_L1_TTL > 0:
+        _l1.put(key, version, *item, ttl_seconds)
+    return version is not None
 
-def cache_delete(key: str):
+def cache_add(key: str, value: Any, ttl_seconds: int = 300) -> bool:
+    """Store value only if key is absent, so a fill can't overwrite a newer write or a hold-off marker."""
+    c = _client_conn()
+    item = _encode(key, value)
+    if c is None or item is None:
+        return False
     try:
-        _client.delete(_k(key))
+        # a fill doesn't change the value, so it's stored at the current version
+        version = _version(c.get(_vk(key)))
+        stored = c.add(_k(key), _envelope(version, ttl_seconds, *item), expire=ttl_seconds, noreply=False)
     except Exception:
-        pass
+        _failed()
+        return False
+    if stored and CACHE_L1_TTL > 0:
+        _l1.put(key, version, *item, ttl_seconds)
+    return bool(stored)
 
-def cache_stats():
+def cache_delete(key: str) -> bool:
+    _l1.discard(key)
+    c = _client_conn()
+    if c is None:
+        return False
     try:
-        return _client.stats()
+        # a new version first, so other instances' L1 copies fail revalidation
+        c.set(_vk(key), _new_version(), expire=VERSION_TTL, noreply=False)
+        c.delete(_k(key), noreply=False)
+        return True
     except Exception:
-        return {} 
+        _failed()
+        return False
+
+def stats() -> Dict:
+    with _counters_lock:
+        c = dict(_counters)
+    reads = c["l1_hits"] + c["l1_revalidations"] + c["l2_hits"] + c["misses"]
+    return {**c, "l1": _l1.stats(), "servers": len(MEMCACHED_SERVERS),
+            "memcached_up": time.monotonic() >= _down_until,
+            "hit_ratio": round((reads - c["misses"]) / reads, 4) if reads else None}
@@ -0,0 +1,139 @@
+"""
+Value serializers for cache_mem, chosen per key namespace (the part of the
+key before the first ':', e.g. "job" for "job:<id>").
+
+- msgpack (default): compact binary; DynamoDB's Decimal, sets and
+  datetimes round-trip exactly through extension types.
+- json: readable with any memcached client; Decimals become int/float.
+
+Payloads of CACHE_COMPRESS_MIN bytes or more are zlib-compressed when that
+actually saves space. Every stored value is tagged with its codec and
+compression, so readers decode it whatever their own settings are and the
+codec can be changed without flushing the cache.
+
+Env knobs:
+  CACHE_SERIALIZER=msgpack        # msgpack | json (json if msgpack isn't installed)
+  CACHE_SERIALIZERS=              # per-namespace overrides, e.g. "job=msgpack,report=json"
+  CACHE_COMPRESS_MIN=1024         # bytes; 0 disables compression
+  CACHE_COMPRESS_LEVEL=1
+"""
+import os
+import json
+import zlib
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger("uvicorn.error")
+
+CACHE_SERIALIZER = os.getenv("CACHE_SERIALIZER", "msgpack")
+CACHE_SERIALIZERS = os.getenv("CACHE_SERIALIZERS", "")
+CACHE_COMPRESS_MIN = int(os.getenv("CACHE_COMPRESS_MIN", "1024"))
+CACHE_COMPRESS_LEVEL = int(os.getenv("CACHE_COMPRESS_LEVEL", "1"))
+
+COMPRESSED = "z"  # suffix on the codec tag
+
+# ======== codecs ========
+class JSONCodec:
+    tag = "j"
+
+    @staticmethod
+    def _default(v):
+        # DynamoDB numbers come back as Decimal, string/number sets as set
+        if isinstance(v, Decimal):
+            return int(v) if v == v.to_integral_value() else float(v)
+        if isinstance(v, (set, frozenset)):
+            return sorted(v, key=str)
+        if isinstance(v, (datetime, date)):
+            return v.isoformat()
+        raise TypeError(f"not JSON serializable: {type(v).__name__}")
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value, default=self._default, separators=(",", ":")).encode()
+
+    def loads(self, raw: bytes) -> Any:
+        return json.loads(raw)
+
+class MsgpackCodec:
+    tag = "m"
+    EXT_DECIMAL, EXT_DATETIME, EXT_DATE, EXT_SET = 1, 2, 3, 4
+
+    def _default(self, v):
+        if isinstance(v, Decimal):
+            return msgpack.ExtType(self.EXT_DECIMAL, str(v).encode())
+        if isinstance(v, datetime):
+            return msgpack.ExtType(self.EXT_DATETIME, v.isoformat().encode())
+        if isinstance(v, date):
+            return msgpack.ExtType(self.EXT_DATE, v.isoformat().encode())
+        if isinstance(v, (set, frozenset)):
+            return msgpack.ExtType(self.EXT_SET, msgpack.packb(list(v), default=self._default, use_bin_type=True))
+        raise TypeError(f"not msgpack serializable: {type(v).__name__}")
+
+    def _ext_hook(self, code: int, data: bytes):
+        if code == self.EXT_DECIMAL:
+            return Decimal(data.decode())
+        if code == self.EXT_DATETIME:
+            return datetime.fromisoformat(data.decode())
+        if code == self.EXT_DATE:
+            return date.fromisoformat(data.decode())
+        if code == self.EXT_SET:
+            return set(msgpack.unpackb(data, ext_hook=self._ext_hook, raw=False))
+        return msgpack.ExtType(code, data)
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=self._default, use_bin_type=True)
+
+    def loads(self, raw: bytes) -> Any:
+        return msgpack.unpackb(raw, ext_hook=self._ext_hook, raw=False, strict_map_key=False)
+
+_codecs = {"json": JSONCodec()}
+if msgpack is not None:
+    _codecs["msgpack"] = MsgpackCodec()
+_by_tag = {c.tag: c for c in _codecs.values()}
+
+def _codec(name: str):
+    if name not in _codecs:
+        logger.warning("cache serializer %r unavailable, using json", name)
+        return _codecs["json"]
+    return _codecs[name]
+
+_default_codec = _codec(CACHE_SERIALIZER)
+_by_namespace: Dict[str, Any] = {}
+for _pair in filter(None, (p.strip() for p in CACHE_SERIALIZERS.split(","))):
+    _ns, _, _name = _pair.partition("=")
+    _by_namespace[_ns.strip()] = _codec(_name.strip())
+
+def register(namespace: str, name: str):
+    """Serialize keys under namespace with the named codec (env overrides are applied at import)."""
+    _by_namespace[namespace] = _codec(name)
+
+def codec_for(key: str):
+    return _by_namespace.get(key.partition(":")[0], _default_codec)
+
+# ======== API ========
+def encode(key: str, value: Any) -> Tuple[str, bytes]:
+    """(tag, payload) in the key's codec, uncompressed."""
+    c = codec_for(key)
+    return c.tag, c.dumps(value)
+
+def decode(tag: str, raw: bytes) -> Any:
+    return _by_tag[tag].loads(raw)
+
+def compress(tag: str, raw: bytes) -> Tuple[str, bytes]:
+    """(tag, body) to store: zlib-compressed, tag suffixed, when it's big enough and it helps."""
+    if CACHE_COMPRESS_MIN and len(raw) >= CACHE_COMPRESS_MIN:
+        packed = zlib.compress(raw, CACHE_COMPRESS_LEVEL)
+        if len(packed) < len(raw):
+            return tag + COMPRESSED, packed
+    return tag, raw
+
+def decompress(tag: str, body: bytes) -> Tuple[str, bytes]:
+    if tag.endswith(COMPRESSED):
+        return tag[:-len(COMPRESSED)], zlib.decompress(body)
+    return tag, body
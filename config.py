@@ -13,3 +13,11 @@ class Settings:
     CORS_ALLOWED = [o.strip() for o in os.getenv("CORS_ALLOWED_ORIGINS","").split(",") if o.strip()] or ["*"]
 
 settings = Settings()
+
+# module-level names for `from config import S3_BUCKET` style imports
+AWS_REGION = settings.AWS_REGION
+S3_BUCKET = settings.S3_BUCKET
+DDB_TABLE = settings.DDB_TABLE
+COGNITO_USER_POOL_ID = settings.COGNITO_USER_POOL_ID
+COGNITO_APP_CLIENT_ID = settings.COGNITO_APP_CLIENT_ID
+CORS_ALLOWED = settings.CORS_ALLOWED
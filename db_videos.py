@@ -1,18 +1,49 @@
-from typing import Dict
-import boto3
+"""
+Job records: the one table and key schema every reader and writer of a job
+goes through (app.py, the transcode tasks, the upload routes).
+
+The table is DDB_TABLE_NAME, or DDB_TABLE when that isn't set, resolved per
+call so a .env loaded after import still applies. Its partition key is
+whatever the table declares ("job_id", "qut-username", ...), read from the
+cached schema, so an update lands on the item a get reads back.
+"""
+import os
+from typing import Dict, Optional
 from fastapi import HTTPException
-from config import AWS_REGION, DDB_TABLE
+import aws_clients
+import ddb_schema
+import job_cache
+import job_events
+from config import DDB_TABLE
+
+def table_name() -> str:
+    return os.getenv("DDB_TABLE_NAME") or DDB_TABLE
+
+def _table():
+    return aws_clients.table(table_name())
 
-_table = boto3.resource("dynamodb", region_name=AWS_REGION).Table(DDB_TABLE)
+def key(job_id: str) -> Dict:
+    """Primary key of a job's item."""
+    return {ddb_schema.get_schema(table_name()).key_names[0]: job_id}
+
+def with_key(item: Dict) -> Dict:
+    """item with the table's partition key filled in from its job_id."""
+    return {**key(item["job_id"]), **item}
 
 def put_item(item: Dict):
-    _table.put_item(Item=item)
+    item = with_key(item)
+    _table().put_item(Item=item)
+    job_cache.put(item["job_id"], item)
+
+def load(job_id: str) -> Optional[Dict]:
+    """The item straight from DynamoDB (no cache), or None."""
+    return _table().get_item(Key=key(job_id)).get("Item")
 
 def get(job_id: str) -> Dict:
-    res = _table.get_item(Key={"job_id": job_id})
-    if "Item" not in res:
+    item = job_cache.get(job_id, lambda: load(job_id))
+    if item is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    return res["Item"]
+    return item
 
 def update(job_id: str, **attrs):
     if not attrs:
@@ -20,9 +51,11 @@ def update(job_id: str, **attrs):
     expr = "SET " + ", ".join(f"#{k}=:{k}" for k in attrs)
     names = {f"#{k}": k for k in attrs}
     values = {f":{k}": v for k, v in attrs.items()}
-    _table.update_item(
-        Key={"job_id": job_id},
+    _table().update_item(
+        Key=key(job_id),
         UpdateExpression=expr,
         ExpressionAttributeNames=names,
         ExpressionAttributeValues=values,
     )
+    job_cache.invalidate(job_id)
+    job_events.emit(job_id, attrs)
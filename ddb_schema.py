@@ -0,0 +1,93 @@
+"""
+Cached DynamoDB table metadata.
+
+Reading table.key_schema on a fresh handle costs a DescribeTable round trip.
+The key schema, attribute types and GSIs are loaded once per table and kept
+in-process; items are validated against them before PutItem. Call refresh()
+after a table change (ddb_put_item also does it on ValidationException).
+"""
+import threading
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import aws_clients
+
+class TableSchema:
+    def __init__(self, desc: Dict):
+        self.name: str = desc["TableName"]
+        self.key_names: List[str] = [k["AttributeName"] for k in desc["KeySchema"]]
+        self.attribute_types: Dict[str, str] = {
+            a["AttributeName"]: a["AttributeType"] for a in desc.get("AttributeDefinitions", [])
+        }
+        self.gsis: Dict[str, List[str]] = {
+            g["IndexName"]: [k["AttributeName"] for k in g["KeySchema"]]
+            for g in desc.get("GlobalSecondaryIndexes", [])
+        }
+        # cleaned name -> exact name (tables created with stray whitespace, e.g. "qut-username ")
+        self.cleaned_keys: Dict[str, str] = {k.strip(): k for k in self.key_names}
+
+    def validate(self, item: Dict) -> Dict:
+        """
+        Check the primary key is present and coerce key values to the declared
+        type; GSI key attributes, when present, must match theirs too (empty
+        ones are dropped, leaving the item out of that index).
+        Raises RuntimeError like the old inline check.
+        """
+        missing = [k for k in self.key_names if k not in item or item[k] is None]
+        if missing:
+            raise RuntimeError(
+                f"Missing required key(s) for table: {missing}. "
+                f"Item keys present: {list(item.keys())}"
+            )
+        for k in self.key_names:
+            item[k] = _coerce(k, item[k], self.attribute_types.get(k, "S"))
+        for index, keys in self.gsis.items():
+            for k in keys:
+                if item.get(k) == "":
+                    # DynamoDB rejects empty GSI keys; without the attribute the item just isn't indexed
+                    del item[k]
+                elif k in item and item[k] is not None:
+                    try:
+                        item[k] = _coerce(k, item[k], self.attribute_types.get(k, "S"))
+                    except RuntimeError as e:
+                        raise RuntimeError(f"{e} (GSI {index})")
+        return item
+
+def _coerce(name: str, value, attr_type: str):
+    if attr_type == "S":
+        value = str(value)
+        if not value:
+            raise RuntimeError(f"Key attribute {name!r} must be a non-empty string")
+        return value
+    if attr_type == "N":
+        if isinstance(value, bool) or not isinstance(value, (int, Decimal, str)):
+            raise RuntimeError(f"Key attribute {name!r} must be a number, got {type(value).__name__}")
+        try:
+            return Decimal(str(value))
+        except Exception:
+            raise RuntimeError(f"Key attribute {name!r} must be a number, got {value!r}")
+    return value  # "B": leave bytes to boto3
+
+_lock = threading.Lock()
+_schemas: Dict[str, TableSchema] = {}
+
+def get_schema(table_name: str) -> TableSchema:
+    schema = _schemas.get(table_name)
+    if schema is None:
+        with _lock:
+            schema = _schemas.get(table_name)
+            if schema is None:
+                desc = aws_clients.client("dynamodb").describe_table(TableName=table_name)["Table"]
+                schema = _schemas[table_name] = TableSchema(desc)
+    return schema
+
+def refresh(table_name: Optional[str] = None):
+    """Forget cached metadata for one table (or all); next use re-describes it."""
+    with _lock:
+        if table_name is None:
+            _schemas.clear()
+        else:
+            _schemas.pop(table_name, None)
+
+def validate_item(table_name: str, item: Dict) -> Dict:
+    return get_schema(table_name).validate(item)
@@ -0,0 +1,250 @@
+"""
+Shared ffmpeg helpers for app.py and services_transcode.py.
+
+Env knobs:
+  ENCODER_PROFILE=throughput   # or "quality"; see ENCODER_PROFILES
+  ENCODER_TUNE=                # optional x264 tune for every output, e.g. film, animation
+  FFMPEG_THREADS=2             # threads per job assumed where no preset is known
+"""
+import os
+import re
+import json
+import time
+import threading
+import subprocess
+from collections import deque
+from typing import Callable, Dict, List, Iterable, Optional, Sequence, Tuple
+
+# preset name -> output height
+PRESETS: Dict[str, int] = {"360p": 360, "480p": 480, "720p": 720, "1080p": 1080}
+DEFAULT_PRESET = "480p"
+
+FFMPEG_THREADS = int(os.getenv("FFMPEG_THREADS", "2"))
+
+# ======== encoder profiles ========
+# output height -> libx264 settings. "threads" is what one output of that size
+# is given, and what the scheduler reserves for it. "throughput" runs narrow
+# jobs side by side: x264 gets more encoded frames per core-second from 1-2
+# threads than from many, and small working sets stay in cache. "quality"
+# spends more CPU per job for smaller files at the same visual quality.
+ENCODER_PROFILE = os.getenv("ENCODER_PROFILE", "throughput")
+ENCODER_TUNE = os.getenv("ENCODER_TUNE") or None
+ENCODER_PROFILES: Dict[str, Dict[int, Dict]] = {
+    "throughput": {
+        360: {"preset": "veryfast", "crf": 26, "threads": 1, "lookahead": 10},
+        480: {"preset": "veryfast", "crf": 26, "threads": 1, "lookahead": 10},
+        720: {"preset": "veryfast", "crf": 26, "threads": 2, "lookahead": 10},
+        1080: {"preset": "veryfast", "crf": 26, "threads": 4, "lookahead": 10},
+    },
+    "quality": {
+        360: {"preset": "medium", "crf": 23, "threads": 2, "lookahead": 40},
+        480: {"preset": "medium", "crf": 23, "threads": 2, "lookahead": 40},
+        720: {"preset": "medium", "crf": 23, "threads": 4, "lookahead": 40},
+        1080: {"preset": "slow", "crf": 23, "threads": 6, "lookahead": 50},
+    },
+}
+
+def encoder_settings(preset: Optional[str], profile: Optional[str] = None) -> Dict:
+    """Profile entry for a preset; an unknown preset (e.g. source resolution) gets the largest."""
+    table = ENCODER_PROFILES.get(profile or ENCODER_PROFILE) or ENCODER_PROFILES["throughput"]
+    height = PRESETS.get(preset or "", max(table))
+    return table[min((h for h in table if h >= height), default=max(table))]
+
+def video_args(preset: Optional[str], stream: str = "", profile: Optional[str] = None) -> List[str]:
+    """
+    libx264 args for one output. stream (e.g. "v:1") scopes every option to
+    one video stream, for commands that put several renditions in one muxer.
+    """
+    e = encoder_settings(preset, profile)
+    sfx = f":{stream}" if stream else ""
+    args = [f"-c:{stream or 'v'}", "libx264", f"-preset{sfx}", e["preset"], f"-crf{sfx}", str(e["crf"]),
+            f"-threads{sfx}", str(e["threads"]), f"-rc-lookahead{sfx}", str(e["lookahead"])]
+    if ENCODER_TUNE:
+        args += [f"-tune{sfx}", ENCODER_TUNE]
+    return args
+
+def encoder_threads(presets: Iterable[Optional[str]]) -> int:
+    """Threads a command encoding these outputs will keep busy."""
+    return sum(encoder_settings(p)["threads"] for p in presets) or FFMPEG_THREADS
+
+VIDEO_ARGS = video_args(DEFAULT_PRESET)
+AUDIO_ARGS = ["-c:a", "aac"]
+# MP4 that can be written to a pipe: moov up front, media in self-contained fragments
+FRAGMENTED_MP4_ARGS = ["-movflags", "+frag_keyframe+empty_moov+default_base_moof", "-f", "mp4"]
+# output name prefix routed to a run_with_progress sink instead of a file
+SINK_PREFIX = "sink:"
+
+def scale_filter(preset: str) -> str:
+    return f"scale=-2:{PRESETS.get(preset, PRESETS[DEFAULT_PRESET])}"
+
+def normalize_presets(presets: Iterable[str]) -> List[str]:
+    """Drop unknown/duplicate presets and order them low -> high."""
+    return sorted({p for p in presets if p in PRESETS}, key=PRESETS.get)
+
+def ladder_cmd(in_path: str, outputs: Dict[str, str], output_args: Sequence[str] = ()) -> list:
+    """
+    One ffmpeg invocation for a whole ladder: the source is decoded once,
+    split into N branches, and each branch is scaled + encoded to its own file.
+    outputs = {"360p": "/tmp/x/360p.mp4", "720p": "/tmp/x/720p.mp4", ...}
+    output_args go in front of every output (e.g. FRAGMENTED_MP4_ARGS).
+    """
+    presets = list(outputs)
+    n = len(presets)
+    labels = [f"v{i}" for i in range(n)]
+    graph = f"[0:v]split={n}" + "".join(f"[{l}]" for l in labels)
+    for i, p in enumerate(presets):
+        graph += f";[{labels[i]}]{scale_filter(p)}[o{i}]"
+
+    cmd = ["ffmpeg", "-y", "-i", in_path, "-filter_complex", graph]
+    for i, p in enumerate(presets):
+        cmd += ["-map", f"[o{i}]", "-map", "0:a?", *video_args(p), *AUDIO_ARGS, *output_args, outputs[p]]
+    return cmd
+
+# ======== progress ========
+PROGRESS_MIN_INTERVAL = float(os.getenv("PROGRESS_MIN_INTERVAL", "5"))  # seconds between updates
+PROGRESS_MIN_DELTA = float(os.getenv("PROGRESS_MIN_DELTA", "5"))        # percent points between updates
+SINK_CHUNK = 1024 * 1024
+
+def probe_duration(path: str, timeout: float = 30) -> Optional[float]:
+    """Container duration in seconds, or None if ffprobe can't tell."""
+    try:
+        p = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=timeout,
+        )
+        return float(p.stdout.strip()) or None
+    except (ValueError, OSError, subprocess.SubprocessError):
+        return None
+
+def probe_source(path: str, timeout: float = 30) -> Dict:
+    """{"duration": seconds, "height": first video stream's height}, either None if ffprobe can't tell; one ffprobe run."""
+    meta = {"duration": None, "height": None}
+    try:
+        p = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "format=duration:stream=height",
+             "-of", "json", path],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=timeout,
+        )
+        info = json.loads(p.stdout or "{}")
+    except (ValueError, OSError, subprocess.SubprocessError):
+        return meta
+    try:
+        meta["duration"] = float(info.get("format", {}).get("duration")) or None
+    except (TypeError, ValueError):
+        pass
+    streams = info.get("streams") or [{}]
+    if isinstance(streams[0].get("height"), int):
+        meta["height"] = streams[0]["height"]
+    return meta
+
+_BANNER_DURATION = re.compile(r"Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)")
+
+def _feed_stdin(p: subprocess.Popen, chunks: Iterable[bytes], errors: list):
+    """Write chunks to ffmpeg's stdin; on a read failure kill ffmpeg so a truncated input can't look like success."""
+    try:
+        for chunk in chunks:
+            p.stdin.buffer.write(chunk)
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its rc says why
+    except Exception as e:
+        errors.append(f"input stream failed: {e}\n")
+        p.kill()
+    finally:
+        try:
+            p.stdin.close()
+        except OSError:
+            pass
+
+def _drain_sink(p: subprocess.Popen, fd: int, sink: Callable[[bytes], None], errors: list):
+    """Hand one output pipe to its sink; if the sink fails, kill ffmpeg."""
+    with os.fdopen(fd, "rb") as f:
+        try:
+            for chunk in iter(lambda: f.read(SINK_CHUNK), b""):
+                sink(chunk)
+        except Exception as e:
+            errors.append(f"output stream failed: {e}\n")
+            p.kill()
+
+def run_with_progress(cmd: list, duration: Optional[float],
+                      on_progress: Callable[[float], None],
+                      stdin: Optional[Iterable[bytes]] = None,
+                      sinks: Optional[Dict[str, Callable[[bytes], None]]] = None) -> Tuple[int, str]:
+    """
+    Run ffmpeg with -progress on stdout and report percent complete as it
+    goes. on_progress fires at most every PROGRESS_MIN_INTERVAL seconds and
+    only after PROGRESS_MIN_DELTA points of movement (plus once at 100), so
+    callers can write it straight to DynamoDB. Returns (rc, stderr tail).
+
+    stdin, if given, is fed to ffmpeg (for `-i pipe:0`). With no duration
+    up front, the one ffmpeg prints for its input is used.
+
+    sinks: outputs named "sink:<name>" in cmd are written to an extra pipe
+    and passed to sinks[name] chunk by chunk while ffmpeg runs, so they can
+    be uploaded during the encode. The output format must be pipe-friendly
+    (see FRAGMENTED_MP4_ARGS). All sinks have been fed when this returns.
+    """
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+    pipes = []  # (read fd, write fd, sink)
+    for i, arg in enumerate(cmd):
+        if arg.startswith(SINK_PREFIX):
+            r, w = os.pipe()
+            pipes.append((r, w, sinks[arg[len(SINK_PREFIX):]]))
+            cmd[i] = f"pipe:{w}"
+    p = subprocess.Popen(cmd, stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1,
+                         pass_fds=tuple(w for _, w, _ in pipes))
+
+    feed_errors: list = []
+    feeder = None
+    if stdin is not None:
+        feeder = threading.Thread(target=_feed_stdin, args=(p, stdin, feed_errors), daemon=True)
+        feeder.start()
+    sink_threads = []
+    for r, w, sink in pipes:
+        os.close(w)  # ffmpeg holds the write end now; EOF arrives when it exits
+        t = threading.Thread(target=_drain_sink, args=(p, r, sink, feed_errors), daemon=True)
+        t.start()
+        sink_threads.append(t)
+
+    tail: deque = deque(maxlen=200)
+    known = {"duration": duration}
+
+    def drain():
+        for line in p.stderr:
+            tail.append(line)
+            if not known["duration"]:
+                m = _BANNER_DURATION.search(line)
+                if m:
+                    h, mnt, sec = m.groups()
+                    known["duration"] = int(h) * 3600 + int(mnt) * 60 + float(sec) or None
+    drainer = threading.Thread(target=drain, daemon=True)
+    drainer.start()
+
+    last_t, last_pct = 0.0, 0.0
+    try:
+        for line in p.stdout:
+            key, _, value = line.strip().partition("=")
+            if key in ("out_time_us", "out_time_ms") and known["duration"]:  # both are microseconds
+                try:
+                    pct = min(99.0, int(value) / 1e6 / known["duration"] * 100)
+                except ValueError:
+                    continue
+                now = time.monotonic()
+                if now - last_t >= PROGRESS_MIN_INTERVAL and pct - last_pct >= PROGRESS_MIN_DELTA:
+                    on_progress(pct)
+                    last_t, last_pct = now, pct
+            elif key == "progress" and value == "end":
+                on_progress(100.0)
+        rc = p.wait()
+    except BaseException:
+        p.kill()  # interrupted (e.g. a worker drain): don't leave ffmpeg running on its own
+        p.wait()
+        raise
+    drainer.join(timeout=5)
+    if feeder is not None:
+        feeder.join(timeout=5)
+    for t in sink_threads:
+        t.join()  # every byte must reach its sink before the caller completes uploads
+    if feed_errors:
+        rc = rc or 1
+    return rc, "".join(tail) + "".join(feed_errors)
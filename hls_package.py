@@ -0,0 +1,140 @@
+"""
+HLS packaging for ladder jobs.
+
+One ffmpeg run writes every preset as an HLS rendition (MPEG-TS segments
+of HLS_SEGMENT_SECONDS, keyframes forced on segment boundaries so players
+can switch renditions cleanly) plus a master playlist. Everything is
+uploaded under outputs/{job_id}/hls/:
+
+    master.m3u8
+    360p/index.m3u8   360p/seg_00000.ts ...
+    720p/index.m3u8   720p/seg_00000.ts ...
+
+Segments are immutable and uploaded with a long Cache-Control so a CDN or
+the browser can keep them. Playlists are served through the API, which
+rewrites each segment URI into a presigned S3 URL. A signed media
+playlist is reused for HLS_SIGN_TTL seconds, so concurrent viewers get
+byte-identical segment URLs and caches in front of S3 actually hit.
+
+Env knobs:
+  HLS_SEGMENT_SECONDS=6
+  HLS_URL_EXPIRES=14400     # segment URL lifetime; must cover a viewing session
+  HLS_SIGN_TTL=600          # seconds a signed playlist is reused
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from ffmpeg_utils import AUDIO_ARGS, scale_filter, video_args
+from s3_multipart import UPLOAD_CONCURRENCY
+
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "6"))
+HLS_URL_EXPIRES = int(os.getenv("HLS_URL_EXPIRES", "14400"))
+HLS_SIGN_TTL = int(os.getenv("HLS_SIGN_TTL", "600"))
+HLS_SIGN_CACHE_MAX = 1024
+MASTER = "master.m3u8"
+PLAYLIST_TYPE = "application/vnd.apple.mpegurl"
+
+_CONTENT_TYPES = {".m3u8": PLAYLIST_TYPE, ".ts": "video/mp2t", ".m4s": "video/iso.segment", ".mp4": "video/mp4"}
+SEGMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def hls_prefix(job_id: str) -> str:
+    return f"outputs/{job_id}/hls"
+
+def hls_cmd(in_path: str, presets: List[str], out_dir: str, audio: bool) -> list:
+    """ladder_cmd's split/scale graph, muxed as one HLS variant per preset."""
+    n = len(presets)
+    graph = f"[0:v]split={n}" + "".join(f"[v{i}]" for i in range(n))
+    for i, p in enumerate(presets):
+        graph += f";[v{i}]{scale_filter(p)}[o{i}]"
+
+    cmd = ["ffmpeg", "-y", "-i", in_path, "-filter_complex", graph]
+    for i in range(n):
+        cmd += ["-map", f"[o{i}]"] + (["-map", "0:a:0"] if audio else [])
+    streams = " ".join(f"v:{i}" + (f",a:{i}" if audio else "") + f",name:{p}" for i, p in enumerate(presets))
+    for i, p in enumerate(presets):
+        cmd += video_args(p, stream=f"v:{i}")
+    cmd += [
+        *(AUDIO_ARGS if audio else []),
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+        "-f", "hls", "-hls_time", str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments", "-hls_segment_type", "mpegts",
+        "-hls_segment_filename", f"{out_dir}/%v/seg_%05d.ts",
+        "-master_pl_name", MASTER, "-var_stream_map", streams,
+        f"{out_dir}/%v/index.m3u8",
+    ]
+    return cmd
+
+def upload_dir(s3, bucket: str, local_dir: str, prefix: str) -> int:
+    """Upload a packaged rendition tree in parallel; playlists last so they never point at missing segments."""
+    files = []
+    for root, _, names in os.walk(local_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            files.append((path, f"{prefix}/{os.path.relpath(path, local_dir)}"))
+    segments = [f for f in files if not f[0].endswith(".m3u8")]
+    playlists = [f for f in files if f[0].endswith(".m3u8")]
+
+    def put(item: Tuple[str, str]):
+        path, key = item
+        ext = os.path.splitext(path)[1]
+        extra = {"ContentType": _CONTENT_TYPES.get(ext, "application/octet-stream")}
+        if ext != ".m3u8":
+            extra["CacheControl"] = SEGMENT_CACHE_CONTROL
+        s3.upload_file(path, bucket, key, ExtraArgs=extra)
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY * 2, thread_name_prefix="hls-upload") as pool:
+        list(pool.map(put, segments))
+        list(pool.map(put, playlists))
+    return len(files)
+
+# ======== playlist signing ========
+def _rewrite(text: str, uri_for: Callable[[str], str]) -> str:
+    """Replace every URI in a playlist (plain URI lines and URI="..." attributes)."""
+    out = []
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            line = uri_for(line.strip())
+        elif 'URI="' in line:
+            head, _, rest = line.partition('URI="')
+            uri, _, tail = rest.partition('"')
+            line = f'{head}URI="{uri_for(uri)}"{tail}'
+        out.append(line)
+    return "\n".join(out) + "\n"
+
+def rewrite_master(text: str, variant_url: Callable[[str], str]) -> str:
+    """Point each variant ("360p/index.m3u8") at variant_url("360p")."""
+    return _rewrite(text, lambda uri: variant_url(uri.split("/", 1)[0]))
+
+class PlaylistSigner:
+    """Media playlists with presigned segment URLs, cached for HLS_SIGN_TTL."""
+    def __init__(self, ttl: int = HLS_SIGN_TTL, max_entries: int = HLS_SIGN_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def media(self, s3, bucket: str, playlist_key: str) -> str:
+        now = time.time()
+        with self._lock:
+            hit = self._cache.get(playlist_key)
+            if hit and hit[0] > now:
+                self._cache.move_to_end(playlist_key)
+                return hit[1]
+
+        base = playlist_key.rsplit("/", 1)[0]
+        text = s3.get_object(Bucket=bucket, Key=playlist_key)["Body"].read().decode()
+        # presigning is local HMAC work, no round trip per segment
+        signed = _rewrite(text, lambda uri: s3.generate_presigned_url(
+            "get_object", Params={"Bucket": bucket, "Key": f"{base}/{uri}"}, ExpiresIn=HLS_URL_EXPIRES))
+
+        with self._lock:
+            self._cache[playlist_key] = (now + self.ttl, signed)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return signed
+
+signer = PlaylistSigner()
@@ -0,0 +1,86 @@
+"""
+Read-through cache of job records in memcached (cache_mem), shared by every
+API instance and transcode worker.
+
+- get(job_id, load): cached record, or load() from DynamoDB and cache it.
+  Active jobs are kept JOB_CACHE_TTL seconds, finished ones (done/error)
+  JOB_CACHE_TERMINAL_TTL; a missing job is cached as a tombstone for
+  JOB_CACHE_NEGATIVE_TTL so 404 polling doesn't reach DynamoDB either.
+- put(job_id, item): write-through after PutItem.
+- invalidate(job_id): after UpdateItem. Instead of a delete, a short
+  hold-off marker is written and fills use `add`, so a reader that loaded
+  the old record just before the update can't put it back in the cache.
+
+Counters (per process) are in stats().
+
+Env knobs:
+  JOB_CACHE=1
+  JOB_CACHE_TTL=5               # seconds, jobs still moving
+  JOB_CACHE_TERMINAL_TTL=300    # seconds, done / error
+  JOB_CACHE_NEGATIVE_TTL=2      # seconds, unknown job ids
+  JOB_CACHE_HOLDOFF=1           # seconds after an update before the record is cached again
+"""
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+from cache_mem import cache_add, cache_get, cache_set
+
+JOB_CACHE = os.getenv("JOB_CACHE", "1") == "1"
+JOB_CACHE_TTL = int(os.getenv("JOB_CACHE_TTL", "5"))
+JOB_CACHE_TERMINAL_TTL = int(os.getenv("JOB_CACHE_TERMINAL_TTL", "300"))
+JOB_CACHE_NEGATIVE_TTL = int(os.getenv("JOB_CACHE_NEGATIVE_TTL", "2"))
+JOB_CACHE_HOLDOFF = int(os.getenv("JOB_CACHE_HOLDOFF", "1"))
+
+TERMINAL = {"done", "error"}
+_MISSING = {"__job_cache__": "missing"}
+_HOLD = {"__job_cache__": "hold"}
+
+_lock = threading.Lock()
+_counters = {"hits": 0, "negative_hits": 0, "misses": 0, "fills": 0, "invalidations": 0}
+
+def _count(name: str):
+    with _lock:
+        _counters[name] += 1
+
+def _key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+def _ttl(item: Dict) -> int:
+    return JOB_CACHE_TERMINAL_TTL if item.get("status") in TERMINAL else JOB_CACHE_TTL
+
+def get(job_id: str, load: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+    """The job record, or None if it doesn't exist. Errors from load() propagate and aren't cached."""
+    if not JOB_CACHE:
+        return load()
+    cached = cache_get(_key(job_id))
+    if cached == _MISSING:
+        _count("negative_hits")
+        return None
+    if cached is not None and cached != _HOLD:
+        _count("hits")
+        return cached
+
+    _count("misses")
+    item = load()
+    if cached != _HOLD:
+        value, ttl = (item, _ttl(item)) if item is not None else (_MISSING, JOB_CACHE_NEGATIVE_TTL)
+        if cache_add(_key(job_id), value, ttl):
+            _count("fills")
+    return item
+
+def put(job_id: str, item: Dict):
+    if JOB_CACHE:
+        cache_set(_key(job_id), item, _ttl(item))
+
+def invalidate(job_id: str):
+    if JOB_CACHE:
+        _count("invalidations")
+        cache_set(_key(job_id), _HOLD, JOB_CACHE_HOLDOFF)
+
+def stats() -> Dict:
+    with _lock:
+        c = dict(_counters)
+    reads = c["hits"] + c["negative_hits"] + c["misses"]
+    return {"enabled": JOB_CACHE, **c,
+            "hit_ratio": round((c["hits"] + c["negative_hits"]) / reads, 4) if reads else None}
@@ -0,0 +1,126 @@
+"""
+In-process job status event bus for the SSE stream (/api/v1/events).
+
+State changes are pushed here by ddb_update / db_videos.update as they are
+written, so open browser streams never re-read DynamoDB. Transcodes run in
+the scheduler's worker processes; those forward events to the API process
+over a multiprocessing queue (init_worker) and a pump thread fans them out.
+
+Events are routed per user: track(job_id, user_sub) when a job is admitted,
+subscribe(user_sub) for each open stream. This is per API instance, so the
+stream must land on the instance that accepted the job: the ALB target group
+has cookie stickiness for that (terraform/alb.tf). Jobs without an owner
+(anonymous uploads) aren't routed at all. In every case where no event
+arrives, the browser falls back to polling /api/v1/status.
+"""
+import asyncio
+import json
+import queue
+import threading
+import multiprocessing
+from typing import Dict, Optional, Set
+
+# fields worth streaming; everything else (logs, timestamps) stays in DynamoDB
+STREAM_FIELDS = ("status", "progress", "output_key", "output_keys", "error_message", "cache_hit")
+TERMINAL = {"done", "error"}
+
+class Subscription:
+    def __init__(self, user_sub: str, loop: asyncio.AbstractEventLoop):
+        self.user_sub = user_sub
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+
+    def push(self, event: Dict):
+        def _put():
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass  # slow client; it will see the next transition
+        self.loop.call_soon_threadsafe(_put)
+
+class JobEventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owners: Dict[str, str] = {}           # job_id -> user_sub
+        self._subs: Dict[str, Set[Subscription]] = {}  # user_sub -> open streams
+
+    def track(self, job_id: str, user_sub: str):
+        if user_sub:
+            with self._lock:
+                self._owners[job_id] = user_sub
+
+    def subscribe(self, user_sub: str) -> Subscription:
+        sub = Subscription(user_sub, asyncio.get_running_loop())
+        with self._lock:
+            self._subs.setdefault(user_sub, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            subs = self._subs.get(sub.user_sub)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.user_sub]
+
+    def publish(self, job_id: str, fields: Dict):
+        with self._lock:
+            user_sub = self._owners.get(job_id)
+            if fields.get("status") in TERMINAL:
+                self._owners.pop(job_id, None)
+            subs = list(self._subs.get(user_sub, ())) if user_sub else []
+        if subs:
+            event = {"job_id": job_id, **fields}
+            for sub in subs:
+                sub.push(event)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"tracked_jobs": len(self._owners),
+                    "streams": sum(len(s) for s in self._subs.values())}
+
+bus = JobEventBus()
+
+# ---- cross-process plumbing ----
+_worker_queue = None          # set in scheduler worker processes
+_parent_queue = None          # created lazily in the API process
+_parent_lock = threading.Lock()
+
+def _pump(q):
+    while True:
+        try:
+            job_id, fields = q.get()
+        except (EOFError, OSError):
+            return
+        bus.publish(job_id, fields)
+
+def worker_queue():
+    """Queue handed to scheduler workers via init_worker; starts the pump."""
+    global _parent_queue
+    with _parent_lock:
+        if _parent_queue is None:
+            _parent_queue = multiprocessing.get_context("spawn").Queue()
+            threading.Thread(target=_pump, args=(_parent_queue,), name="job-events-pump", daemon=True).start()
+    return _parent_queue
+
+def init_worker(q):
+    """ProcessPoolExecutor initializer: route emit() back to the API process."""
+    global _worker_queue
+    _worker_queue = q
+
+def emit(job_id: str, attrs: Dict):
+    """Publish the streamable part of a job update (no-op if nothing relevant)."""
+    fields = {k: attrs[k] for k in STREAM_FIELDS if k in attrs}
+    if "status" not in fields and "progress" not in fields:
+        return
+    fields = json.loads(json.dumps(fields, default=str))  # Decimal etc. -> plain JSON
+    if _worker_queue is not None:
+        try:
+            _worker_queue.put_nowait((job_id, fields))
+        except (queue.Full, OSError, ValueError):
+            pass
+    else:
+        bus.publish(job_id, fields)
+
+def track(job_id: str, user_sub: Optional[str]):
+    bus.track(job_id, user_sub or "")
@@ -0,0 +1,146 @@
+"""
+Cognito JWT verification with an in-memory JWKS and a verified-claims cache.
+
+- The JWKS is fetched once (warm() at startup) and refreshed in the
+  background every JWKS_REFRESH_INTERVAL seconds; an unknown `kid` triggers
+  an immediate refresh, rate-limited so forged kids can't hammer Cognito.
+- Verified claims are cached by sha256(token) until the token's `exp`, so a
+  polling client pays for one RS256 verify per token, not per request.
+
+Env knobs:
+  JWT_CACHE_MAX_ENTRIES=10000
+  JWKS_REFRESH_INTERVAL=3600     # seconds, background refresh
+  JWKS_MIN_REFRESH_INTERVAL=30   # seconds between unknown-kid refreshes
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import urllib.request
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import jwt
+
+logger = logging.getLogger("uvicorn.error")
+
+JWT_CACHE_MAX_ENTRIES = int(os.getenv("JWT_CACHE_MAX_ENTRIES", "10000"))
+JWKS_REFRESH_INTERVAL = int(os.getenv("JWKS_REFRESH_INTERVAL", "3600"))
+JWKS_MIN_REFRESH_INTERVAL = int(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "30"))
+
+class JWTVerifier:
+    def __init__(self, jwks_url: str, issuer: str, audience: Optional[str] = None):
+        self.jwks_url = jwks_url
+        self.issuer = issuer
+        self.audience = audience
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._keys_lock = threading.Lock()
+        self._last_fetch = 0.0
+        self._refresher: Optional[threading.Thread] = None
+        self._claims: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._claims_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.jwks_fetches = 0
+
+    # ---- JWKS ----
+    def _fetch_jwks(self):
+        with urllib.request.urlopen(self.jwks_url, timeout=5) as resp:
+            data = json.loads(resp.read())
+        keys = {k.key_id: k for k in jwt.PyJWKSet.from_dict(data).keys if k.key_id}
+        self._keys = keys
+        self._last_fetch = time.time()
+        self.jwks_fetches += 1
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(JWKS_REFRESH_INTERVAL)
+            try:
+                with self._keys_lock:
+                    self._fetch_jwks()
+            except Exception as e:
+                logger.warning("JWKS background refresh failed: %s", e)
+
+    def warm(self):
+        """Fetch the JWKS now and start the background refresher."""
+        with self._keys_lock:
+            self._fetch_jwks()
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name="jwks-refresh", daemon=True)
+                self._refresher.start()
+
+    def _signing_key(self, kid: str):
+        key = self._keys.get(kid)
+        if key is not None:
+            return key.key
+        with self._keys_lock:
+            # another thread may have refreshed while we waited
+            if kid not in self._keys and time.time() - self._last_fetch >= JWKS_MIN_REFRESH_INTERVAL:
+                self._fetch_jwks()
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown signing key kid={kid}")
+        return key.key
+
+    # ---- claims cache ----
+    def verify(self, token: str) -> Dict:
+        """Return verified claims; raises jwt.InvalidTokenError subclasses."""
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        now = time.time()
+        with self._claims_lock:
+            entry = self._claims.get(digest)
+            if entry is not None:
+                exp, claims = entry
+                if exp > now:
+                    self._claims.move_to_end(digest)
+                    self.hits += 1
+                    return claims
+                del self._claims[digest]
+            self.misses += 1
+
+        kid = jwt.get_unverified_header(token).get("kid", "")
+        options = {} if self.audience else {"verify_aud": False}
+        claims = jwt.decode(
+            token,
+            self._signing_key(kid),
+            algorithms=["RS256"],
+            audience=self.audience,
+            issuer=self.issuer,
+            options=options,
+        )
+
+        with self._claims_lock:
+            self._claims[digest] = (float(claims.get("exp", now)), claims)
+            while len(self._claims) > JWT_CACHE_MAX_ENTRIES:
+                self._claims.popitem(last=False)
+        return claims
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+            "cached_tokens": len(self._claims),
+            "jwks_keys": len(self._keys),
+            "jwks_fetches": self.jwks_fetches,
+        }
+
+_verifiers: Dict[Tuple[str, str, Optional[str]], JWTVerifier] = {}
+_verifiers_lock = threading.Lock()
+
+def verifier(jwks_url: str, issuer: str, audience: Optional[str] = None) -> JWTVerifier:
+    """One shared verifier per (jwks_url, issuer, audience)."""
+    key = (jwks_url, issuer, audience)
+    v = _verifiers.get(key)
+    if v is None:
+        with _verifiers_lock:
+            v = _verifiers.get(key)
+            if v is None:
+                v = _verifiers[key] = JWTVerifier(jwks_url, issuer, audience)
+    return v
+
+def stats() -> Dict:
+    return {v.issuer: v.stats() for v in list(_verifiers.values())}
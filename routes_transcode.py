@@ -1,24 +1,40 @@
-from typing import Optional
-from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException
+from typing import Optional, List
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
 from auth_cognito import require_jwt
-from db_videos import get as ddb_get
-from services_transcode import transcode_task
+from db_videos import get as ddb_get, update
+from services_transcode import enqueue_transcode, transcode_ladder_task, transcode_hls_task
+from transcode_scheduler import admit, source_estimate, source_duration
+import job_events
+from storage_s3 import presigned_get
+from ffmpeg_utils import DEFAULT_PRESET, normalize_presets
 
 router = APIRouter()
 
 class StartJobReq(BaseModel):
     s3_key: Optional[str] = None
     target_preset: Optional[str] = "480p"   # ["360p","480p","720p"]
+    target_presets: Optional[List[str]] = None   # ladder mode, e.g. ["360p","480p","720p"]
+    packaging: Optional[str] = None              # "hls": adaptive-streaming ladder instead of MP4 files
 
 @router.post("/jobs/{job_id}/start")
-def start_job(job_id: str, req: StartJobReq, bg: BackgroundTasks, user=Depends(require_jwt)):
+def start_job(job_id: str, req: StartJobReq, user=Depends(require_jwt)):
     item = ddb_get(job_id)
     if item.get("user_sub") != user.get("sub"):
         raise HTTPException(status_code=403, detail="Forbidden")
     input_key = req.s3_key or item.get("upload_key")
     if not input_key:
         raise HTTPException(status_code=400, detail="Missing s3_key; create job first")
-    bg.add_task(transcode_task, job_id, input_key, req.target_preset or "480p")
+    job_events.track(job_id, user.get("sub"))
+    duration = source_duration(job_id, item, presigned_get, update) if input_key == item.get("upload_key") else None
+    if req.target_presets:
+        presets = normalize_presets(req.target_presets)
+        if not presets:
+            raise HTTPException(status_code=400, detail="No valid presets in target_presets")
+        admit(transcode_hls_task if req.packaging == "hls" else transcode_ladder_task, job_id, input_key, presets,
+              user=user.get("sub", ""), **source_estimate(duration, presets))
+        job_events.emit(job_id, {"status": "queued"})
+        return {"ok": True, "message": "Processing started", "presets": presets, "packaging": req.packaging or "mp4"}
+    enqueue_transcode(job_id, input_key, req.target_preset or DEFAULT_PRESET, user.get("sub", ""), duration)
     return {"ok": True, "message": "Processing started"}
@@ -38,10 +38,17 @@ def get_job(job_id: str, user=Depends(require_jwt)):
     return item
 
 @router.get("/jobs/{job_id}/download-url")
-def get_download(job_id: str, user=Depends(require_jwt)):
+def get_download(job_id: str, preset: Optional[str] = None, user=Depends(require_jwt)):
     item = ddb_get(job_id)
     if item.get("user_sub") != user.get("sub"):
         raise HTTPException(status_code=403, detail="Forbidden")
     if item.get("status") != "done":
         raise HTTPException(status_code=400, detail=f"Job not done (status={item.get('status')})")
-    return {"url": presigned_get(item["output_key"])}
+    if not item.get("output_key") and item.get("hls_key"):
+        raise HTTPException(status_code=409, detail="HLS job; play it via /api/v1/hls/{job_id}/master.m3u8")
+    key = item["output_key"]
+    if preset:
+        key = (item.get("output_keys") or {}).get(preset)
+        if not key:
+            raise HTTPException(status_code=404, detail=f"No {preset} rendition for this job")
+    return {"url": presigned_get(key)}
@@ -0,0 +1,128 @@
+"""
+Streaming S3 input for ffmpeg.
+
+Instead of download_file() followed by ffmpeg, the source is fed to
+ffmpeg's stdin (`-i pipe:0`) by RangedReader, which keeps up to
+S3_RANGE_CONCURRENCY ranged GETs in flight ahead of the encoder. ffmpeg
+starts decoding as soon as the first chunk lands and nothing touches disk.
+
+A pipe can't seek, so MP4/MOV sources whose `moov` atom sits after `mdat`
+(no faststart) fall back to download-first, as does anything when
+TRANSCODE_STREAM_INPUT=0.
+
+Env knobs:
+  TRANSCODE_STREAM_INPUT=1
+  S3_RANGE_CHUNK_MB=8
+  S3_RANGE_CONCURRENCY=4
+"""
+import os
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+
+from ffmpeg_utils import probe_duration
+
+STREAM_INPUT = os.getenv("TRANSCODE_STREAM_INPUT", "1") == "1"
+RANGE_CHUNK = max(1, int(os.getenv("S3_RANGE_CHUNK_MB", "8"))) * 1024 * 1024
+RANGE_CONCURRENCY = int(os.getenv("S3_RANGE_CONCURRENCY", "4"))
+SNIFF_BYTES = 64 * 1024
+
+# top-level ISO BMFF / QuickTime boxes that can open a file
+_MP4_FIRST_BOXES = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot"}
+
+def _get_range(s3, bucket: str, key: str, start: int, end: int) -> bytes:
+    """Bytes [start, end] inclusive."""
+    return s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")["Body"].read()
+
+class RangedReader:
+    """
+    Iterate an S3 object in order as RANGE_CHUNK pieces fetched by concurrent
+    ranged GETs. At most `concurrency` chunks are buffered or in flight, so
+    memory stays bounded whatever the object size.
+    """
+    def __init__(self, s3, bucket: str, key: str, size: int, head: bytes = b"",
+                 chunk_size: int = RANGE_CHUNK, concurrency: int = RANGE_CONCURRENCY):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.head = head  # already-fetched prefix, sent first
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self.head:
+            yield self.head
+        offsets = iter(range(len(self.head), self.size, self.chunk_size))
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="s3-range")
+        window: deque = deque()
+
+        def fill():
+            while len(window) < self.concurrency:
+                start = next(offsets, None)
+                if start is None:
+                    return
+                end = min(start + self.chunk_size, self.size) - 1
+                window.append(pool.submit(_get_range, self.s3, self.bucket, self.key, start, end))
+
+        try:
+            fill()
+            while window:
+                data = window.popleft().result()
+                fill()
+                yield data
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+def needs_seek(s3, bucket: str, key: str, head: bytes, size: int) -> bool:
+    """
+    True for MP4/MOV files with `mdat` before `moov`: ffmpeg can't find the
+    index without seeking to the end. Walks top-level box headers only,
+    fetching the odd 16-byte header that lies past `head`.
+    """
+    if len(head) < 8 or head[4:8] not in _MP4_FIRST_BOXES:
+        return False  # not ISO BMFF; mkv/webm/ts/etc. demux fine from a pipe
+    offset = 0
+    while offset + 8 <= size:
+        hdr = head[offset:offset + 16]
+        if len(hdr) < 16:
+            hdr = _get_range(s3, bucket, key, offset, min(offset + 16, size) - 1)
+        box_size, box_type = struct.unpack(">I4s", hdr[:8])
+        if box_type in (b"moov", b"moof"):
+            return False
+        if box_type == b"mdat":
+            return True
+        if box_size == 1 and len(hdr) >= 16:
+            box_size = struct.unpack(">Q", hdr[8:16])[0]
+        if box_size < 8:
+            return True  # box runs to EOF (size 0) or is malformed: don't stream
+        offset += box_size
+    return True
+
+class SourceInput:
+    """
+    What to hand ffmpeg for one source: `arg` goes after -i; `feed` (if not
+    None) must be written to ffmpeg's stdin. duration is only known up front
+    for downloaded sources; streamed ones get it from ffmpeg's banner.
+    """
+    def __init__(self, arg: str, feed=None, duration: Optional[float] = None):
+        self.arg = arg
+        self.feed = feed
+        self.duration = duration
+
+    @property
+    def streamed(self) -> bool:
+        return self.feed is not None
+
+def open_source(s3, bucket: str, key: str, local_path: str) -> SourceInput:
+    """Stream the object into ffmpeg when its container allows, else download it to local_path."""
+    if STREAM_INPUT:
+        size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        if size > 0:
+            head = _get_range(s3, bucket, key, 0, min(SNIFF_BYTES, size) - 1)
+            if not needs_seek(s3, bucket, key, head, size):
+                return SourceInput("pipe:0", feed=RangedReader(s3, bucket, key, size, head=head))
+
+    s3.download_file(bucket, key, local_path)
+    return SourceInput(local_path, duration=probe_duration(local_path))
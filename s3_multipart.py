@@ -0,0 +1,127 @@
+"""
+S3 multipart upload helpers.
+
+MultipartWriter turns a byte stream into an S3 multipart upload: bytes are
+cut into PART_SIZE parts and uploaded by UPLOAD_CONCURRENCY threads while
+more data arrives. At most UPLOAD_CONCURRENCY parts are in flight plus one
+being filled, so memory per upload is bounded no matter how big the file is.
+
+Env knobs:
+  S3_PART_SIZE_MB=8          # >= 5 (S3 minimum for all but the last part)
+  S3_UPLOAD_CONCURRENCY=4
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PART_SIZE = max(5, int(os.getenv("S3_PART_SIZE_MB", "8"))) * 1024 * 1024
+UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "4"))
+
+class MultipartWriter:
+    def __init__(self, s3, bucket: str, key: str, content_type: str = "application/octet-stream",
+                 part_size: int = PART_SIZE, concurrency: int = UPLOAD_CONCURRENCY):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)["UploadId"]
+        self.bytes_written = 0
+        self._buf = bytearray()
+        self._next_part = 1
+        self._futures: List[Future] = []
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="s3-part")
+
+    def write(self, data: bytes):
+        """Buffer data; blocks (backpressure) while all upload slots are busy."""
+        self._buf.extend(data)
+        self.bytes_written += len(data)
+        while len(self._buf) >= self.part_size:
+            self._submit(bytes(self._buf[:self.part_size]))
+            del self._buf[:self.part_size]
+
+    def _submit(self, body: bytes):
+        self._slots.acquire()
+        for f in self._futures:
+            if f.done() and f.exception() is not None:
+                self._slots.release()
+                raise f.exception()  # a part already failed; stop feeding a doomed upload
+        n = self._next_part
+        self._next_part += 1
+        self._futures.append(self._pool.submit(self._upload_part, n, body))
+
+    def _upload_part(self, n: int, body: bytes) -> Dict:
+        try:
+            resp = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                       PartNumber=n, Body=body)
+            return {"PartNumber": n, "ETag": resp["ETag"]}
+        finally:
+            self._slots.release()
+
+    def close(self) -> Dict:
+        """Flush the last (short) part and complete the upload."""
+        try:
+            if self._buf or self._next_part == 1:
+                self._submit(bytes(self._buf))
+                self._buf.clear()
+            parts = [f.result() for f in self._futures]
+            return self.s3.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])},
+            )
+        finally:
+            self._pool.shutdown(wait=False)
+
+    def abort(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        try:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        except Exception:
+            pass
+
+# ======== browser-direct multipart (presigned parts) ========
+MAX_PARTS = 10000
+MAX_OBJECT_SIZE = 5 * 1024 ** 4  # 5 TiB
+MULTIPART_URL_EXPIRES = int(os.getenv("S3_MULTIPART_URL_EXPIRES", "3600"))
+
+def plan_parts(size: int, part_size: int = PART_SIZE) -> Tuple[int, int]:
+    """(part_size, part_count) for an object of `size` bytes within S3's limits."""
+    if size <= 0 or size > MAX_OBJECT_SIZE:
+        raise ValueError(f"size must be between 1 byte and 5 TiB, got {size}")
+    part_size = max(part_size, 5 * 1024 * 1024, -(-size // MAX_PARTS))
+    return part_size, -(-size // part_size)
+
+def presign_parts(s3, bucket: str, key: str, upload_id: str, part_numbers: Iterable[int],
+                  expires: int = MULTIPART_URL_EXPIRES) -> List[Dict]:
+    return [
+        {"part_number": n, "url": s3.generate_presigned_url(
+            "upload_part",
+            Params={"Bucket": bucket, "Key": key, "UploadId": upload_id, "PartNumber": n},
+            ExpiresIn=expires,
+        )}
+        for n in part_numbers
+    ]
+
+def list_parts(s3, bucket: str, key: str, upload_id: str) -> List[Dict]:
+    """Every part S3 has received so far (follows ListParts pagination)."""
+    parts, marker = [], 0
+    while True:
+        resp = s3.list_parts(Bucket=bucket, Key=key, UploadId=upload_id, PartNumberMarker=marker)
+        parts += [{"PartNumber": p["PartNumber"], "ETag": p["ETag"], "Size": p["Size"]} for p in resp.get("Parts", [])]
+        if not resp.get("IsTruncated"):
+            return parts
+        marker = resp["NextPartNumberMarker"]
+
+def complete(s3, bucket: str, key: str, upload_id: str, parts: Optional[List[Dict]] = None) -> Dict:
+    """
+    Complete the upload. Without an explicit part list the ETags come from
+    ListParts, so browsers don't need the ETag header exposed via CORS.
+    """
+    if parts is None:
+        parts = list_parts(s3, bucket, key, upload_id)
+    return s3.complete_multipart_upload(
+        Bucket=bucket, Key=key, UploadId=upload_id,
+        MultipartUpload={"Parts": sorted(({"PartNumber": p["PartNumber"], "ETag": p["ETag"]} for p in parts),
+                                         key=lambda p: p["PartNumber"])},
+    )
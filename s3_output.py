@@ -0,0 +1,79 @@
+"""
+Encoder outputs that upload while ffmpeg is still encoding.
+
+With TRANSCODE_STREAM_OUTPUT=1 (default) each output is written as
+fragmented MP4 to a pipe and fed to a MultipartWriter, so parts reach S3
+during the encode and the multipart upload completes as soon as ffmpeg
+exits: no upload tail and no output file in /tmp. With it off, outputs go
+to local files and are uploaded afterwards with upload_file, as before.
+
+    outs = OutputSet(s3, bucket, {"480p": ("/tmp/j/480p.mp4", "outputs/j/480p.mp4")})
+    rc, logs = run_with_progress([..., *outs.format_args, outs.arg("480p")], ..., sinks=outs.sinks)
+    if not outs.finish(rc): ...
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+import s3_multipart
+from ffmpeg_utils import FRAGMENTED_MP4_ARGS, SINK_PREFIX
+
+STREAM_OUTPUT = os.getenv("TRANSCODE_STREAM_OUTPUT", "1") == "1"
+
+class OutputSet:
+    def __init__(self, s3, bucket: str, targets: Dict[str, Tuple[str, str]],
+                 content_type: str = "video/mp4", stream: Optional[bool] = None):
+        """targets = {name: (local_path, s3_key)}"""
+        self.s3 = s3
+        self.bucket = bucket
+        self.targets = targets
+        self.streamed = STREAM_OUTPUT if stream is None else stream
+        self.writers: Dict[str, s3_multipart.MultipartWriter] = {}
+        if self.streamed:
+            try:
+                for name, (_, key) in targets.items():
+                    self.writers[name] = s3_multipart.MultipartWriter(s3, bucket, key, content_type)
+            except Exception:
+                self.abort()
+                raise
+
+    def arg(self, name: str) -> str:
+        """ffmpeg output argument for `name`."""
+        return SINK_PREFIX + name if self.streamed else self.targets[name][0]
+
+    @property
+    def format_args(self) -> List[str]:
+        return FRAGMENTED_MP4_ARGS if self.streamed else []
+
+    @property
+    def sinks(self) -> Optional[Dict]:
+        return {name: w.write for name, w in self.writers.items()} or None
+
+    def keys(self) -> Dict[str, str]:
+        return {name: key for name, (_, key) in self.targets.items()}
+
+    def finish(self, rc: int) -> bool:
+        """
+        Complete (or, after a failed encode, abort) the uploads. Returns False
+        if the encode failed; S3 errors while completing are raised.
+        """
+        if self.streamed:
+            if rc != 0:
+                self.abort()
+                return False
+            try:
+                for w in self.writers.values():
+                    w.close()
+            except Exception:
+                self.abort()
+                raise
+            return True
+
+        if rc != 0 or not all(os.path.exists(path) for path, _ in self.targets.values()):
+            return False
+        for path, key in self.targets.values():
+            self.s3.upload_file(path, self.bucket, key)
+        return True
+
+    def abort(self):
+        for w in self.writers.values():
+            w.abort()
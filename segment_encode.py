@@ -0,0 +1,241 @@
+"""
+Split / encode / concat for long sources.
+
+One ffmpeg run keeps only its -threads worth of cores busy, however long
+the video is. For sources of SEGMENT_MIN_DURATION seconds or more the
+video is instead cut at keyframes into ~SEGMENT_SECONDS chunks, each chunk
+is encoded by its own ffmpeg process (SEGMENT_WORKERS at a time, enough
+to fill the cores by default), the audio is encoded
+once alongside them, and the pieces are joined with the concat demuxer
+(stream copy, no re-encode).
+
+Every process reads the source straight from a presigned S3 URL and seeks
+to its own chunk with HTTP range requests, so nothing is downloaded up
+front and moov-at-end files work too.
+
+With a SegmentCheckpoint, finished chunks (and the audio pass) are also
+copied to S3 as they complete, and a rerun of the same job restores them
+instead of encoding them again. Give the checkpoint prefix an S3
+lifecycle expiry so abandoned jobs don't accumulate.
+
+Env knobs:
+  SEGMENT_ENCODE=1
+  SEGMENT_MIN_DURATION=300          # seconds
+  SEGMENT_SECONDS=60                # target chunk length
+  SEGMENT_WORKERS=cores/encoder threads
+  SEGMENT_URL_EXPIRES=21600         # presigned source URL lifetime
+  SEGMENT_CHECKPOINT=1              # callers may persist finished chunks
+"""
+import os
+import time
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from ffmpeg_utils import FFMPEG_THREADS, PROGRESS_MIN_DELTA, PROGRESS_MIN_INTERVAL, probe_duration, run_with_progress
+
+SEGMENT_ENCODE = os.getenv("SEGMENT_ENCODE", "1") == "1"
+SEGMENT_MIN_DURATION = float(os.getenv("SEGMENT_MIN_DURATION", "300"))
+SEGMENT_SECONDS = float(os.getenv("SEGMENT_SECONDS", "60"))
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", "0"))  # 0: cores / threads per chunk encode
+SEGMENT_URL_EXPIRES = int(os.getenv("SEGMENT_URL_EXPIRES", "21600"))
+SEGMENT_CHECKPOINT = os.getenv("SEGMENT_CHECKPOINT", "1") == "1"
+
+def workers_for(video_args: Sequence[str]) -> int:
+    """Chunk encodes to run at once so their -threads add up to the cores."""
+    if SEGMENT_WORKERS:
+        return SEGMENT_WORKERS
+    args = list(video_args)
+    threads = next((int(args[i + 1]) for i, a in enumerate(args[:-1]) if a.split(":")[0] == "-threads"), FFMPEG_THREADS)
+    return max(1, (os.cpu_count() or 1) // max(1, threads))
+
+def worth_segmenting(duration: Optional[float]) -> bool:
+    return SEGMENT_ENCODE and bool(duration) and duration >= SEGMENT_MIN_DURATION
+
+def long_source(src: str) -> Optional[float]:
+    """The source duration if it is long enough to be worth segmenting, else None."""
+    if not SEGMENT_ENCODE:
+        return None
+    duration = probe_duration(src)
+    return duration if worth_segmenting(duration) else None
+
+def keyframe_cuts(src: str, duration: float, seconds: float = SEGMENT_SECONDS) -> List[float]:
+    """
+    Chunk boundaries [0, k1, ..., duration] where each k is a video keyframe
+    near a multiple of `seconds`. One ffprobe call seeks to every target and
+    reads a few packets there, rather than scanning the whole file. If
+    probing fails this is [0, duration], i.e. a single chunk.
+    """
+    targets = [seconds * i for i in range(1, int(duration // seconds) + 1) if seconds * i < duration]
+    if not targets:
+        return [0.0, duration]
+    intervals = ",".join(f"{t:.3f}%+#5" for t in targets)
+    try:
+        p = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-read_intervals", intervals,
+             "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", src],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=120,
+        )
+        lines = p.stdout.splitlines()
+    except (OSError, subprocess.SubprocessError):
+        lines = []
+
+    keys = set()
+    for line in lines:
+        pts, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                keys.add(float(pts))
+            except ValueError:
+                pass
+    # all-intra sources make every packet a keyframe: keep cuts at least half a chunk apart
+    cuts = [0.0]
+    for k in sorted(keys):
+        if k - cuts[-1] >= seconds / 2 and duration - k >= seconds / 2:
+            cuts.append(k)
+    return cuts + [duration]
+
+def has_audio(src: str) -> bool:
+    try:
+        p = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=index", "-of", "csv=p=0", src],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=60,
+        )
+        return bool(p.stdout.strip())
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+class SegmentCheckpoint:
+    """
+    Finished chunks of one job under s3://bucket/prefix/. Names carry the
+    chunk's time range, so a different cut plan never restores the wrong
+    piece. Saving is best effort: a failed upload only costs a re-encode.
+    """
+    def __init__(self, s3, bucket: str, prefix: str):
+        self.s3, self.bucket, self.prefix = s3, bucket, prefix.rstrip("/")
+        self.saved = set()
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=self.prefix + "/"):
+            self.saved.update(o["Key"] for o in page.get("Contents", []))
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}/{name}"
+
+    def restore(self, name: str, path: str) -> bool:
+        if self._key(name) not in self.saved:
+            return False
+        try:
+            self.s3.download_file(self.bucket, self._key(name), path)
+            return True
+        except Exception:
+            return False
+
+    def save(self, name: str, path: str):
+        try:
+            self.s3.upload_file(path, self.bucket, self._key(name))
+            self.saved.add(self._key(name))
+        except Exception:
+            pass
+
+    def clear(self):
+        """Drop the checkpoint once the job's output is safely stored."""
+        keys = sorted(self.saved)
+        for i in range(0, len(keys), 1000):
+            self.s3.delete_objects(Bucket=self.bucket,
+                                   Delete={"Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True})
+        self.saved.clear()
+
+class _Progress:
+    """Sum per-chunk progress into one job-level percentage, throttled like run_with_progress."""
+    def __init__(self, weights: List[float], on_progress: Callable[[float], None]):
+        self.total = sum(weights) or 1.0
+        self.weights = weights
+        self.done = [0.0] * len(weights)
+        self.on_progress = on_progress
+        self._lock = threading.Lock()
+        self._last_t, self._last_pct = 0.0, 0.0
+
+    def update(self, i: int, pct: float):
+        with self._lock:
+            self.done[i] = self.weights[i] * pct / 100
+            overall = min(99.0, sum(self.done) / self.total * 100)  # 100 is reported after the concat
+            now = time.monotonic()
+            if now - self._last_t < PROGRESS_MIN_INTERVAL or overall - self._last_pct < PROGRESS_MIN_DELTA:
+                return
+            self._last_t, self._last_pct = now, overall
+        self.on_progress(overall)
+
+def encode_segmented(src: str, duration: float, video_args: Sequence[str], audio_args: Sequence[str],
+                     work_dir: str, output: str, output_args: Sequence[str],
+                     on_progress: Callable[[float], None], sinks: Optional[Dict] = None,
+                     workers: Optional[int] = None,
+                     checkpoint: Optional[SegmentCheckpoint] = None) -> Tuple[int, str]:
+    """
+    Encode `src` to `output` in parallel keyframe-aligned chunks.
+    video_args: everything between the input and the chunk file for the
+    video encode (filters + codec). work_dir holds the chunks and is
+    removed afterwards, so it must not contain `output`. Same (rc, logs)
+    contract and sinks/output_args handling as run_with_progress.
+
+    If interrupted (an exception in the calling thread), chunks not yet
+    started are dropped and running ones finish, so with a checkpoint
+    they are kept for the next attempt.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    cuts = keyframe_cuts(src, duration)
+    chunks = list(zip(cuts, cuts[1:]))
+    audio = has_audio(src)
+    progress = _Progress([end - start for start, end in chunks], on_progress)
+
+    def checkpointed(name: str, path: str, encode: Callable[[], Tuple[int, str]]) -> Tuple[int, str]:
+        if checkpoint and checkpoint.restore(name, path):
+            return 0, ""
+        rc, logs = encode()
+        if rc == 0 and checkpoint:
+            checkpoint.save(name, path)
+        return rc, logs
+
+    def encode_chunk(i: int) -> Tuple[int, str]:
+        start, end = chunks[i]
+        path = f"{work_dir}/seg_{i:05d}.mp4"
+        cmd = ["ffmpeg", "-y", "-ss", f"{start:.6f}", "-i", src, "-t", f"{end - start:.6f}",
+               "-map", "0:v:0", "-an", *video_args, path]
+        rc, logs = checkpointed(f"seg_{i:05d}_{start:.3f}-{end:.3f}.mp4", path,
+                                lambda: run_with_progress(cmd, end - start, lambda pct: progress.update(i, pct)))
+        if rc == 0:
+            progress.update(i, 100.0)  # restored chunks count as done too
+        return rc, logs
+
+    def encode_audio() -> Tuple[int, str]:
+        path = f"{work_dir}/audio.m4a"
+        return checkpointed(f"audio_{duration:.3f}.m4a", path, lambda: run_with_progress(
+            ["ffmpeg", "-y", "-i", src, "-map", "0:a:0", "-vn", *audio_args, path], duration, lambda pct: None))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers or workers_for(video_args), thread_name_prefix="segment") as pool:
+            # threads only wait on ffmpeg child processes; those do the encoding in parallel.
+            # audio is one full-length pass, so start it first rather than behind every chunk
+            futures = [pool.submit(encode_audio)] if audio else []
+            futures += [pool.submit(encode_chunk, i) for i in range(len(chunks))]
+            try:
+                for f in futures:
+                    rc, logs = f.result()
+                    if rc != 0:
+                        for other in futures:
+                            other.cancel()
+                        return rc, logs
+            except BaseException:
+                for other in futures:
+                    other.cancel()
+                raise
+
+        with open(f"{work_dir}/segments.txt", "w") as fh:
+            fh.writelines(f"file '{work_dir}/seg_{i:05d}.mp4'\n" for i in range(len(chunks)))
+        cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", f"{work_dir}/segments.txt"]
+        if audio:
+            cmd += ["-i", f"{work_dir}/audio.m4a", "-map", "0:v", "-map", "1:a"]
+        cmd += ["-c", "copy", *output_args, output]
+        return run_with_progress(cmd, duration, lambda pct: on_progress(pct) if pct >= 100 else None, sinks=sinks)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
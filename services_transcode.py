@@ -1,42 +1,205 @@
+"""
+Transcode task entry points and their admission.
+
+The scheduler runs these in spawned worker processes, which import this
+module (not app.py) to unpickle them, so nothing here may have import-time
+side effects: no .env loading, no Cognito client, no FastAPI app.
+"""
 import os
 import time
+import logging
+import shutil
 import subprocess
+from typing import Dict, List, Optional
+from decimal import Decimal
 from botocore.exceptions import ClientError
 from db_videos import update
-from storage_s3 import download_file, upload_file
+import transcode_cache
+import job_events
+import s3_input
+import s3_output
+import segment_encode
+import hls_package
+from transcode_scheduler import admit, source_estimate
+from config import S3_BUCKET
+from storage_s3 import presigned_get, client as s3_client
+from ffmpeg_utils import AUDIO_ARGS, scale_filter, video_args, ladder_cmd, run_with_progress
+
+logger = logging.getLogger("uvicorn.error")
 
 def _run(cmd: list) -> tuple[int, str]:
     p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
     return p.returncode, p.stdout
 
-def transcode_task(job_id: str, input_key: str, preset: str = "480p"):
+def _progress_reporter(job_id: str):
+    def report(pct: float):
+        try:
+            update(job_id, progress=int(pct), progress_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+        except Exception:
+            pass  # progress is best effort; never fail the encode over it
+    return report
+
+def _run_tracked(job_id: str, src: s3_input.SourceInput, cmd: list, sinks: Optional[Dict] = None) -> tuple[int, str]:
+    """_run, with ffmpeg progress written to the job record as it encodes (src fed to stdin, outputs to sinks)."""
+    return run_with_progress(cmd, src.duration, _progress_reporter(job_id), stdin=src.feed, sinks=sinks)
+
+def transcode_task(job_id: str, input_key: str, preset: str = "480p", duration: Optional[float] = None) -> Optional[str]:
     """
-    Download from S3 -> FFmpeg transcode -> upload to S3 -> update DynamoDB.
+    Stream (or download) from S3 -> FFmpeg transcode, uploading as it encodes -> update DynamoDB.
+    duration is the stored source duration admission was costed with; only
+    then is a long source segmented. Returns the output key, or None on error.
     """
     try:
-        update(job_id, status="processing", started_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+        update(job_id, status="processing", progress=0, started_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
 
         base = f"/tmp/{job_id}"
         os.makedirs(base, exist_ok=True)
         in_path = f"{base}/input"
         out_path = f"{base}/output.mp4"
 
-        download_file(input_key, in_path)
+        output_key = f"outputs/{job_id}/output.mp4"
 
-        vf = {"360p": "scale=-2:360", "480p": "scale=-2:480", "720p": "scale=-2:720"}.get(preset, "scale=-2:480")
-        rc, logs = _run([
-            "ffmpeg", "-y", "-i", in_path, "-vf", vf,
-            "-c:v", "libx264", "-preset", "veryfast", "-crf", "26",
-            "-c:a", "aac", out_path
-        ])
-        if rc != 0 or not os.path.exists(out_path):
+        outs = s3_output.OutputSet(s3_client(), S3_BUCKET, {"output": (out_path, output_key)})
+        try:
+            if segment_encode.worth_segmenting(duration):
+                # long source: keyframe-aligned chunks encoded in parallel, then concatenated
+                src_url = presigned_get(input_key, segment_encode.SEGMENT_URL_EXPIRES)
+                rc, logs = segment_encode.encode_segmented(
+                    src_url, duration, ["-vf", scale_filter(preset), *video_args(preset)], AUDIO_ARGS,
+                    f"{base}/segments", outs.arg("output"), outs.format_args,
+                    _progress_reporter(job_id), sinks=outs.sinks)
+            else:
+                src = s3_input.open_source(s3_client(), S3_BUCKET, input_key, in_path)
+                rc, logs = _run_tracked(job_id, src, [
+                    "ffmpeg", "-y", "-i", src.arg, "-vf", scale_filter(preset),
+                    *video_args(preset), *AUDIO_ARGS, *outs.format_args, outs.arg("output")
+                ], sinks=outs.sinks)
+                if duration is None and src.duration:
+                    update(job_id, source_duration=Decimal(str(round(src.duration, 3))))
+        except Exception:
+            outs.abort()
+            raise
+        if not outs.finish(rc):
             update(job_id, status="error", error_message=f"ffmpeg failed rc={rc}", logs=logs[-1000:])
+            return None
+
+        update(job_id, status="done", output_key=output_key, updated_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+        return output_key
+    except ClientError as e:
+        update(job_id, status="error", error_message=str(e))
+    except Exception as e:
+        update(job_id, status="error", error_message=f"unexpected: {e}")
+    return None
+
+def enqueue_transcode(job_id: str, input_key: str, preset: str = "480p", user_sub: str = "",
+                      duration: Optional[float] = None):
+    """
+    Admit transcode_task to the bounded scheduler behind the content-addressed
+    cache (see transcode_cache.py), fair-shared across user_sub and costed by
+    the stored source duration. Raises 429 when the queue is full.
+    """
+    s3 = s3_client()
+    try:
+        digest = transcode_cache.cache_key(transcode_cache.source_hash(s3, S3_BUCKET, input_key), preset)
+    except ClientError as e:
+        logger.warning("cache key failed for %s, encoding uncached: %s", job_id, e)
+        digest = None
+
+    if digest:
+        cached = transcode_cache.lookup(s3, S3_BUCKET, digest)
+        if cached:
+            update(job_id, status="done", output_key=cached, cache_hit=True,
+                   updated_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
             return
 
-        output_key = f"outputs/{job_id}/output.mp4"
-        upload_file(out_path, output_key)
+    fut, shared = admit(transcode_task, job_id, input_key, preset, duration, key=digest,
+                        user=user_sub, **source_estimate(duration, [preset]))
+    job_events.emit(job_id, {"status": "queued"})
+    if shared:
+        fut.add_done_callback(lambda f: _finish_coalesced(job_id, f))
+    elif digest:
+        fut.add_done_callback(lambda f: _remember_output(digest, f))
 
-        update(job_id, status="done", output_key=output_key, updated_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+def _remember_output(digest: str, fut):
+    try:
+        output_key = fut.result()
+        if output_key:
+            transcode_cache.remember(s3_client(), S3_BUCKET, digest, output_key)
+    except Exception as e:
+        logger.warning("could not record cache entry %s: %s", digest, e)
+
+def _finish_coalesced(job_id: str, fut):
+    """A duplicate request that rode on another job's encode."""
+    try:
+        output_key = fut.result()
+    except Exception:
+        output_key = None
+    if output_key:
+        update(job_id, status="done", output_key=output_key, cache_hit=True,
+               updated_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+    else:
+        update(job_id, status="error", error_message="coalesced transcode failed")
+
+def transcode_ladder_task(job_id: str, input_key: str, presets: List[str]):
+    """
+    Ladder mode: one read of the source, one decode, one ffmpeg run for all presets.
+    Renditions are uploaded to outputs/{job_id}/{preset}.mp4.
+    """
+    try:
+        update(job_id, status="processing", progress=0, started_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+
+        base = f"/tmp/{job_id}"
+        os.makedirs(base, exist_ok=True)
+        in_path = f"{base}/input"
+
+        src = s3_input.open_source(s3_client(), S3_BUCKET, input_key, in_path)
+        outs = s3_output.OutputSet(s3_client(), S3_BUCKET,
+                                   {p: (f"{base}/{p}.mp4", f"outputs/{job_id}/{p}.mp4") for p in presets})
+        try:
+            rc, logs = _run_tracked(job_id, src, ladder_cmd(src.arg, {p: outs.arg(p) for p in presets}, outs.format_args),
+                                    sinks=outs.sinks)
+        except Exception:
+            outs.abort()
+            raise
+        if not outs.finish(rc):
+            update(job_id, status="error", error_message=f"ffmpeg failed rc={rc}", logs=logs[-1000:])
+            return
+
+        output_keys = outs.keys()
+
+        update(job_id, status="done", output_key=output_keys[presets[-1]], output_keys=output_keys,
+               updated_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+    except ClientError as e:
+        update(job_id, status="error", error_message=str(e))
+    except Exception as e:
+        update(job_id, status="error", error_message=f"unexpected: {e}")
+
+def transcode_hls_task(job_id: str, input_key: str, presets: List[str]):
+    """
+    HLS mode: every preset packaged as an HLS rendition in one ffmpeg run,
+    uploaded under outputs/{job_id}/hls/ (see hls_package.py).
+    """
+    try:
+        update(job_id, status="processing", progress=0, started_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+
+        base = f"/tmp/{job_id}"
+        out_dir = f"{base}/hls"
+        for p in presets:
+            os.makedirs(f"{out_dir}/{p}", exist_ok=True)
+
+        audio = segment_encode.has_audio(presigned_get(input_key))
+        src = s3_input.open_source(s3_client(), S3_BUCKET, input_key, f"{base}/input")
+        rc, logs = _run_tracked(job_id, src, hls_package.hls_cmd(src.arg, presets, out_dir, audio))
+        if rc != 0 or not os.path.exists(f"{out_dir}/{hls_package.MASTER}"):
+            update(job_id, status="error", error_message=f"ffmpeg failed rc={rc}", logs=logs[-1000:])
+            return
+
+        prefix = hls_package.hls_prefix(job_id)
+        hls_package.upload_dir(s3_client(), S3_BUCKET, out_dir, prefix)
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+        update(job_id, status="done", hls_key=f"{prefix}/{hls_package.MASTER}", hls_presets=presets,
+               updated_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
     except ClientError as e:
         update(job_id, status="error", error_message=str(e))
     except Exception as e:
@@ -11,6 +11,13 @@ resource "aws_lb_target_group" "app_tg" {
   port     = 80
   protocol = "HTTP"
   vpc_id   = aws_vpc.this.id
+  # job status events are routed in-process (job_events.py): keep a browser's
+  # /api/v1/events stream on the instance that accepted its transcodes
+  stickiness {
+    type            = "lb_cookie"
+    cookie_duration = 86400
+    enabled         = true
+  }
   health_check {
     path                = "/"
     matcher             = "200-399"
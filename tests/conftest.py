@@ -0,0 +1,60 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+import pymemcache.test.utils  # noqa: E402
+from pymemcache.test.utils import MockMemcacheClient  # noqa: E402
+
+import aws_clients  # noqa: E402
+import cache_mem  # noqa: E402
+import ddb_schema  # noqa: E402
+
+
+class FakeClock:
+    """Stands in for the time module: time() and monotonic() move only on advance()."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def memcache(monkeypatch, clock):
+    """cache_mem against an in-memory memcached, fresh L1, on the fake clock."""
+    client = MockMemcacheClient()
+    monkeypatch.setattr(pymemcache.test.utils, "time", clock)
+    monkeypatch.setattr(cache_mem, "time", clock)
+    monkeypatch.setattr(cache_mem, "_client", client)
+    monkeypatch.setattr(cache_mem, "_down_until", 0.0)
+    monkeypatch.setattr(cache_mem, "_l1", cache_mem._LRU(cache_mem.CACHE_L1_MAX_ENTRIES, cache_mem.CACHE_L1_MAX_BYTES))
+    return client
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """moto in place of AWS, with the shared client registry and schema cache reset."""
+    moto = pytest.importorskip("moto")
+    for k, v in {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing", "AWS_REGION": "us-east-1"}.items():
+        monkeypatch.setenv(k, v)
+    monkeypatch.delenv("AWS_SESSION_TOKEN", raising=False)
+    monkeypatch.setattr(aws_clients, "_session", None)
+    monkeypatch.setattr(aws_clients, "_clients", {})
+    monkeypatch.setattr(aws_clients, "_tables", {})
+    monkeypatch.setattr(ddb_schema, "_schemas", {})
+    with moto.mock_aws():
+        yield
@@ -0,0 +1,181 @@
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import app
+import aws_clients
+import db_videos
+import job_cache
+import segment_encode
+import services_transcode
+import storage_s3
+import transcode_cache
+import transcode_scheduler
+
+BUCKET = "test-bucket"
+MiB = 1024 * 1024
+
+
+@pytest.fixture
+def api(aws, monkeypatch):
+    """The API on moto: a jobs table keyed like production ("qut-username"), one bucket, user alice."""
+    monkeypatch.setenv("DDB_TABLE_NAME", "jobs")
+    for module in (app, services_transcode, storage_s3):
+        monkeypatch.setattr(module, "S3_BUCKET", BUCKET)
+    monkeypatch.setattr(job_cache, "JOB_CACHE", False)
+    aws_clients.client("dynamodb").create_table(
+        TableName="jobs", BillingMode="PAY_PER_REQUEST",
+        KeySchema=[{"AttributeName": "qut-username", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "qut-username", "AttributeType": "S"}])
+    aws_clients.s3().create_bucket(Bucket=BUCKET)
+    app.app.dependency_overrides[app.require_jwt] = lambda: {"sub": "alice"}
+    yield TestClient(app.app)
+    app.app.dependency_overrides.clear()
+
+
+def new_job(job_id="j1", **attrs):
+    db_videos.put_item({"job_id": job_id, "user_sub": "alice", "status": "created",
+                        "upload_key": f"uploads/{job_id}/in.mp4", **attrs})
+
+
+def test_multipart_resume_reads_back_what_init_wrote(api):
+    new_job()
+    started = api.post("/jobs/j1/multipart", json={"size": 12 * MiB}).json()
+    resumed = api.get("/jobs/j1/multipart")
+    assert resumed.status_code == 200
+    assert resumed.json()["upload_id"] == started["upload_id"]
+    assert resumed.json()["part_count"] == started["part_count"] == 2
+    assert db_videos.load("j1")["status"] == "uploading"
+
+
+def test_multipart_init_aborts_when_the_record_cant_be_written(api, monkeypatch):
+    new_job()
+
+    def fail(job_id, **attrs):
+        raise RuntimeError("dynamodb down")
+    monkeypatch.setattr(app, "ddb_update", fail)
+    assert api.post("/jobs/j1/multipart", json={"size": 12 * MiB}).status_code == 500
+    assert not aws_clients.s3().list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+
+
+def test_cached_output_pointer_is_what_status_reads(api, memcache, clock, monkeypatch):
+    monkeypatch.setattr(job_cache, "JOB_CACHE", True)
+    new_job()
+    assert api.get("/api/v1/status/j1").json()["status"] == "created"  # now cached
+
+    # a repeat encode: the transcode cache already has the output
+    monkeypatch.setattr(transcode_cache, "source_hash", lambda s3, bucket, key: "h")
+    monkeypatch.setattr(transcode_cache, "lookup", lambda s3, bucket, digest: "outputs/j0/output.mp4")
+    app.enqueue_transcode("j1", "uploads/j1/in.mp4", "480p", "alice")
+
+    clock.advance(job_cache.JOB_CACHE_HOLDOFF + 1)
+    assert api.get("/api/v1/status/j1").json()["status"] == "done"
+    assert app.ddb_get("j1")["output_key"] == "outputs/j0/output.mp4"
+    assert app.ddb_get("j1") == db_videos.load("j1")
+
+
+def test_scheduled_tasks_come_from_the_task_module():
+    for task in (app.transcode_task, app.transcode_ladder_task, app.transcode_hls_task):
+        assert task.__module__ == "services_transcode"
+
+
+def test_event_stream_opens_with_a_ticket_not_the_jwt(api, monkeypatch):
+    ticket = api.post("/api/v1/events/ticket").json()["ticket"]
+    no_header = SimpleNamespace(headers={})
+    assert app.require_stream_ticket(no_header, ticket=ticket) == {"sub": "alice"}
+    for bad in ("bob" + ticket[len("alice"):], "test-dev-token"):
+        with pytest.raises(HTTPException) as e:
+            app.require_stream_ticket(no_header, ticket=bad)
+        assert e.value.status_code == 401
+    monkeypatch.setattr(app, "STREAM_TICKET_TTL", -1)
+    with pytest.raises(HTTPException, match="expired"):
+        app.require_stream_ticket(no_header, ticket=app.issue_stream_ticket("alice"))
+
+
+def test_upload_stores_the_probed_duration(api, monkeypatch):
+    monkeypatch.setattr(transcode_scheduler, "probe_source", lambda url: {"duration": 1234.5, "height": 1080})
+    r = api.post("/api/v1/upload", files={"file": ("in.mp4", b"\0" * 1024, "video/mp4")})
+    job_id = r.json()["video_id"]
+    for _ in range(100):
+        if db_videos.load(job_id).get("source_duration"):
+            break
+        time.sleep(0.02)
+    item = db_videos.load(job_id)
+    assert float(item["source_duration"]) == 1234.5 and item["source_height"] == 1080
+
+
+@pytest.mark.parametrize("duration, segmented", [(1800.0, True), (60.0, False)])
+def test_transcode_segments_long_sources(api, monkeypatch, duration, segmented):
+    new_job()
+    aws_clients.s3().put_object(Bucket=BUCKET, Key="uploads/j1/in.mp4", Body=b"\0" * 1024)
+    monkeypatch.setattr(transcode_scheduler, "probe_source", lambda url: {"duration": duration, "height": 1080})
+    monkeypatch.setattr(app, "parse_auth_sub", lambda authorization: "alice" if authorization else "")
+    monkeypatch.setattr(transcode_scheduler, "TRANSCODE_CORES", 16)
+    admitted = []
+
+    def admit(fn, *args, **kwargs):
+        admitted.append((fn, args, kwargs))
+        return Future(), False
+    monkeypatch.setattr(services_transcode, "admit", admit)
+    r = api.post("/api/v1/transcode", json={"video_id": "j1", "resolution": "720p"},
+                 headers={"Authorization": "Bearer t"})
+    assert r.status_code == 200
+
+    fn, args, kwargs = admitted[0]
+    assert (fn, args[-1]) == (services_transcode.transcode_task, duration)
+    assert (kwargs["threads"] == 16) == segmented  # a segmented encode reserves every core
+
+    # run the admitted task: the long source takes the segment-parallel path
+    encodes = []
+
+    def whole_file(*a, **k):
+        encodes.append("whole file")
+        raise RuntimeError("no ffmpeg here")
+    monkeypatch.setattr(segment_encode, "encode_segmented", lambda src, d, *a, **k: encodes.append(d) or (1, ""))
+    monkeypatch.setattr(services_transcode.s3_input, "open_source", whole_file)
+    fn(*args)
+    assert encodes == ([duration] if segmented else ["whole file"])
+
+
+def test_only_admins_list_everyones_jobs(api):
+    new_job("j1")
+    new_job("j2", user_sub="bob")
+    assert api.get("/api/v1/jobs", params={"all": "true"}).status_code == 403
+
+    app.app.dependency_overrides[app.require_jwt] = lambda: {"sub": "root", "custom:role": "admin"}
+    seen, cursor = [], None
+    while True:
+        page = api.get("/api/v1/users", params={"all": "true", "limit": 1, "start_key": cursor}).json()
+        seen += [item["job_id"] for item in page["items"]]
+        cursor = page["next_key"]
+        if not cursor:
+            break
+    assert sorted(seen) == ["j1", "j2"]
+
+
+def test_listing_cursor_uses_the_tables_own_key_names(api, monkeypatch):
+    # a table keyed by job_id, unlike the fixture's
+    monkeypatch.setenv("DDB_TABLE_NAME", "jobs_by_id")
+    aws_clients.client("dynamodb").create_table(
+        TableName="jobs_by_id", BillingMode="PAY_PER_REQUEST",
+        KeySchema=[{"AttributeName": "job_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": a, "AttributeType": "S"} for a in ("job_id", "user_sub", "created_at")],
+        GlobalSecondaryIndexes=[{
+            "IndexName": app.JOBS_BY_USER_INDEX, "Projection": {"ProjectionType": "ALL"},
+            "KeySchema": [{"AttributeName": "user_sub", "KeyType": "HASH"},
+                          {"AttributeName": "created_at", "KeyType": "RANGE"}]}])
+    for i in range(3):
+        new_job(f"j{i}", created_at=f"2026-01-0{i + 1}T00:00:00Z")
+
+    seen, cursor = [], None
+    while True:
+        page = api.get("/api/v1/jobs", params={"limit": 2, "cursor": cursor}).json()
+        seen += [item["job_id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == ["j2", "j1", "j0"]
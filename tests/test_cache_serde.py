@@ -0,0 +1,61 @@
+import os
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+import cache_mem
+import cache_serde
+
+RECORD = {
+    "job_id": "a",
+    "progress": Decimal("42.5"),
+    "size": Decimal(10 ** 20),
+    "presets": {"360p", "720p"},
+    "created_at": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+    "day": date(2024, 5, 1),
+    "nested": [{"n": Decimal("0.1")}],
+}
+
+
+def test_msgpack_round_trips_dynamodb_types():
+    pytest.importorskip("msgpack")
+    codec = cache_serde._codecs["msgpack"]
+    assert codec.loads(codec.dumps(RECORD)) == RECORD
+
+
+def test_json_flattens_dynamodb_types():
+    codec = cache_serde._codecs["json"]
+    out = codec.loads(codec.dumps(RECORD))
+    assert out["progress"] == 42.5 and out["size"] == 10 ** 20
+    assert out["presets"] == ["360p", "720p"]
+    assert out["created_at"] == "2024-05-01T12:30:00+00:00"
+
+
+def test_compresses_at_threshold(monkeypatch):
+    monkeypatch.setattr(cache_serde, "CACHE_COMPRESS_MIN", 64)
+    small, big = b"a" * 63, b"a" * 64
+    assert cache_serde.compress("m", small) == ("m", small)
+    tag, body = cache_serde.compress("m", big)
+    assert tag == "mz" and len(body) < len(big)
+    assert cache_serde.decompress(tag, body) == ("m", big)
+
+
+def test_incompressible_payload_stored_as_is(monkeypatch):
+    monkeypatch.setattr(cache_serde, "CACHE_COMPRESS_MIN", 64)
+    raw = os.urandom(4096)
+    assert cache_serde.compress("m", raw) == ("m", raw)
+
+
+def test_compression_disabled(monkeypatch):
+    monkeypatch.setattr(cache_serde, "CACHE_COMPRESS_MIN", 0)
+    assert cache_serde.compress("j", b"a" * 10000) == ("j", b"a" * 10000)
+
+
+def test_round_trip_through_cache(memcache, monkeypatch):
+    pytest.importorskip("msgpack")
+    monkeypatch.setattr(cache_serde, "CACHE_COMPRESS_MIN", 64)
+    value = {**RECORD, "logs": "frame= 1 fps=0.0 q=0.0\n" * 200}
+    assert cache_mem.cache_set("job:a", value)
+    cache_mem._l1.discard("job:a")  # read back from memcached, not L1
+    assert cache_mem.cache_get("job:a") == value
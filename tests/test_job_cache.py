@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+import pytest
+
+import job_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_counters(monkeypatch):
+    monkeypatch.setattr(job_cache, "_counters", dict.fromkeys(job_cache._counters, 0))
+
+
+class Table:
+    """A DynamoDB stand-in that counts reads."""
+
+    def __init__(self, **items):
+        self.items = items
+        self.reads = 0
+
+    def loader(self, job_id):
+        def load():
+            self.reads += 1
+            return self.items.get(job_id)
+        return load
+
+
+def test_hit_after_fill(memcache):
+    db = Table(a={"job_id": "a", "status": "processing", "progress": Decimal(3)})
+    assert job_cache.get("a", db.loader("a")) == db.items["a"]
+    assert job_cache.get("a", db.loader("a")) == db.items["a"]
+    assert db.reads == 1
+    assert job_cache.stats()["hits"] == 1
+
+
+def test_missing_job_is_negatively_cached(memcache, clock):
+    db = Table()
+    assert job_cache.get("nope", db.loader("nope")) is None
+    assert job_cache.get("nope", db.loader("nope")) is None
+    assert db.reads == 1
+    assert job_cache.stats()["negative_hits"] == 1
+
+    clock.advance(job_cache.JOB_CACHE_NEGATIVE_TTL + 1)
+    db.items["nope"] = {"job_id": "nope", "status": "created"}
+    assert job_cache.get("nope", db.loader("nope")) == db.items["nope"]
+    assert db.reads == 2
+
+
+def test_invalidate_holds_off_fills(memcache, clock):
+    db = Table(a={"job_id": "a", "status": "processing"})
+    job_cache.get("a", db.loader("a"))
+
+    job_cache.invalidate("a")
+    db.items["a"] = {"job_id": "a", "status": "done"}
+    # during the hold-off every read goes to the table and nothing is cached
+    assert job_cache.get("a", db.loader("a"))["status"] == "done"
+    assert job_cache.get("a", db.loader("a"))["status"] == "done"
+    assert db.reads == 3
+    assert job_cache.stats()["fills"] == 1
+
+    clock.advance(job_cache.JOB_CACHE_HOLDOFF + 1)
+    job_cache.get("a", db.loader("a"))
+    assert job_cache.get("a", db.loader("a"))["status"] == "done"
+    assert db.reads == 4
+
+
+def test_stale_fill_loses_to_invalidate(memcache, clock):
+    db = Table(a={"job_id": "a", "status": "processing"})
+
+    def racing_load():
+        # the reader loaded the old record; the update lands before its fill
+        old = dict(db.items["a"])
+        db.items["a"] = {"job_id": "a", "status": "done"}
+        job_cache.invalidate("a")
+        return old
+
+    assert job_cache.get("a", racing_load)["status"] == "processing"
+    clock.advance(job_cache.JOB_CACHE_HOLDOFF + 1)
+    assert job_cache.get("a", db.loader("a"))["status"] == "done"
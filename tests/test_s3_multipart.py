@@ -0,0 +1,32 @@
+import pytest
+
+from s3_multipart import MAX_OBJECT_SIZE, MAX_PARTS, PART_SIZE, plan_parts
+
+MiB = 1024 * 1024
+
+
+def test_small_object_is_one_part():
+    assert plan_parts(1) == (PART_SIZE, 1)
+    assert plan_parts(PART_SIZE) == (PART_SIZE, 1)
+    assert plan_parts(PART_SIZE + 1) == (PART_SIZE, 2)
+
+
+def test_part_size_never_below_5_mib():
+    assert plan_parts(100 * MiB, part_size=1 * MiB) == (5 * MiB, 20)
+
+
+def test_part_count_capped_at_max_parts():
+    assert plan_parts(5 * MiB * MAX_PARTS, part_size=5 * MiB) == (5 * MiB, MAX_PARTS)
+    part_size, count = plan_parts(5 * MiB * MAX_PARTS + 1, part_size=5 * MiB)
+    assert count == MAX_PARTS and part_size * count >= 5 * MiB * MAX_PARTS + 1
+
+
+def test_largest_object_fits():
+    part_size, count = plan_parts(MAX_OBJECT_SIZE)
+    assert count <= MAX_PARTS and part_size * count >= MAX_OBJECT_SIZE
+
+
+@pytest.mark.parametrize("size", [0, -1, MAX_OBJECT_SIZE + 1])
+def test_rejects_out_of_range_sizes(size):
+    with pytest.raises(ValueError):
+        plan_parts(size)
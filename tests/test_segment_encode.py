@@ -0,0 +1,41 @@
+import subprocess
+
+import segment_encode
+
+
+def fake_ffprobe(monkeypatch, stdout="", error=None):
+    calls = []
+
+    def run(cmd, **kwargs):
+        calls.append(cmd)
+        if error:
+            raise error
+        return subprocess.CompletedProcess(cmd, 0, stdout=stdout)
+    monkeypatch.setattr(segment_encode.subprocess, "run", run)
+    return calls
+
+
+def test_short_source_is_one_chunk(monkeypatch):
+    calls = fake_ffprobe(monkeypatch)
+    assert segment_encode.keyframe_cuts("in.mp4", 50.0, seconds=60) == [0.0, 50.0]
+    assert calls == []
+
+
+def test_cuts_at_keyframes_near_targets(monkeypatch):
+    calls = fake_ffprobe(monkeypatch, "59.960000,K_\n60.000000,__\n120.040000,K_\n120.080000,__\n180.000000,K_\n")
+    # 180 is dropped: it would leave a 20s tail, under half a chunk
+    assert segment_encode.keyframe_cuts("in.mp4", 200.0, seconds=60) == [0.0, 59.96, 120.04, 200.0]
+    assert "60.000%+#5,120.000%+#5,180.000%+#5" in calls[0]
+
+
+def test_all_intra_cuts_stay_half_a_chunk_apart(monkeypatch):
+    packets = "".join(f"{t / 10:.6f},K_\n" for t in range(0, 2400))
+    fake_ffprobe(monkeypatch, packets)
+    cuts = segment_encode.keyframe_cuts("in.mp4", 240.0, seconds=60)
+    assert cuts[0] == 0.0 and cuts[-1] == 240.0
+    assert all(b - a >= 30 for a, b in zip(cuts, cuts[1:]))
+
+
+def test_probe_failure_is_one_chunk(monkeypatch):
+    fake_ffprobe(monkeypatch, error=subprocess.TimeoutExpired("ffprobe", 120))
+    assert segment_encode.keyframe_cuts("in.mp4", 600.0, seconds=60) == [0.0, 600.0]
@@ -0,0 +1,152 @@
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+
+import transcode_scheduler
+from transcode_scheduler import PRIORITY_NORMAL, QueueFull, TranscodeScheduler
+
+
+class FakePool:
+    """Records what the scheduler starts; tests finish jobs by hand."""
+
+    def __init__(self):
+        self.started = []  # (tag, future)
+
+    def submit(self, fn, *args):
+        f = Future()
+        self.started.append((args[0], f))
+        return f
+
+    def finish(self, tag):
+        dict(self.started)[tag].set_result(tag)
+
+    def tags(self):
+        return [tag for tag, _ in self.started]
+
+
+def scheduler(workers=1, max_queue=16, max_user_queue=16, cores=1):
+    s = TranscodeScheduler(workers, max_queue, max_user_queue, cores=cores)
+    pool = FakePool()
+    s._executor = lambda: pool
+    return s, pool
+
+
+def submit(s, tag, user, threads=1):
+    return s.submit(lambda tag: tag, tag, user=user, cost=1.0, priority=PRIORITY_NORMAL, threads=threads)[0]
+
+
+def test_users_share_workers_fairly():
+    s, pool = scheduler()
+    for i in range(4):
+        submit(s, f"a{i}", "alice")
+    for i in range(2):
+        submit(s, f"b{i}", "bob")
+    for _ in range(6):
+        pool.finish(pool.tags()[-1])
+    # alice queued first and more, but bob's jobs interleave with hers
+    assert pool.tags() == ["a0", "b0", "a1", "b1", "a2", "a3"]
+
+
+def test_idle_user_doesnt_bank_credit():
+    s, pool = scheduler()
+    submit(s, "a0", "alice")
+    for i in range(1, 4):
+        submit(s, f"a{i}", "alice")
+    pool.finish("a0")
+    pool.finish("a1")
+    # bob arrives late: he starts next, but doesn't then run back-to-back
+    for i in range(3):
+        submit(s, f"b{i}", "bob")
+    for _ in range(5):
+        pool.finish(pool.tags()[-1])
+    assert pool.tags() == ["a0", "a1", "a2", "b0", "a3", "b1", "b2"]
+
+
+def test_per_user_cap_is_429_with_retry_after(monkeypatch):
+    s, pool = scheduler(max_user_queue=2)
+    monkeypatch.setattr(transcode_scheduler, "scheduler", s)
+    for i in range(3):
+        transcode_scheduler.admit(lambda tag: tag, f"a{i}", user="alice")  # one running, two queued
+    with pytest.raises(HTTPException) as e:
+        transcode_scheduler.admit(lambda tag: tag, "a3", user="alice")
+    assert e.value.status_code == 429
+    assert e.value.headers["Retry-After"] == str(s._retry_after_for(2))
+    transcode_scheduler.admit(lambda tag: tag, "b0", user="bob")  # other users still get in
+
+
+def test_total_queue_cap():
+    s, _ = scheduler(max_queue=2)
+    for i in range(3):
+        submit(s, f"j{i}", f"u{i}")
+    with pytest.raises(QueueFull):
+        submit(s, "j3", "u3")
+
+
+def test_duplicate_key_shares_future():
+    s, pool = scheduler()
+    f1, shared1 = s.submit(lambda tag: tag, "a", key="k", user="alice")
+    f2, shared2 = s.submit(lambda tag: tag, "b", key="k", user="bob")
+    assert (shared1, shared2) == (False, True) and f1 is f2
+    assert pool.tags() == ["a"]
+
+
+def test_narrow_jobs_backfill_past_a_wide_one():
+    s, pool = scheduler(workers=4, cores=4)
+    submit(s, "a", "alice", threads=2)
+    submit(s, "wide", "bob", threads=4)
+    submit(s, "n", "carol", threads=1)
+    assert pool.tags() == ["a", "n"]
+
+
+def test_wide_job_reserves_cores_after_backfill_wait(monkeypatch, clock):
+    monkeypatch.setattr(transcode_scheduler, "time", clock)
+    s, pool = scheduler(workers=4, cores=4)
+    submit(s, "a", "alice", threads=2)
+    submit(s, "wide", "bob", threads=4)
+    submit(s, "n0", "carol", threads=1)
+    clock.advance(transcode_scheduler.TRANSCODE_BACKFILL_WAIT)
+    submit(s, "n1", "dave", threads=1)
+    assert pool.tags() == ["a", "n0"]
+    pool.finish("a")
+    pool.finish("n0")
+    assert pool.tags()[2] == "wide"
+
+
+def test_task_module_imports_without_the_api():
+    # spawned workers import the task's module to unpickle it; that must not build the app
+    probe = "import sys, services_transcode; print(sorted({'app', 'dotenv'} & set(sys.modules)))"
+    out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert out.stdout.strip() == "[]", out.stderr
+
+
+def test_stored_duration_is_used_without_probing(monkeypatch):
+    monkeypatch.setattr(transcode_scheduler, "probe_source", lambda url: pytest.fail("probed"))
+    item = {"upload_key": "uploads/j/in.mp4", "source_duration": Decimal("900.5")}
+    assert transcode_scheduler.source_duration("j", item, lambda key: key, lambda job_id, **a: None) == 900.5
+
+
+def test_missing_duration_is_probed_once_and_stored(monkeypatch):
+    probes, stored = [], {}
+    release = threading.Event()
+
+    def probe(url):
+        probes.append(url)
+        release.wait(5)
+        return {"duration": 900.0, "height": 720}
+    monkeypatch.setattr(transcode_scheduler, "probe_source", probe)
+    update = lambda job_id, **attrs: stored.update(attrs)
+    # the upload-time probe is still running when the transcode request arrives
+    upload_probe = transcode_scheduler.probe_upload_later("j", "url:uploads/j/in.mp4", update)
+    threading.Timer(0.1, release.set).start()
+    item = {"upload_key": "uploads/j/in.mp4"}
+    assert transcode_scheduler.source_duration("j", item, lambda key: f"url:{key}", update) == 900.0
+    upload_probe.result()
+    assert probes == ["url:uploads/j/in.mp4"]
+    assert stored == {"source_duration": Decimal("900.0"), "source_height": 720}
@@ -0,0 +1,52 @@
+"""
+Content-addressed output cache for transcodes.
+
+(source content hash, preset, encoder settings) -> existing outputs/... key.
+The mapping lives in S3 next to the outputs (cache/outputs/{digest}) so every
+API instance sees the same cache. Concurrent identical requests are coalesced
+by the scheduler (transcode_scheduler.submit with key=digest).
+"""
+import json
+import hashlib
+from typing import Optional
+
+from botocore.exceptions import ClientError
+from ffmpeg_utils import AUDIO_ARGS, scale_filter, video_args
+
+CACHE_PREFIX = "cache/outputs/"
+
+def source_hash(s3, bucket: str, key: str) -> str:
+    """
+    Content hash of the source object without downloading it. The S3 ETag is
+    the MD5 of the body for single-part uploads (md5-of-parts for multipart),
+    so the same upload always hashes the same.
+    """
+    head = s3.head_object(Bucket=bucket, Key=key)
+    etag = head["ETag"].strip('"')
+    return f"{etag}:{head['ContentLength']}"
+
+def cache_key(src_hash: str, preset: str, encoder_args: Optional[list] = None) -> str:
+    settings = {
+        "src": src_hash,
+        "vf": scale_filter(preset),
+        "args": encoder_args if encoder_args is not None else video_args(preset) + AUDIO_ARGS,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+def lookup(s3, bucket: str, digest: str) -> Optional[str]:
+    """Return the cached output key, or None if missing or the artifact is gone."""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=CACHE_PREFIX + digest)
+        output_key = json.loads(obj["Body"].read())["output_key"]
+        s3.head_object(Bucket=bucket, Key=output_key)
+        return output_key
+    except ClientError:
+        return None
+
+def remember(s3, bucket: str, digest: str, output_key: str):
+    s3.put_object(
+        Bucket=bucket,
+        Key=CACHE_PREFIX + digest,
+        Body=json.dumps({"output_key": output_key}).encode(),
+        ContentType="application/json",
+    )
@@ -0,0 +1,336 @@
+"""
+Bounded, fair transcode scheduler.
+
+Jobs run in a process pool of up to TRANSCODE_CONCURRENCY workers, packed
+onto TRANSCODE_CORES: each job reserves the encoder threads its outputs
+use (ffmpeg_utils.encoder_threads; all cores for a segmented long source)
+and starts only when that many are free. Waiting jobs are held here, not
+in the pool, so the next one to start can be chosen:
+
+1. priority class first: interactive (cheap jobs, e.g. short clips and
+   previews) before normal before bulk (long / 1080p / ladder encodes).
+   A job gains one class per TRANSCODE_PRIORITY_AGING seconds waited so
+   bulk work is never starved outright;
+2. within a class, per-user fair share: start-time fair queuing on the
+   estimated job cost, so a user who floods the queue gets their share
+   of the workers and everyone else's jobs keep flowing.
+
+A job that doesn't fit in the free cores doesn't hold up the rest: the
+next one in that order that does fit starts instead (backfill). That is
+bounded: once a skipped job has waited TRANSCODE_BACKFILL_WAIT seconds,
+nothing else starts ahead of it, so the running jobs drain and it gets
+its cores.
+
+Cost is source duration x output pixels relative to 480p (estimate_cost).
+The duration is the one stored on the job record (source_duration), probed
+once when the upload completed (probe_upload_later). A job admitted before
+that (a presigned PUT, or a probe still running) gets it from
+source_duration: it waits up to TRANSCODE_PROBE_WAIT for the probe in
+flight, or starts one, and the result is stored for every later admission.
+Only if ffprobe can't tell in time is DEFAULT_DURATION assumed; such a job
+is not segmented, so the cores reserved always match what the task uses.
+At most TRANSCODE_QUEUE_MAX jobs wait in total and TRANSCODE_USER_QUEUE_MAX
+per user; beyond that callers get 429 + Retry-After.
+
+Env knobs:
+  TRANSCODE_CORES=<cpu count>
+  TRANSCODE_CONCURRENCY=<cores>         # most jobs at once
+  TRANSCODE_QUEUE_MAX=16
+  TRANSCODE_USER_QUEUE_MAX=QUEUE_MAX/4
+  TRANSCODE_PRIORITY_AGING=120          # seconds
+  TRANSCODE_BACKFILL_WAIT=60            # seconds a wide job can be passed over
+  TRANSCODE_PROBE_WAIT=10               # seconds admission waits for a missing source duration
+  TRANSCODE_INTERACTIVE_MAX_COST=120    # cost at or below this is interactive
+  TRANSCODE_BULK_MIN_COST=3600          # cost at or above this is bulk
+
+Jobs submitted with a dedupe key share the in-flight future of an identical
+job, so duplicate requests coalesce onto one encode.
+"""
+import os
+import time
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+import job_events
+import segment_encode
+from ffmpeg_utils import PRESETS, encoder_threads, probe_source
+
+TRANSCODE_CORES = int(os.getenv("TRANSCODE_CORES", "0")) or (os.cpu_count() or 1)
+TRANSCODE_CONCURRENCY = int(os.getenv("TRANSCODE_CONCURRENCY", "0")) or TRANSCODE_CORES
+TRANSCODE_QUEUE_MAX = int(os.getenv("TRANSCODE_QUEUE_MAX", "16"))
+TRANSCODE_USER_QUEUE_MAX = int(os.getenv("TRANSCODE_USER_QUEUE_MAX", "0")) or max(1, TRANSCODE_QUEUE_MAX // 4)
+TRANSCODE_RETRY_AFTER = int(os.getenv("TRANSCODE_RETRY_AFTER", "30"))  # seconds per queued "round"
+TRANSCODE_PRIORITY_AGING = float(os.getenv("TRANSCODE_PRIORITY_AGING", "120"))  # seconds per class of boost
+TRANSCODE_BACKFILL_WAIT = float(os.getenv("TRANSCODE_BACKFILL_WAIT", "60"))
+TRANSCODE_PROBE_WAIT = float(os.getenv("TRANSCODE_PROBE_WAIT", "10"))
+
+PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BULK = 0, 1, 2
+INTERACTIVE_MAX_COST = float(os.getenv("TRANSCODE_INTERACTIVE_MAX_COST", "120"))   # ~2 min of 480p
+BULK_MIN_COST = float(os.getenv("TRANSCODE_BULK_MIN_COST", "3600"))                # ~1 h of 480p
+DEFAULT_DURATION = 300.0  # seconds assumed when the job record has no source_duration
+
+def estimate_cost(duration: Optional[float], presets: Iterable[str]) -> float:
+    """Relative encode cost: source seconds x output pixels vs 480p, summed over renditions."""
+    return (duration or DEFAULT_DURATION) * sum((PRESETS.get(p, 480) / 480) ** 2 for p in presets)
+
+def stored_duration(item: Dict) -> Optional[float]:
+    """The source duration recorded on a job record, if it has been probed."""
+    d = item.get("source_duration")
+    return float(d) if d else None
+
+def source_estimate(duration: Optional[float], presets: List[str]) -> Dict:
+    """admit() cost and threads for a source of this (stored) duration."""
+    threads = encoder_threads(presets)
+    if len(presets) == 1 and segment_encode.worth_segmenting(duration):
+        threads = TRANSCODE_CORES  # encode_segmented fans out over every core itself
+    return {"cost": estimate_cost(duration, presets), "threads": threads}
+
+_probe_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="source-probe")
+_probes: Dict[str, Future] = {}  # job_id -> probe in flight
+_probes_lock = threading.Lock()
+
+def probe_upload(job_id: str, src_url: str, update: Callable) -> Dict:
+    """ffprobe a finished upload once and store source_duration / source_height via update(job_id, **attrs)."""
+    meta = probe_source(src_url)
+    attrs = {}
+    if meta["duration"]:
+        attrs["source_duration"] = Decimal(str(round(meta["duration"], 3)))
+    if meta["height"]:
+        attrs["source_height"] = meta["height"]
+    if attrs:
+        try:
+            update(job_id, **attrs)
+        except Exception:
+            pass  # admission falls back to DEFAULT_DURATION
+    return meta
+
+def probe_upload_later(job_id: str, src_url: str, update: Callable) -> Future:
+    """probe_upload off the request thread; a job already being probed shares that probe."""
+    with _probes_lock:
+        fut = _probes.get(job_id)
+        started = fut is None
+        if started:
+            fut = _probes[job_id] = _probe_pool.submit(probe_upload, job_id, src_url, update)
+    if started:
+        fut.add_done_callback(lambda f: _forget_probe(job_id, f))
+    return fut
+
+def _forget_probe(job_id: str, fut: Future):
+    with _probes_lock:
+        if _probes.get(job_id) is fut:
+            del _probes[job_id]
+
+def source_duration(job_id: str, item: Dict, presign: Callable[[str], str], update: Callable) -> Optional[float]:
+    """
+    The duration to admit a job with: the stored one, else the upload probe's
+    (joining the one in flight or starting it, for up to TRANSCODE_PROBE_WAIT
+    seconds). None if there's no upload to probe or ffprobe can't tell in time.
+    """
+    duration = stored_duration(item)
+    if duration is not None or not item.get("upload_key"):
+        return duration
+    try:
+        return probe_upload_later(job_id, presign(item["upload_key"]), update).result(TRANSCODE_PROBE_WAIT)["duration"]
+    except Exception:
+        return None
+
+def priority_for(cost: float) -> int:
+    if cost <= INTERACTIVE_MAX_COST:
+        return PRIORITY_INTERACTIVE
+    return PRIORITY_BULK if cost >= BULK_MIN_COST else PRIORITY_NORMAL
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"transcode queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class _Job:
+    __slots__ = ("fn", "args", "key", "user", "cost", "priority", "threads", "enqueued", "skipped", "future")
+
+    def __init__(self, fn, args, key, user, cost, priority, threads):
+        self.fn, self.args, self.key = fn, args, key
+        self.user, self.cost, self.priority, self.threads = user, cost, priority, threads
+        self.enqueued = time.monotonic()
+        self.skipped: Optional[float] = None  # when backfill first passed it over
+        self.future: Future = Future()
+
+class TranscodeScheduler:
+    def __init__(self, workers: int, max_queue: int, max_user_queue: int = TRANSCODE_USER_QUEUE_MAX,
+                 cores: int = TRANSCODE_CORES):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_user_queue = max_user_queue
+        self.cores = cores
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._running = 0
+        self._cores_used = 0
+        self._queued: Dict[int, Dict[str, Deque[_Job]]] = {}  # priority -> user -> FIFO of that user's jobs
+        self._queued_count = 0
+        self._user_queued: Dict[str, int] = {}
+        self._vtime: Dict[str, float] = {}  # user -> virtual finish time of their last started job
+        self._vclock = 0.0                  # virtual start time of the last job started
+        self._inflight: Dict[str, Future] = {}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # spawn, not fork: the API process holds threads and boto3 connection pools
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=job_events.init_worker,
+                                             initargs=(job_events.worker_queue(),))
+        return self._pool
+
+    def submit(self, fn: Callable, *args, key: Optional[str] = None, user: str = "",
+               cost: float = 1.0, priority: Optional[int] = None, threads: int = 1) -> Tuple[Future, bool]:
+        """
+        Returns (future, shared). shared=True means an identical job was
+        already in flight and its future was returned instead.
+        """
+        with self._lock:
+            if key and key in self._inflight:
+                return self._inflight[key], True
+            if self._queued_count >= self.max_queue:
+                raise QueueFull(self.retry_after())
+            if self._user_queued.get(user, 0) >= self.max_user_queue:
+                raise QueueFull(self._retry_after_for(self._user_queued[user]))
+
+            job = _Job(fn, args, key, user, cost, priority_for(cost) if priority is None else priority,
+                       max(1, min(threads, self.cores)))
+            if self._user_queued.get(user, 0) == 0:
+                # a returning user doesn't get to spend credit banked while idle
+                self._vtime[user] = max(self._vtime.get(user, 0.0), self._vclock)
+            self._queued.setdefault(job.priority, {}).setdefault(user, deque()).append(job)
+            self._queued_count += 1
+            self._user_queued[user] = self._user_queued.get(user, 0) + 1
+            if key:
+                self._inflight[key] = job.future
+            failed = self._dispatch()
+        self._fail(failed)
+        return job.future, False
+
+    def _order(self, now: float) -> List[_Job]:
+        """
+        Each user's next job, most deserving first: most urgent class (with
+        aging), then the user furthest behind their fair share. Only peeks;
+        _take() removes one.
+        """
+        heads = []
+        for prio, users in self._queued.items():
+            eff = prio - (now - min(q[0].enqueued for q in users.values())) / TRANSCODE_PRIORITY_AGING
+            heads.extend((eff, self._vtime.get(u, 0.0), q[0].enqueued, q[0]) for u, q in users.items())
+        heads.sort(key=lambda h: h[:3])
+        return [h[3] for h in heads]
+
+    def _pick(self, now: float) -> Optional[_Job]:
+        """The first job in fair order that fits the free cores, or None to wait."""
+        for job in self._order(now):
+            if not self._running or self._cores_used + job.threads <= self.cores:
+                return job
+            if job.skipped is None:
+                job.skipped = now
+            elif now - job.skipped >= TRANSCODE_BACKFILL_WAIT:
+                return None  # reserved: let the running jobs drain until it fits
+        return None
+
+    def _take(self, job: _Job):
+        users = self._queued[job.priority]
+        users[job.user].popleft()
+        if not users[job.user]:
+            del users[job.user]
+            if not users:
+                del self._queued[job.priority]
+
+    def _dispatch(self) -> list:
+        """
+        Start queued jobs while workers are free. Caller holds the lock and
+        passes the returned (job, error) pairs for jobs the pool refused to
+        _fail() once it has released it.
+        """
+        failed = []
+        now = time.monotonic()
+        while self._running < self.workers and self._queued_count:
+            job = self._pick(now)
+            if job is None:
+                break
+            self._take(job)
+            self._queued_count -= 1
+            self._user_queued[job.user] -= 1
+            if not self._user_queued[job.user]:
+                del self._user_queued[job.user]
+            self._vclock = self._vtime.get(job.user, 0.0)
+            self._vtime[job.user] = self._vclock + job.cost
+            self._running += 1
+            self._cores_used += job.threads
+            try:
+                pf = self._executor().submit(job.fn, *job.args)
+            except Exception as e:
+                self._running -= 1
+                self._cores_used -= job.threads
+                failed.append((job, e))
+                continue
+            pf.add_done_callback(lambda f, job=job: self._done(job, f))
+        return failed
+
+    def _fail(self, failed: list):
+        for job, e in failed:
+            self._finish(job, None, e)
+
+    def _done(self, job: _Job, pf: Future):
+        with self._lock:
+            self._running -= 1
+            self._cores_used -= job.threads
+            failed = self._dispatch()
+        self._fail(failed)
+        try:
+            self._finish(job, pf.result(), None)
+        except Exception as e:
+            self._finish(job, None, e)
+
+    def _finish(self, job: _Job, result, error: Optional[BaseException]):
+        with self._lock:
+            if job.key and self._inflight.get(job.key) is job.future:
+                del self._inflight[job.key]
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(result)
+
+    def _retry_after_for(self, queued: int) -> int:
+        return TRANSCODE_RETRY_AFTER * (1 + queued // self.workers)
+
+    def retry_after(self) -> int:
+        return self._retry_after_for(self._queued_count)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            by_class = {name: sum(len(q) for q in self._queued.get(prio, {}).values())
+                        for prio, name in ((PRIORITY_INTERACTIVE, "interactive"),
+                                           (PRIORITY_NORMAL, "normal"), (PRIORITY_BULK, "bulk"))}
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "cores": self.cores,
+                "cores_used": self._cores_used,
+                "queued": self._queued_count,
+                "queue_max": self.max_queue,
+                "user_queue_max": self.max_user_queue,
+                "queued_by_priority": by_class,
+                "users_waiting": len(self._user_queued),
+            }
+
+scheduler = TranscodeScheduler(TRANSCODE_CONCURRENCY, TRANSCODE_QUEUE_MAX)
+
+def admit(fn: Callable, *args, key: Optional[str] = None, user: str = "",
+          cost: float = 1.0, priority: Optional[int] = None, threads: int = 1) -> Tuple[Future, bool]:
+    """scheduler.submit() for request handlers: a full queue becomes 429 + Retry-After."""
+    try:
+        return scheduler.submit(fn, *args, key=key, user=user, cost=cost, priority=priority, threads=threads)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail="Transcode queue full, retry later",
+                            headers={"Retry-After": str(e.retry_after)})
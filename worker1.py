@@ -5,44 +5,118 @@ SQS worker for CPU-intensive video transcode jobs.
 Expects env:
   - AWS_REGION=ap-southeast-2
   - SQS_QUEUE_URL=<your SQS queue url>
+  - WORKER_CONCURRENCY=<messages in flight> (default: cores / encoder threads per job)
+  - WORKER_ENCODER_PROFILE=quality|throughput (see ffmpeg_utils.ENCODER_PROFILES)
+  - SQS_VISIBILITY_TIMEOUT=120, SQS_HEARTBEAT_INTERVAL=<timeout / 3>
+  - WORKER_DRAIN_TIMEOUT=90, WORKER_CHECKPOINT_GRACE=60
+  - WORKER_LIFECYCLE_POLL=0 (1: also drain when the ASG marks this instance for termination)
+  - WORKER_LIFECYCLE_HOOK=worker-drain, WORKER_LIFECYCLE_HEARTBEAT=60
+On SIGTERM/SIGINT the worker stops receiving and lets running jobs finish
+for up to WORKER_DRAIN_TIMEOUT seconds. Jobs still running after that are
+interrupted: segmented encodes keep their finished chunks in S3
+(checkpoints/<job_id>/) and resume from them on redelivery. Messages of
+unfinished jobs are made visible again at once rather than after the
+visibility timeout. A second signal skips straight to the interrupt.
+When the drain was started by an ASG termination lifecycle hook (named
+WORKER_LIFECYCLE_HOOK on the worker group), the hook is heartbeated while
+draining and completed with CONTINUE once every message is deleted or
+released, so the instance terminates as soon as it's safe, not at the
+hook's timeout.
 Requires:
   - ffmpeg installed on the machine
   - Instance role or creds with sqs:Receive/Delete/Get*, s3:Get/Put/List
+    (+ autoscaling:DescribeAutoScalingInstances, RecordLifecycleActionHeartbeat,
+    CompleteLifecycleAction with WORKER_LIFECYCLE_POLL=1)
 """
 
 import os
 import json
 import uuid
+import time
+import signal
+import threading
+import urllib.request
 import subprocess
 import traceback
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
 import boto3
+import s3_input
+import s3_output
+import segment_encode
+from ffmpeg_utils import AUDIO_ARGS, encoder_settings, run_with_progress, video_args
 from botocore.exceptions import ClientError, NoCredentialsError, EndpointConnectionError
 
 REGION = os.environ.get("AWS_REGION", "ap-southeast-2")
 QUEUE_URL = os.environ.get("SQS_QUEUE_URL")
+# worker output keeps the crf the worker has always used; "throughput" trades it for smaller files
+WORKER_ENCODER_PROFILE = os.environ.get("WORKER_ENCODER_PROFILE", "quality")
+# messages processed at once, each in its own process
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", "0")) or max(1, (os.cpu_count() or 1) // encoder_settings(None, WORKER_ENCODER_PROFILE)["threads"])
+# short on purpose: a crashed worker's jobs come back within this; live jobs are extended by the heartbeat
+VISIBILITY_TIMEOUT = int(os.environ.get("SQS_VISIBILITY_TIMEOUT", "120"))
+HEARTBEAT_INTERVAL = int(os.environ.get("SQS_HEARTBEAT_INTERVAL", "0")) or max(10, VISIBILITY_TIMEOUT // 3)
+MAX_VISIBILITY = 12 * 3600  # SQS cap on total time a received message can stay invisible
+DRAIN_TIMEOUT = int(os.environ.get("WORKER_DRAIN_TIMEOUT", "90"))
+CHECKPOINT_GRACE = int(os.environ.get("WORKER_CHECKPOINT_GRACE", "60"))
+LIFECYCLE_POLL = os.environ.get("WORKER_LIFECYCLE_POLL", "0") == "1"
+LIFECYCLE_HOOK = os.environ.get("WORKER_LIFECYCLE_HOOK", "worker-drain")
+LIFECYCLE_HEARTBEAT = int(os.environ.get("WORKER_LIFECYCLE_HEARTBEAT", "60"))  # keep below the hook's heartbeat_timeout
+CHECKPOINT_PREFIX = "checkpoints/"
+INTERRUPT_SIGNAL = signal.SIGUSR1  # parent -> pool worker: stop and keep what's done
 
 if not QUEUE_URL:
     raise RuntimeError("SQS_QUEUE_URL is not set")
 
 sqs = boto3.client("sqs", region_name=REGION)
 s3 = boto3.client("s3", region_name=REGION)
+autoscaling = boto3.client("autoscaling", region_name=REGION)
 
-def run_ffmpeg(src_path: str, dst_path: str) -> None:
+# source resolution is kept, so the profile's largest-output settings apply
+VIDEO_ARGS = video_args(None, profile=WORKER_ENCODER_PROFILE)
+
+def run_ffmpeg(src: s3_input.SourceInput, outs: s3_output.OutputSet) -> None:
     """
-    Transcode using ffmpeg. Tweak flags to match your rubric if needed.
+    Transcode using ffmpeg. A streamed source is piped into ffmpeg's stdin;
+    a streamed output is uploaded while it encodes.
     """
     cmd = [
         "ffmpeg",
         "-y",
-        "-i", src_path,
-        "-c:v", "libx264",
-        "-preset", "veryfast",
-        "-crf", "23",
-        "-c:a", "aac",
-        dst_path,
+        "-i", src.arg,
+        *VIDEO_ARGS,
+        *AUDIO_ARGS,
+        *outs.format_args,
+        outs.arg("out"),
     ]
     print(f"[FFMPEG] {' '.join(cmd)}")
-    subprocess.run(cmd, check=True)
+    try:
+        rc, logs = run_with_progress(cmd, src.duration, lambda pct: print(f"[FFMPEG] {pct:.0f}%"),
+                                     stdin=src.feed, sinks=outs.sinks)
+    except BaseException:
+        outs.abort()
+        raise
+    if not outs.finish(rc):
+        raise subprocess.CalledProcessError(rc, cmd, stderr=logs)
+
+def run_ffmpeg_segmented(src_url: str, duration: float, work_dir: str, outs: s3_output.OutputSet,
+                         checkpoint: Optional[segment_encode.SegmentCheckpoint] = None) -> None:
+    """Long sources: encode keyframe-aligned chunks in parallel ffmpeg processes, then concat."""
+    print(f"[FFMPEG] segmented encode of {duration:.0f}s across {segment_encode.workers_for(VIDEO_ARGS)} processes"
+          + (f", {len(checkpoint.saved)} piece(s) checkpointed" if checkpoint and checkpoint.saved else ""))
+    try:
+        rc, logs = segment_encode.encode_segmented(
+            src_url, duration, VIDEO_ARGS, AUDIO_ARGS, work_dir, outs.arg("out"), outs.format_args,
+            lambda pct: print(f"[FFMPEG] {pct:.0f}%"), sinks=outs.sinks, checkpoint=checkpoint)
+    except BaseException:
+        outs.abort()
+        raise
+    if not outs.finish(rc):
+        raise subprocess.CalledProcessError(rc, "segmented ffmpeg", stderr=logs)
+    if checkpoint:
+        checkpoint.clear()
 
 def process_message(msg: dict) -> None:
     """
@@ -69,61 +143,332 @@ def process_message(msg: dict) -> None:
     local_in = f"/tmp/in-{job_id}"
     local_out = f"/tmp/out-{job_id}.{out_fmt}"
 
-    print(f"[{job_id}] Download s3://{in_bkt}/{in_key} -> {local_in}")
-    s3.download_file(in_bkt, in_key, local_in)
-
-    print(f"[{job_id}] Transcoding -> {local_out}")
-    run_ffmpeg(local_in, local_out)
+    src_url = s3.generate_presigned_url("get_object", Params={"Bucket": in_bkt, "Key": in_key},
+                                        ExpiresIn=segment_encode.SEGMENT_URL_EXPIRES)
+    duration = segment_encode.long_source(src_url)
+    src = None
+    if not duration:
+        src = s3_input.open_source(s3, in_bkt, in_key, local_in)
+        if src.streamed:
+            print(f"[{job_id}] Streaming s3://{in_bkt}/{in_key} into ffmpeg")
+        else:
+            print(f"[{job_id}] Downloaded s3://{in_bkt}/{in_key} -> {local_in} (needs seeking)")
 
     out_key = f"{out_prefix}{os.path.basename(local_out)}"
-    print(f"[{job_id}] Upload {local_out} -> s3://{out_bkt}/{out_key}")
-    s3.upload_file(local_out, out_bkt, out_key)
+    # only MP4 has a pipe-friendly (fragmented) form here; other formats upload after the encode
+    outs = s3_output.OutputSet(s3, out_bkt, {"out": (local_out, out_key)},
+                               stream=s3_output.STREAM_OUTPUT and out_fmt == "mp4")
+    print(f"[{job_id}] Transcoding -> s3://{out_bkt}/{out_key}" + ("" if outs.streamed else f" via {local_out}"))
+    if duration:
+        checkpoint = None
+        if segment_encode.SEGMENT_CHECKPOINT and body.get("job_id"):
+            checkpoint = segment_encode.SegmentCheckpoint(s3, out_bkt, f"{CHECKPOINT_PREFIX}{job_id}")
+        run_ffmpeg_segmented(src_url, duration, f"/tmp/seg-{job_id}", outs, checkpoint)
+    else:
+        run_ffmpeg(src, outs)
 
     # best effort cleanup
-    try:
-        os.remove(local_in)
-        os.remove(local_out)
-    except OSError:
-        pass
+    for path in (local_in, local_out):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
     print(f"[{job_id}] DONE -> s3://{out_bkt}/{out_key}")
 
+class Interrupted(Exception):
+    """Raised in a pool worker when the parent drains it (INTERRUPT_SIGNAL)."""
+
+_busy = False  # set while this pool worker runs a job
+
+def _interrupt(signum, frame):
+    # an idle worker must survive: its death would break the pool under the jobs still checkpointing
+    if _busy:
+        raise Interrupted()
+
+def init_child() -> None:
+    # shutdown signals are for the parent (they often hit the whole process group);
+    # it decides when running jobs are interrupted
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(INTERRUPT_SIGNAL, _interrupt)
+
+def run_one(msg: dict) -> bool:
+    """process_message in a pool worker; True means the message can be deleted."""
+    global _busy
+    _busy = True
+    try:
+        process_message(msg)
+        return True
+    except Interrupted:
+        print("[DRAIN] job interrupted; finished segments are checkpointed")
+    except subprocess.CalledProcessError as e:
+        print(f"[FFMPEG ERROR] returncode={e.returncode}")
+        print(getattr(e, 'stderr', ''))
+        print(traceback.format_exc())
+        # do NOT delete -> message will be retried or sent to DLQ
+    except (ClientError, NoCredentialsError) as e:
+        print(f"[AWS ERROR] {e}")
+    except Exception as e:
+        print(f"[UNKNOWN ERROR] {e}")
+        print(traceback.format_exc())
+    finally:
+        _busy = False
+    return False
+
+def delete_batch(receipts: List[str]) -> None:
+    """delete_message_batch in chunks of 10 (the SQS limit); failures are logged and retried by SQS."""
+    for i in range(0, len(receipts), 10):
+        chunk = receipts[i:i + 10]
+        try:
+            resp = sqs.delete_message_batch(
+                QueueUrl=QUEUE_URL,
+                Entries=[{"Id": str(n), "ReceiptHandle": r} for n, r in enumerate(chunk)],
+            )
+            for f in resp.get("Failed", []):
+                print(f"[SQS ERR] delete failed id={f['Id']}: {f.get('Code')} {f.get('Message', '')}")
+        except (EndpointConnectionError, ClientError) as e:
+            print(f"[SQS ERR] delete_message_batch: {e}")
+
+def change_visibility(receipts: List[str], timeout: int) -> List[str]:
+    """change_message_visibility_batch in chunks of 10; returns the receipts SQS rejected."""
+    failed = []
+    for i in range(0, len(receipts), 10):
+        chunk = receipts[i:i + 10]
+        resp = sqs.change_message_visibility_batch(
+            QueueUrl=QUEUE_URL,
+            Entries=[{"Id": str(n), "ReceiptHandle": r, "VisibilityTimeout": timeout}
+                     for n, r in enumerate(chunk)],
+        )
+        for f in resp.get("Failed", []):
+            print(f"[SQS ERR] visibility change failed: {f.get('Code')} {f.get('Message', '')}")
+            failed.append(chunk[int(f["Id"])])
+    return failed
+
+def release_batch(receipts: List[str]) -> None:
+    """Make messages visible again now, so another worker picks them up without waiting out the timeout."""
+    try:
+        change_visibility(receipts, 0)
+    except (EndpointConnectionError, ClientError) as e:
+        print(f"[SQS ERR] release: {e}")
+
+class VisibilityHeartbeat:
+    """
+    Keeps messages of running jobs invisible: every HEARTBEAT_INTERVAL it
+    pushes their visibility timeout VISIBILITY_TIMEOUT seconds out with
+    change_message_visibility_batch. If this process dies the beats stop
+    and the messages reappear within VISIBILITY_TIMEOUT, instead of a
+    long fixed timeout or a duplicate encode of a still-running job.
+    """
+    def __init__(self, interval: int = HEARTBEAT_INTERVAL, timeout: int = VISIBILITY_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self._receipts: Dict[str, float] = {}   # receipt handle -> received at
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="sqs-heartbeat", daemon=True).start()
+
+    def track(self, receipt: str) -> None:
+        with self._lock:
+            self._receipts[receipt] = time.time()
+
+    def release(self, receipt: str) -> None:
+        with self._lock:
+            self._receipts.pop(receipt, None)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.beat()
+            except Exception as e:
+                print(f"[SQS ERR] heartbeat: {e}")
+
+    def beat(self) -> None:
+        now = time.time()
+        with self._lock:
+            expired = [r for r, t in self._receipts.items() if now - t + self.timeout > MAX_VISIBILITY]
+            for r in expired:
+                del self._receipts[r]
+            receipts = list(self._receipts)
+        if expired:
+            print(f"[SQS] {len(expired)} job(s) hit the 12h visibility limit; SQS will redeliver them")
+        for r in change_visibility(receipts, self.timeout):
+            self.release(r)
+
+class Drain:
+    """
+    Shutdown requests: SIGTERM/SIGINT, or (WORKER_LIFECYCLE_POLL=1) the ASG
+    moving this instance towards Terminated, which with a termination
+    lifecycle hook happens before the OS is told to shut down. In that case
+    the hook is kept alive while draining and completed by complete().
+    """
+    IMDS = "http://169.254.169.254/latest"
+
+    def __init__(self):
+        self.requested = threading.Event()
+        self.hurry = threading.Event()
+        self._lifecycle: Optional[Dict[str, str]] = None  # hook call args once the ASG asked us to go
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        if LIFECYCLE_POLL:
+            threading.Thread(target=self._poll_lifecycle, name="lifecycle-poll", daemon=True).start()
+
+    def _on_signal(self, signum, frame):
+        if self.requested.is_set():
+            self.hurry.set()
+        self.requested.set()
+
+    def _imds(self, path: str) -> str:
+        req = urllib.request.Request(f"{self.IMDS}/api/token", method="PUT",
+                                     headers={"X-aws-ec2-metadata-token-ttl-seconds": "300"})
+        token = urllib.request.urlopen(req, timeout=2).read().decode()
+        req = urllib.request.Request(f"{self.IMDS}/meta-data/{path}", headers={"X-aws-ec2-metadata-token": token})
+        return urllib.request.urlopen(req, timeout=2).read().decode().strip()
+
+    def _poll_lifecycle(self):
+        while not self.requested.is_set():
+            try:
+                if self._imds("autoscaling/target-lifecycle-state") == "Terminated":
+                    print("[DRAIN] instance is scheduled for termination")
+                    self._hook_started()
+                    self.requested.set()
+                    return
+            except OSError:
+                pass
+            time.sleep(5)
+
+    def _hook_started(self):
+        try:
+            instance_id = self._imds("instance-id")
+            asg = autoscaling.describe_auto_scaling_instances(InstanceIds=[instance_id])["AutoScalingInstances"]
+            self._lifecycle = {"AutoScalingGroupName": asg[0]["AutoScalingGroupName"],
+                               "LifecycleHookName": LIFECYCLE_HOOK, "InstanceId": instance_id}
+        except (OSError, ClientError, IndexError) as e:
+            print(f"[DRAIN] can't identify the lifecycle hook, it will time out instead: {e}")
+            return
+        threading.Thread(target=self._hook_heartbeat, name="lifecycle-heartbeat", daemon=True).start()
+
+    def _hook_heartbeat(self):
+        while self._lifecycle is not None:
+            try:
+                autoscaling.record_lifecycle_action_heartbeat(**self._lifecycle)
+            except ClientError as e:
+                print(f"[DRAIN] lifecycle heartbeat: {e}")
+            time.sleep(LIFECYCLE_HEARTBEAT)
+
+    def complete(self):
+        """Let the ASG terminate the instance now (no-op unless a lifecycle hook started the drain)."""
+        hook, self._lifecycle = self._lifecycle, None
+        if hook is None:
+            return
+        try:
+            autoscaling.complete_lifecycle_action(LifecycleActionResult="CONTINUE", **hook)
+            print("[DRAIN] lifecycle action completed")
+        except ClientError as e:
+            print(f"[DRAIN] complete lifecycle action: {e}")
+
+def drain(pool: ProcessPoolExecutor, running: Dict[Future, str], heartbeat: VisibilityHeartbeat,
+          stop: Drain) -> None:
+    """Finish, then interrupt, the running jobs; delete what completed and release the rest."""
+    print(f"[DRAIN] {len(running)} job(s) running; waiting up to {DRAIN_TIMEOUT}s")
+    deadline = time.time() + DRAIN_TIMEOUT
+    while running and not stop.hurry.is_set() and time.time() < deadline:
+        wait(list(running), timeout=1, return_when=FIRST_COMPLETED)
+    if any(not f.done() for f in running):
+        print(f"[DRAIN] interrupting {sum(not f.done() for f in running)} job(s); "
+              f"up to {CHECKPOINT_GRACE}s to checkpoint")
+        for p in multiprocessing.active_children():
+            try:
+                os.kill(p.pid, INTERRUPT_SIGNAL)
+            except OSError:
+                pass
+        wait(list(running), timeout=CHECKPOINT_GRACE)
+
+    finished, unfinished = [], []
+    for fut, receipt in running.items():
+        heartbeat.release(receipt)
+        ok = False
+        if fut.done():
+            try:
+                ok = fut.result()
+            except Exception as e:
+                print(f"[WORKER ERR] {e}")
+        (finished if ok else unfinished).append(receipt)
+    running.clear()
+    if finished:
+        delete_batch(finished)
+    if unfinished:
+        release_batch(unfinished)
+    print(f"[DRAIN] done: {len(finished)} completed, {len(unfinished)} released")
+    pool.shutdown(wait=False, cancel_futures=True)
+    for p in multiprocessing.active_children():
+        p.kill()
+    stop.complete()
+
 def main() -> None:
     print(f"[BOOT] Worker starting in region={REGION}")
     print(f"[BOOT] Queue={QUEUE_URL}")
+    print(f"[BOOT] Concurrency={WORKER_CONCURRENCY}")
+    print(f"[BOOT] Visibility={VISIBILITY_TIMEOUT}s, heartbeat every {HEARTBEAT_INTERVAL}s")
+
+    def new_pool() -> ProcessPoolExecutor:
+        # spawn, not fork: boto3 clients and their connection pools aren't fork-safe
+        return ProcessPoolExecutor(max_workers=WORKER_CONCURRENCY, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_child)
+
+    pool = new_pool()
+    running: Dict[Future, str] = {}   # future -> receipt handle
+    heartbeat = VisibilityHeartbeat()
+    stop = Drain()
+
+    while not stop.requested.is_set():
+        finished = []
+        for fut in [f for f in running if f.done()]:
+            receipt = running.pop(fut)
+            heartbeat.release(receipt)
+            try:
+                if fut.result():
+                    finished.append(receipt)
+            except Exception as e:  # worker process died
+                print(f"[WORKER ERR] {e}")
+        if finished:
+            delete_batch(finished)
+
+        free = WORKER_CONCURRENCY - len(running)
+        if free <= 0:
+            wait(list(running), timeout=5, return_when=FIRST_COMPLETED)
+            continue
+        if stop.requested.is_set():
+            break
 
-    while True:
         try:
             resp = sqs.receive_message(
                 QueueUrl=QUEUE_URL,
-                MaxNumberOfMessages=1,
-                WaitTimeSeconds=20,    # long poll
-                VisibilityTimeout=600  # keep >= worst-case ffmpeg time
+                MaxNumberOfMessages=min(10, free),  # never hold messages we can't start yet
+                WaitTimeSeconds=20 if not running else 5,  # wake up to delete finished jobs promptly
+                VisibilityTimeout=VISIBILITY_TIMEOUT,  # extended by the heartbeat while the job runs
             )
         except (EndpointConnectionError, ClientError) as e:
             print(f"[SQS ERR] {e}")
             continue
 
-        messages = resp.get("Messages", [])
-        if not messages:
-            continue
+        if stop.requested.is_set():
+            # a shutdown arrived during the long poll: hand these straight back
+            release_batch([m["ReceiptHandle"] for m in resp.get("Messages", [])])
+            break
 
-        for m in messages:
-            receipt = m["ReceiptHandle"]
+        for m in resp.get("Messages", []):
             try:
-                process_message(m)
-                # delete only on success
-                sqs.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=receipt)
-            except subprocess.CalledProcessError as e:
-                print(f"[FFMPEG ERROR] returncode={e.returncode}")
-                print(getattr(e, 'stderr', ''))
-                print(traceback.format_exc())
-                # do NOT delete -> message will be retried or sent to DLQ
-            except (ClientError, NoCredentialsError) as e:
-                print(f"[AWS ERROR] {e}")
-            except Exception as e:
-                print(f"[UNKNOWN ERROR] {e}")
-                print(traceback.format_exc())
+                fut = pool.submit(run_one, m)
+            except BrokenProcessPool:
+                # a worker died (e.g. OOM-killed); its messages reappear after the visibility timeout
+                print("[WORKER ERR] process pool broken, restarting it")
+                pool = new_pool()
+                fut = pool.submit(run_one, m)
+            running[fut] = m["ReceiptHandle"]
+            heartbeat.track(m["ReceiptHandle"])
+
+    drain(pool, running, heartbeat, stop)
 
 if __name__ == "__main__":
     main()